@@ -0,0 +1,271 @@
+import bisect
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Imported as a module since app_logging imports this one
+import app_logging
+
+# Address the Prometheus-style /metrics endpoint listens on; port 0 turns it off.
+# The chat app uses HEYGEN_CHAT_METRICS_PORT so both apps can run on one machine.
+METRICS_HOST = os.getenv("HEYGEN_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("HEYGEN_METRICS_PORT", "8603"))
+
+# Upper bounds of the request latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Path segments that hold an ID rather than a route: 8+ characters including a digit
+ID_SEGMENT = re.compile(r"(?=[^/]*\d)[\w.-]{8,}")
+
+def endpoint_name(method, url):
+    """Label of a request for metrics, with IDs taken out of the path
+
+    API calls are labelled by method and route, for example
+    "GET /v2/avatar_group/{id}/avatars"; downloads from other hosts such as
+    the CDN by method and host.
+    """
+    parsed = urlparse(url)
+    if not parsed.path.startswith(("/v1/", "/v2/")):
+        return f"{method.upper()} {parsed.netloc}"
+    path = "/".join(
+        "{id}" if ID_SEGMENT.fullmatch(segment) else segment
+        for segment in parsed.path.split("/")
+    )
+    return f"{method.upper()} {path}"
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    # Past the last bound all that is known is that it was slower
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class EndpointStats:
+    """Counters of one endpoint"""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = {}
+        self.retries = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.in_flight = 0
+        self.rate_limit_wait = 0.0
+
+class ApiMetrics:
+    """Per-endpoint latency, status, retry, byte and in-flight counters of outbound calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _stats(self, endpoint):
+        """Get the counters of an endpoint (caller holds the lock)"""
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats()
+        return stats
+
+    def start(self, endpoint):
+        """Count a call as in flight, returns its start time for finish()"""
+        with self._lock:
+            self._stats(endpoint).in_flight += 1
+        return time.monotonic()
+
+    def finish(self, endpoint, started, status, bytes_out=0, bytes_in=0, transport_retries=0):
+        """Record a finished call; status is the HTTP status code or the exception name"""
+        seconds = time.monotonic() - started
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.in_flight -= 1
+            stats.latency.observe(seconds)
+            stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            if transport_retries:
+                stats.retries["transport"] = stats.retries.get("transport", 0) + transport_retries
+
+    def retry(self, endpoint, reason):
+        """Count a call being sent again"""
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.retries[reason] = stats.retries.get(reason, 0) + 1
+
+    def waited(self, endpoint, seconds):
+        """Add time a call spent waiting for a rate limit token"""
+        with self._lock:
+            self._stats(endpoint).rate_limit_wait += seconds
+
+    def snapshot(self):
+        """Get one summary dict per endpoint, busiest first, for display"""
+        with self._lock:
+            rows = []
+            for endpoint, stats in self._endpoints.items():
+                errors = sum(count for status, count in stats.statuses.items() if not status.startswith(("2", "3")))
+                rows.append({
+                    "endpoint": endpoint,
+                    "requests": stats.latency.count,
+                    "errors": errors,
+                    "in_flight": stats.in_flight,
+                    "retries": sum(stats.retries.values()),
+                    "mean_seconds": stats.latency.sum / stats.latency.count if stats.latency.count else None,
+                    "p50_seconds": stats.latency.quantile(0.5),
+                    "p95_seconds": stats.latency.quantile(0.95),
+                    "total_seconds": stats.latency.sum,
+                    "rate_limit_wait_seconds": stats.rate_limit_wait,
+                    "bytes_out": stats.bytes_out,
+                    "bytes_in": stats.bytes_in,
+                    "statuses": dict(stats.statuses)
+                })
+        return sorted(rows, key=lambda row: row["total_seconds"], reverse=True)
+
+    def render(self):
+        """Render every counter in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            family("heygen_request_duration_seconds", "histogram", "Time to complete a HeyGen request")
+            for endpoint, stats in endpoints:
+                label = f'endpoint="{escape_label(endpoint)}"'
+                cumulative = 0
+                for bound, count in zip(stats.latency.buckets + (float("inf"),), stats.latency.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'heygen_request_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+                lines.append(f"heygen_request_duration_seconds_sum{{{label}}} {stats.latency.sum:.6f}")
+                lines.append(f"heygen_request_duration_seconds_count{{{label}}} {stats.latency.count}")
+
+            family("heygen_requests_total", "counter", "HeyGen requests by response status or exception")
+            for endpoint, stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'heygen_requests_total{{endpoint="{escape_label(endpoint)}",status="{escape_label(status)}"}} {count}')
+
+            family("heygen_request_retries_total", "counter", "HeyGen requests sent again, by reason")
+            for endpoint, stats in endpoints:
+                for reason, count in sorted(stats.retries.items()):
+                    lines.append(f'heygen_request_retries_total{{endpoint="{escape_label(endpoint)}",reason="{reason}"}} {count}')
+
+            family("heygen_request_bytes_total", "counter", "Request body bytes sent")
+            for endpoint, stats in endpoints:
+                lines.append(f'heygen_request_bytes_total{{endpoint="{escape_label(endpoint)}"}} {stats.bytes_out}')
+
+            family("heygen_response_bytes_total", "counter", "Response bytes received, where the length is known")
+            for endpoint, stats in endpoints:
+                lines.append(f'heygen_response_bytes_total{{endpoint="{escape_label(endpoint)}"}} {stats.bytes_in}')
+
+            family("heygen_requests_in_flight", "gauge", "HeyGen requests waiting for a response")
+            for endpoint, stats in endpoints:
+                lines.append(f'heygen_requests_in_flight{{endpoint="{escape_label(endpoint)}"}} {stats.in_flight}')
+
+            family("heygen_rate_limit_wait_seconds_total", "counter", "Time spent waiting for a rate limit token")
+            for endpoint, stats in endpoints:
+                lines.append(f'heygen_rate_limit_wait_seconds_total{{endpoint="{escape_label(endpoint)}"}} {stats.rate_limit_wait:.6f}')
+
+        return "\n".join(lines) + "\n"
+
+def escape_label(value):
+    """Escape a Prometheus label value"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_metrics = ApiMetrics()
+
+def get_metrics():
+    """Get the metrics shared by every HeyGen call in this process"""
+    return _metrics
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serve the metrics on GET /metrics"""
+
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer:
+    """Background HTTP server exposing the metrics for Prometheus to scrape"""
+
+    def __init__(self, metrics=None, host=None, port=None):
+        handler = type("Handler", (MetricsRequestHandler,), {"metrics": metrics or get_metrics()})
+        self.httpd = ThreadingHTTPServer((host or METRICS_HOST, METRICS_PORT if port is None else port), handler)
+        self.httpd.daemon_threads = True
+        host, port = self.httpd.server_address[:2]
+        self.url = f"http://{host}:{port}/metrics"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+
+def start_metrics_server(host=None, port=None):
+    """Start a MetricsServer, returns None if it is turned off or the port is taken"""
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        return MetricsServer(host=host, port=port)
+    except OSError as e:
+        app_logging.get_logger(__name__).warning("Could not start the metrics server", port=port, error=str(e))
+        return None
+
+def display_rows(snapshot):
+    """Turn snapshot() rows into table rows with readable units"""
+    def milliseconds(seconds):
+        return None if seconds is None else round(seconds * 1000)
+
+    return [
+        {
+            "Endpoint": row["endpoint"],
+            "Requests": row["requests"],
+            "Errors": row["errors"],
+            "In flight": row["in_flight"],
+            "Retries": row["retries"],
+            "p50 ms": milliseconds(row["p50_seconds"]),
+            "p95 ms": milliseconds(row["p95_seconds"]),
+            "Total s": round(row["total_seconds"], 1),
+            "Throttled s": round(row["rate_limit_wait_seconds"], 1),
+            "KB out": round(row["bytes_out"] / 1024, 1),
+            "KB in": round(row["bytes_in"] / 1024, 1),
+            "Statuses": ", ".join(f"{status}: {count}" for status, count in sorted(row["statuses"].items()))
+        }
+        for row in snapshot
+    ]
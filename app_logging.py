@@ -0,0 +1,211 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import api_metrics
+
+# Lowest level written: DEBUG, INFO, WARNING or ERROR. DEBUG adds response
+# bodies to successful calls.
+LOG_LEVEL = os.getenv("HEYGEN_LOG_LEVEL", "INFO").upper()
+
+# "json" for one JSON object per line, "text" for easier reading in a terminal
+LOG_FORMAT = os.getenv("HEYGEN_LOG_FORMAT", "json").lower()
+
+# Longer field values, such as response bodies, are cut to this many characters
+LOG_MAX_FIELD_CHARS = int(os.getenv("HEYGEN_LOG_MAX_FIELD_CHARS", "500"))
+
+# Records waiting to be written; further records are dropped and counted instead
+# of blocking the request thread
+LOG_QUEUE_SIZE = int(os.getenv("HEYGEN_LOG_QUEUE_SIZE", "10000"))
+
+# Routine records from polling endpoints are kept 1 in N per endpoint; the first
+# entry is the default, e.g. "20,GET /v1/video_status.get=50". Warnings are never sampled.
+LOG_SAMPLE_EVERY = os.getenv("HEYGEN_LOG_SAMPLE_EVERY", "20")
+
+# Keyword arguments the logging calls take themselves; any others are fields
+RESERVED_KEYWORDS = ("exc_info", "stack_info", "stacklevel", "extra")
+
+def parse_sample_every(value):
+    """Parse LOG_SAMPLE_EVERY into (default, {endpoint: every})"""
+    default = 1
+    overrides = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        endpoint, _, every = entry.rpartition("=")
+        if endpoint:
+            overrides[endpoint.strip()] = max(1, int(every))
+        else:
+            default = max(1, int(every))
+    return default, overrides
+
+def truncate(value, limit=None):
+    """Cut a field value down to limit characters, keeping numbers and short values as they are"""
+    limit = limit or LOG_MAX_FIELD_CHARS
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if not isinstance(value, str):
+        text = json.dumps(value, default=str, ensure_ascii=False)
+        if len(text) <= limit:
+            return value
+        value = text
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}... [{len(value) - limit} more chars]"
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger taking fields as keyword arguments: log.info("Avatar group created", group_id=group_id)
+
+    Fields are truncated on the calling thread so a queued record never holds
+    a whole response body. Pass sample_key to have routine records sampled.
+    """
+
+    def process(self, msg, kwargs):
+        fields = {key: truncate(kwargs.pop(key)) for key in list(kwargs) if key not in RESERVED_KEYWORDS}
+        sample_key = fields.pop("sample_key", None)
+        kwargs["extra"] = {"fields": fields, "sample_key": sample_key}
+        return msg, kwargs
+
+    def response(self, event, response, sample=False, **fields):
+        """Log an HTTP response
+
+        Successful responses are logged at INFO without their body (unless
+        DEBUG is on), failed ones at WARNING with the body. sample=True marks
+        a polling call, whose INFO records are sampled per endpoint.
+        """
+        ok = response.status_code < 400
+        level = logging.INFO if ok else logging.WARNING
+        if not self.isEnabledFor(level):
+            return
+        endpoint = api_metrics.endpoint_name(response.request.method, response.request.url)
+        fields.update(
+            endpoint=endpoint,
+            status=response.status_code,
+            elapsed_ms=round(response.elapsed.total_seconds() * 1000)
+        )
+        if not ok or self.isEnabledFor(logging.DEBUG):
+            fields["body"] = response.text
+        if sample:
+            fields["sample_key"] = endpoint
+        self.log(level, event, **fields)
+
+class SamplingFilter(logging.Filter):
+    """Keep 1 in N records of each sample_key below WARNING"""
+
+    def __init__(self, default_every, overrides=None):
+        super().__init__()
+        self.default_every = default_every
+        self.overrides = overrides or {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        every = self.overrides.get(key, self.default_every)
+        if every <= 1:
+            return True
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % every:
+            return False
+        record.fields["sampled_1_in"] = every
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records when the queue is full instead of blocking
+
+    The number of dropped records is added to the next record that fits.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread; only the message is resolved here
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        with self._lock:
+            if self.dropped:
+                record.fields = dict(getattr(record, "fields", None) or {}, dropped_before=self.dropped)
+            try:
+                self.queue.put_nowait(record)
+                self.dropped = 0
+            except queue.Full:
+                self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            "thread": record.threadName
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exception"] = truncate(record.exc_text, LOG_MAX_FIELD_CHARS * 4)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """Format a record as a line of text with key=value fields"""
+
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in (getattr(record, "fields", None) or {}).items())
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {record.getMessage()} {fields}".rstrip()
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+_configured = False
+_configure_lock = threading.Lock()
+
+def configure():
+    """Send the "heygen" loggers through a bounded queue to a writer thread, once per process
+
+    Records go to stderr so they stay apart from the CLIs' progress output.
+    """
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(*parse_sample_every(LOG_SAMPLE_EVERY)))
+
+        writer = logging.StreamHandler(sys.stderr)
+        writer.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+        listener = QueueListener(log_queue, writer)
+        listener.start()
+        # Write out what is still queued when the process exits
+        atexit.register(listener.stop)
+
+        logger = logging.getLogger("heygen")
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(handler)
+        logger.propagate = False
+        _configured = True
+
+def get_logger(name):
+    """Get the structured logger of a module"""
+    configure()
+    return StructuredLogger(logging.getLogger(f"heygen.{name}"), {})
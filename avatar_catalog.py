@@ -0,0 +1,352 @@
+import heapq
+import os
+import random
+import threading
+import time
+
+from app_logging import get_logger
+from avatar_search import AvatarSearchIndex
+from fan_out import fan_out
+
+log = get_logger(__name__)
+
+# How long the catalog is trusted before the group list is fetched again (seconds)
+DEFAULT_CATALOG_TTL = float(os.getenv("HEYGEN_CATALOG_TTL", "300"))
+
+# Longest time to wait for a freshly trained group to show its avatars (seconds)
+DEFAULT_GROUP_WAIT_TIMEOUT = float(os.getenv("HEYGEN_GROUP_WAIT_TIMEOUT", "15"))
+
+def group_fingerprint(group):
+    """Fields of a group list entry that change when the group or its membership changes"""
+    return (
+        group.get("created_at", 0),
+        group.get("num_looks"),
+        group.get("train_status"),
+    )
+
+class AvatarCatalog:
+    """Process-wide cache of avatar groups and the avatars inside them
+
+    list_groups() returns (success, groups_or_error) and fetch_group_avatars(group)
+    returns the avatar list of one group or None on failure. When the TTL runs out
+    only the group list is fetched again; avatar lists are refetched for groups that
+    are new, changed or explicitly invalidated.
+
+    Avatar lists are fetched outside the catalog lock with one refresh in
+    flight at a time, so readers keep getting the cached data while it runs.
+    """
+
+    def __init__(self, list_groups, fetch_group_avatars, ttl=None, max_in_flight=None):
+        self.list_groups = list_groups
+        self.fetch_group_avatars = fetch_group_avatars
+        self.ttl = DEFAULT_CATALOG_TTL if ttl is None else ttl
+        self.max_in_flight = max_in_flight
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._list_lock = threading.Lock()
+        self._groups = None
+        self._fingerprints = {}
+        self._group_avatars = {}
+        # Group ID -> monotonic time it was invalidated
+        self._dirty_groups = {}
+        self._loaded_at = None
+        self._invalidated_at = 0.0
+        self._index = None
+        self._index_version = None
+        self._warm_groups = None
+        # Bumped whenever the cached avatars change
+        self.version = 0
+
+    def is_stale(self):
+        """Check whether the cached group list has expired"""
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def invalidate(self, group_id=None):
+        """Expire the catalog, forcing the given group's avatars to be refetched too"""
+        with self._lock:
+            self._loaded_at = None
+            self._invalidated_at = time.monotonic()
+            if group_id:
+                self._dirty_groups[group_id] = self._invalidated_at
+
+    def warm(self, groups):
+        """Offer a group list fetched elsewhere so the next refresh does not download it again"""
+        with self._lock:
+            if self.is_stale():
+                self._warm_groups = ([group for group in groups if group.get("id")], time.monotonic())
+
+    def refresh(self, force=False):
+        """Refresh the catalog if it is stale and return (success, error_message)
+
+        While another thread is refreshing, returns at once if there is cached
+        data to read and waits for the refresh otherwise.
+        """
+        if not force and not self.is_stale():
+            return True, None
+        with self._lock:
+            has_data = self._groups is not None
+        if not self._refresh_lock.acquire(blocking=not has_data):
+            return True, None
+        try:
+            # Another thread may have finished a refresh while this one waited
+            if not force and not self.is_stale():
+                return True, None
+
+            # Use a group list someone else just downloaded if it is still fresh
+            with self._lock:
+                warm_groups, self._warm_groups = self._warm_groups, None
+            if warm_groups is not None and time.monotonic() - warm_groups[1] < self.ttl:
+                success, result = True, warm_groups[0]
+            else:
+                success, result = self.list_groups()
+            if not success:
+                return False, result
+
+            self.load_groups(result)
+            return True, None
+        finally:
+            self._refresh_lock.release()
+
+    def load_groups(self, groups):
+        """Apply a freshly fetched group list, refetching only groups that changed
+
+        The avatar lists are fetched outside the lock and swapped in together.
+        """
+        started = time.monotonic()
+        groups = [group for group in groups if group.get("id")]
+        with self._lock:
+            changed = [group for group in groups if not self._is_cached(group)]
+        log.info("Catalog refresh", groups=len(groups), to_fetch=len(changed))
+
+        results = fan_out(self.fetch_group_avatars, changed, self.max_in_flight)
+
+        with self._lock:
+            for group, group_avatars in zip(changed, results):
+                if group_avatars is None:
+                    # Leave the group out so the next refresh tries again
+                    self._group_avatars.pop(group["id"], None)
+                    self._fingerprints.pop(group["id"], None)
+                    continue
+                self._store_group(group, group_avatars, started)
+
+            # Drop groups that no longer exist
+            current_ids = {group["id"] for group in groups}
+            removed = [group_id for group_id in self._group_avatars if group_id not in current_ids]
+            for group_id in removed:
+                del self._group_avatars[group_id]
+                self._fingerprints.pop(group_id, None)
+
+            previous_ids = [group["id"] for group in self._groups or []]
+            if changed or removed or previous_ids != [group["id"] for group in groups]:
+                self.version += 1
+            self._groups = groups
+            # An invalidation that came in during the fetch keeps the catalog stale
+            if self._invalidated_at <= started:
+                self._loaded_at = started
+
+    def get_groups(self):
+        """Get the current group list without fetching any group's avatars
+
+        Returns (success, groups_or_error). Stale data is served if the list
+        cannot be fetched.
+        """
+        success, groups = self._fetch_group_list()
+        if success:
+            return True, groups
+        with self._lock:
+            if self._groups is None:
+                return False, groups
+            return True, list(self._groups)
+
+    def _fetch_group_list(self):
+        """Get the cached group list while fresh, else download it once for every waiting caller
+
+        A downloaded list is offered to the next refresh. Returns
+        (success, groups_or_error).
+        """
+        def cached():
+            with self._lock:
+                if not self.is_stale():
+                    return list(self._groups)
+                if self._warm_groups is not None and time.monotonic() - self._warm_groups[1] < self.ttl:
+                    return list(self._warm_groups[0])
+            return None
+
+        groups = cached()
+        if groups is not None:
+            return True, groups
+        with self._list_lock:
+            # Another caller may have downloaded it while this one waited
+            groups = cached()
+            if groups is not None:
+                return True, groups
+            success, groups = self.list_groups()
+            if not success:
+                return False, groups
+            groups = [group for group in groups if group.get("id")]
+            self.warm(groups)
+            return True, groups
+
+    def get_avatars(self):
+        """Get every cached avatar in group-list order
+
+        Returns (success, avatars_or_error). Stale data is served if a refresh fails.
+        """
+        success, error = self.refresh()
+        with self._lock:
+            if self._groups is None:
+                return False, error
+            return True, self._all_avatars()
+
+    def get_recent_avatars(self, limit):
+        """Get the most recently created avatars without loading every group
+
+        Groups are walked newest first and the walk stops once limit avatars
+        have been found in groups created after the next candidate, so only a
+        few avatar lists are fetched. Groups fetched here are kept in the
+        catalog for later reads. Returns (success, avatars_or_error).
+        """
+        success, groups = self.get_groups()
+        if not success:
+            return False, groups
+
+        ordered = sorted(groups, key=lambda group: group.get("created_at", 0), reverse=True)
+        candidates = []
+        position = 0
+        while position < len(ordered):
+            # Groups created at the same time are fetched together, as avatar IDs break the tie
+            created_at = ordered[position].get("created_at", 0)
+            batch = []
+            while position < len(ordered) and ordered[position].get("created_at", 0) == created_at:
+                batch.append(ordered[position])
+                position += 1
+
+            started = time.monotonic()
+            with self._lock:
+                missing = [group for group in batch if not self._is_cached(group)]
+            # Fetch outside the lock so other sessions keep reading the catalog meanwhile
+            results = fan_out(self.fetch_group_avatars, missing, self.max_in_flight)
+            with self._lock:
+                for group, group_avatars in zip(missing, results):
+                    if group_avatars is not None:
+                        self._store_group(group, group_avatars, started)
+                        self.version += 1
+                for group in batch:
+                    candidates.extend(self._group_avatars.get(group["id"], []))
+
+            # Every remaining group is older than all the candidates
+            if len(candidates) >= limit:
+                break
+
+        log.info("Recent avatars fetched", groups_fetched=position, groups=len(ordered))
+        return True, heapq.nlargest(
+            limit,
+            candidates,
+            key=lambda avatar: (avatar.get("group_created_at", 0), avatar.get("id", ""))
+        )
+
+    def _all_avatars(self):
+        """Get every cached avatar in group-list order (caller holds the lock)"""
+        all_avatars = []
+        for group in self._groups:
+            all_avatars.extend(self._group_avatars.get(group["id"], []))
+        return all_avatars
+
+    def _is_cached(self, group):
+        """Check whether a group's cached avatars are current (caller holds the lock)"""
+        return (
+            group["id"] in self._group_avatars
+            and group["id"] not in self._dirty_groups
+            and self._fingerprints.get(group["id"]) == group_fingerprint(group)
+        )
+
+    def _store_group(self, group, group_avatars, fetched_since=None):
+        """Cache a group's avatars fetched since the given monotonic time (caller holds the lock)
+
+        The group stays dirty if it was invalidated after its fetch started.
+        """
+        self._group_avatars[group["id"]] = group_avatars
+        self._fingerprints[group["id"]] = group_fingerprint(group)
+        invalidated_at = self._dirty_groups.get(group["id"])
+        if invalidated_at is not None and (fetched_since is None or invalidated_at <= fetched_since):
+            del self._dirty_groups[group["id"]]
+
+    def get_search_index(self):
+        """Get a search index over the cached avatars, rebuilt only when they change
+
+        Returns (success, index_or_error). Stale data is served if a refresh fails.
+        """
+        success, error = self.refresh()
+        with self._lock:
+            if self._groups is None:
+                return False, error
+
+            if self._index is None or self._index_version != self.version:
+                self._index = AvatarSearchIndex(self._all_avatars())
+                self._index_version = self.version
+            return True, self._index
+
+    def refresh_group(self, group_id):
+        """Refetch the avatars of a single group, returns them or None on failure
+
+        A group the catalog does not know yet is looked up in a fresh group
+        list, so it is cached with its name, creation time and fingerprint.
+        """
+        started = time.monotonic()
+        with self._lock:
+            group = next((group for group in self._groups or [] if group["id"] == group_id), None)
+        is_new = group is None
+        if is_new:
+            success, groups = self.list_groups()
+            if success:
+                self.warm(groups)
+                group = next((group for group in groups if group.get("id") == group_id), None)
+
+        # Fetch outside the lock so other sessions keep reading the catalog meanwhile
+        group_avatars = self.fetch_group_avatars(group or {"id": group_id})
+        if group_avatars is None:
+            return None
+
+        with self._lock:
+            if group is None:
+                # Not listed yet: keep the avatars for readers, the next refresh adds the group
+                self._group_avatars[group_id] = group_avatars
+            else:
+                if is_new and self._groups is not None and all(cached["id"] != group_id for cached in self._groups):
+                    # A brand new group is the most recent one
+                    self._groups.insert(0, group)
+                self._store_group(group, group_avatars, started)
+            self.version += 1
+        return list(group_avatars)
+
+    def wait_for_group(self, group_id, timeout=None, base_delay=1.0, max_delay=8.0):
+        """Wait for a freshly trained group to list its avatars
+
+        Only that group is re-queried, with jittered exponential backoff until
+        the deadline. Returns the group's avatars as soon as there are any, or
+        whatever is available (possibly nothing) when the deadline passes.
+        """
+        timeout = DEFAULT_GROUP_WAIT_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        delay = base_delay
+        group_avatars = None
+
+        while True:
+            with self._lock:
+                cached = self._group_avatars.get(group_id)
+                dirty = group_id in self._dirty_groups
+            if cached and not dirty:
+                return list(cached)
+
+            group_avatars = self.refresh_group(group_id) or group_avatars
+            if group_avatars:
+                return group_avatars
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                log.warning("Gave up waiting for avatars of group", group_id=group_id)
+                return group_avatars or []
+
+            # Equal jitter keeps concurrent waiters from polling in lockstep
+            time.sleep(min(remaining, delay / 2 + random.uniform(0, delay / 2)))
+            delay = min(max_delay, delay * 2)
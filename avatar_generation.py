@@ -1,17 +1,60 @@
 import streamlit as st
-import requests
-import json
+import hashlib
 import time
-from io import BytesIO
-from PIL import Image
-import base64
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+# Local modules read their settings from the environment, so import them after .env is loaded
+import heygen_client
+import photo_avatar
+import photo_upload
+from api_metrics import display_rows, get_metrics, start_metrics_server
+from app_logging import get_logger
+from avatar_catalog import AvatarCatalog
+from avatar_pipeline import AvatarPipeline, collect_photos
+from fan_out import fan_out
+from job_tracker import JobTracker
+from media_cache import MediaCache, extension_for
+
+log = get_logger(__name__)
+
 # Hardcoded API key (replace with your actual API key)
 API_KEY = os.getenv("HEYGEN_API_KEY")
 
+# Maximum number of avatar group requests in flight at once
+MAX_GROUP_FETCH_WORKERS = int(os.getenv("HEYGEN_MAX_GROUP_FETCH_WORKERS", "8"))
+
+# Photo generations still running after this long are given up on (seconds)
+PHOTO_GENERATION_TIMEOUT = 300
+
+# Photo generation statuses that end a generation job
+PHOTO_GENERATION_DONE_STATUSES = ("success", "failed", "error")
+
+# Training jobs still running after this long are reported as slow (seconds)
+TRAINING_TIMEOUT = 600
+
+# Training jobs still running after this long are given up on (seconds)
+TRAINING_MAX_WAIT = int(os.getenv("HEYGEN_TRAINING_MAX_WAIT", "1800"))
+
+# How often pages re-read the state of tracked background jobs (seconds)
+JOB_STATUS_REFRESH_SECONDS = 3
+
+# Local cache for generated images
+IMAGE_CACHE_DIR = os.getenv("HEYGEN_IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("HEYGEN_IMAGE_CACHE_MB", "200")) * 1024 * 1024
+
+# Local cache for avatar preview thumbnails, sized for the avatar cards
+THUMBNAIL_CACHE_DIR = os.getenv("HEYGEN_THUMBNAIL_CACHE_DIR", os.path.join(".cache", "thumbnails"))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("HEYGEN_THUMBNAIL_CACHE_MB", "100")) * 1024 * 1024
+THUMBNAIL_SIZE = (320, 320)
+
+# Where zip files uploaded to the bulk creation page are kept until their photos are through
+PIPELINE_UPLOAD_DIR = os.getenv("HEYGEN_PIPELINE_UPLOAD_DIR", os.path.join(".cache", "pipeline_uploads"))
+
+# Number of avatars shown per page of search results
+SEARCH_PAGE_SIZE = 12
+
 # Simple password for website access
 WEBSITE_PASSWORD = "chatbot"  # You can change this to any password you prefer
 
@@ -105,6 +148,12 @@ if 'avatars' not in st.session_state:
     st.session_state.avatars = []
 if 'search_results' not in st.session_state:
     st.session_state.search_results = []
+if 'search_total' not in st.session_state:
+    st.session_state.search_total = 0
+if 'search_page' not in st.session_state:
+    st.session_state.search_page = 1
+if 'search_params' not in st.session_state:
+    st.session_state.search_params = {}
 if 'generation_id' not in st.session_state:
     st.session_state.generation_id = None
 if 'group_id' not in st.session_state:
@@ -145,189 +194,148 @@ def get_headers():
         "X-Api-Key": API_KEY
     }
 
-def get_upload_headers(content_type):
-    """Get headers for upload API requests"""
-    return {
-        "Content-Type": content_type,
-        "X-Api-Key": API_KEY
-    }
+def get_group_avatars(group):
+    """Get the avatars of a single avatar group, or None if the request fails"""
+    group_id = group.get("id")
+    group_name = group.get("name", "Unknown Group")
+    created_at = group.get("created_at", 0)
+    
+    log.debug("Checking group", group_id=group_id, group_name=group_name, created_at=created_at)
+    
+    avatars_response = heygen_client.get(
+        f"{heygen_client.API_BASE_URL}/v2/avatar_group/{group_id}/avatars",
+        headers=get_headers()
+    )
+    
+    if avatars_response.status_code != 200:
+        log.response("Error getting avatars for group", avatars_response, group_id=group_id)
+        return None
+        
+    avatars_data = avatars_response.json()
+    if avatars_data.get("error") is not None:
+        log.warning("Error in avatars response for group", group_id=group_id, error=avatars_data.get("error"))
+        return None
+    
+    # Extract avatars from this group
+    group_avatars = avatars_data.get("data", {}).get("avatar_list", [])
+    log.debug("Found avatars in group", group_id=group_id, avatars=len(group_avatars))
+    
+    # Add group information and creation timestamp to each avatar
+    for avatar in group_avatars:
+        avatar["group_name"] = group_name
+        avatar["group_id"] = group_id
+        avatar["group_created_at"] = created_at
+    
+    return group_avatars
 
-def get_recent_avatars(limit=3):
-    """Get the most recently created avatars"""
+def list_avatar_groups():
+    """Get all avatar groups, returns (success, groups_or_error)"""
     try:
-        # Get all avatar groups
-        response = requests.get(
-            "https://api.heygen.com/v2/avatar_group.list",
+        response = heygen_client.get(
+            f"{heygen_client.API_BASE_URL}/v2/avatar_group.list",
             headers=get_headers()
         )
         
         if response.status_code != 200:
-            print(f"Error getting avatar groups: {response.status_code}")
-            return []
+            return False, f"Status code {response.status_code}"
             
         groups_data = response.json()
         if groups_data.get("error") is not None:
-            print(f"Error in groups response: {groups_data.get('error')}")
-            return []
+            return False, groups_data.get("error")
             
-        # Extract the avatar groups
         avatar_groups = groups_data.get("data", {}).get("avatar_group_list", [])
-        print(f"Found {len(avatar_groups)} avatar groups")
-        
-        # Sort groups by created_at timestamp to get most recent first
-        avatar_groups.sort(key=lambda x: x.get('created_at', 0), reverse=True)
-        
-        # Get all avatars from all groups
-        all_avatars = []
-        for group in avatar_groups:
-            group_id = group.get("id")
-            group_name = group.get("name", "Unknown Group")
-            created_at = group.get("created_at", 0)
-            
-            if not group_id:
-                continue
-                
-            print(f"Checking group: {group_name} (ID: {group_id}, created_at: {created_at})")
-                
-            # Get avatars for this group
-            avatars_response = requests.get(
-                f"https://api.heygen.com/v2/avatar_group/{group_id}/avatars",
-                headers=get_headers()
-            )
-            
-            if avatars_response.status_code != 200:
-                print(f"Error getting avatars for group {group_id}: {avatars_response.status_code}")
-                continue
-                
-            avatars_data = avatars_response.json()
-            if avatars_data.get("error") is not None:
-                print(f"Error in avatars response for group {group_id}: {avatars_data.get('error')}")
-                continue
-            
-            # Extract avatars from this group
-            group_avatars = avatars_data.get("data", {}).get("avatar_list", [])
-            print(f"Found {len(group_avatars)} avatars in group {group_name}")
-            
-            # Add group information and creation timestamp to each avatar
-            for avatar in group_avatars:
-                avatar["group_name"] = group_name
-                avatar["group_id"] = group_id
-                avatar["group_created_at"] = created_at
-                
-            all_avatars.extend(group_avatars)
-        
-        print(f"Total avatars found: {len(all_avatars)}")
-        
-        # Sort by group creation date first (most recent groups first), then by avatar ID
-        all_avatars.sort(key=lambda x: (x.get('group_created_at', 0), x.get('id', '')), reverse=True)
+        log.debug("Found avatar groups", groups=len(avatar_groups))
+        return True, avatar_groups
+    except Exception as e:
+        return False, str(e)
+
+@st.cache_resource
+def get_avatar_catalog():
+    """Get the avatar catalog shared by every session on this server"""
+    return AvatarCatalog(
+        list_avatar_groups,
+        get_group_avatars,
+        max_in_flight=MAX_GROUP_FETCH_WORKERS
+    )
+
+def get_recent_avatars(limit=3):
+    """Get the most recently created avatars"""
+    try:
+        # Only the newest groups are fetched, the rest of the catalog is left alone
+        success, recent_avatars = get_avatar_catalog().get_recent_avatars(limit)
+        if not success:
+            log.warning("Error getting avatar groups", error=recent_avatars)
+            return []
         
-        # Show debug info for top avatars
-        for i, avatar in enumerate(all_avatars[:limit]):
-            print(f"Recent avatar {i+1}: {avatar.get('name', 'Unnamed')} (ID: {avatar.get('id')}, Group: {avatar.get('group_name')}, Group created: {avatar.get('group_created_at')})")
+        log.debug("Recent avatars", avatars=[
+            {"id": avatar.get("id"), "name": avatar.get("name"), "group_id": avatar.get("group_id")}
+            for avatar in recent_avatars
+        ])
         
-        return all_avatars[:limit]
+        return recent_avatars
     except Exception as e:
-        print(f"Error getting recent avatars: {str(e)}")
+        log.exception("Error getting recent avatars")
         return []
 
-def search_avatars(search_term):
-    """Search avatars by name by first getting avatar groups and then finding avatars within those groups"""
+def search_avatars(search_term, group_id=None, gender=None, page=1):
+    """Search avatars by name in the local index built from the avatar catalog"""
     try:
-        # Step 1: Get all avatar groups
-        response = requests.get(
-            "https://api.heygen.com/v2/avatar_group.list",
-            headers=get_headers()
-        )
-        
-        if response.status_code != 200:
-            st.error(f"Error fetching avatar groups: Status code {response.status_code}")
-            return False
-            
-        groups_data = response.json()
-        if groups_data.get("error") is not None:
-            st.error(f"Error fetching avatar groups: {groups_data.get('error')}")
+        # Get the search index built from the shared catalog
+        success, index = get_avatar_catalog().get_search_index()
+        if not success:
+            st.error(f"Error fetching avatar groups: {index}")
             return False
-            
-        # Extract the avatar groups
-        avatar_groups = groups_data.get("data", {}).get("avatar_group_list", [])
-        
-        # Step 2: For each group, get the avatars
-        all_avatars = []
-        for group in avatar_groups:
-            group_id = group.get("id")
-            if not group_id:
-                continue
-                
-            # Get avatars for this group
-            avatars_response = requests.get(
-                f"https://api.heygen.com/v2/avatar_group/{group_id}/avatars",
-                headers=get_headers()
-            )
-            
-            if avatars_response.status_code != 200:
-                continue
-                
-            avatars_data = avatars_response.json()
-            if avatars_data.get("error") is not None:
-                continue
-            
-            # Extract avatars from this group
-            group_avatars = avatars_data.get("data", {}).get("avatar_list", [])
-            
-            # Add group information to each avatar
-            for avatar in group_avatars:
-                avatar["group_name"] = group.get("name", "Unknown Group")
-                avatar["group_id"] = group_id
-                
-            all_avatars.extend(group_avatars)
         
-        # Filter avatars by search term if provided
-        if search_term:
-            search_term = search_term.lower()
-            filtered_avatars = [
-                avatar for avatar in all_avatars 
-                if search_term in avatar.get('name', '').lower()
-            ]
-            all_avatars = filtered_avatars
+        # Rank the matches and keep only the requested page
+        total, results = index.search(
+            search_term,
+            group_id=group_id,
+            gender=gender,
+            offset=(page - 1) * SEARCH_PAGE_SIZE,
+            limit=SEARCH_PAGE_SIZE
+        )
         
-        # If no results and we just finished training, add a delay and try again
-        if len(all_avatars) == 0 and 'training_status' in st.session_state and st.session_state.training_status == "ready":
-            # Add a short delay to allow server indexing
-            time.sleep(3)
-            # Try the search again (recursive call)
-            return search_avatars(search_term)
+        # If no results and we just finished training, wait for the new group to be indexed
+        if total == 0 and st.session_state.get('training_status') == "ready" and st.session_state.get('group_id'):
+            catalog = get_avatar_catalog()
+            if catalog.wait_for_group(st.session_state.group_id):
+                success, index = catalog.get_search_index()
+                if success:
+                    total, results = index.search(
+                        search_term,
+                        group_id=group_id,
+                        gender=gender,
+                        offset=(page - 1) * SEARCH_PAGE_SIZE,
+                        limit=SEARCH_PAGE_SIZE
+                    )
         
-        st.session_state.search_results = all_avatars
+        st.session_state.search_results = results
+        st.session_state.search_total = total
+        st.session_state.search_page = page
         return True
     except Exception as e:
         st.error(f"An error occurred while searching avatars: {str(e)}")
         return False
 
-def upload_asset(file, file_type):
-    """Upload a file asset to server"""
-    try:
-        content_type = f"{file_type}/{file.type.split('/')[-1]}" if file.type else f"{file_type}/octet-stream"
-        upload_url = "https://upload.heygen.com/v1/asset"
-        
-        headers = get_upload_headers(content_type)
-        response = requests.post(upload_url, headers=headers, data=file.getvalue())
-        
-        print(f"Upload response status: {response.status_code}")
-        print(f"Upload response content: {response.text}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("code") == 100:
-                asset_info = data.get("data", {})
-                asset_id = asset_info.get("id")
-                asset_url = asset_info.get("url")
-                return True, asset_id, asset_url
-            else:
-                return False, None, f"Error uploading asset: {data.get('message')}"
-        else:
-            return False, None, f"Error uploading asset: Status code {response.status_code}"
-    except Exception as e:
-        return False, None, f"An error occurred while uploading the asset: {str(e)}"
+def prepare_upload_photo(file):
+    """Decode an uploaded photo once for both preview and upload, reusing it across reruns"""
+    file_key = getattr(file, "file_id", None) or f"{file.name}:{file.size}"
+    cached = st.session_state.get("prepared_upload")
+    if cached and cached[0] == file_key:
+        return cached[1]
+    
+    prepared = photo_upload.prepare_photo(file, content_type=file.type or None)
+    st.session_state.prepared_upload = (file_key, prepared)
+    return prepared
+
+def upload_asset(file, file_type, prepared=None):
+    """Upload a file asset to server, streaming it instead of copying it into memory"""
+    if prepared is not None:
+        return photo_upload.upload_asset(prepared.open_body(), prepared.content_type, API_KEY)
+    
+    content_type = f"{file_type}/{file.type.split('/')[-1]}" if file.type else f"{file_type}/octet-stream"
+    file.seek(0)
+    return photo_upload.upload_asset(file, content_type, API_KEY)
 
 def generate_photo_avatar(avatar_attributes):
     """Generate a photo avatar using HeyGen's AI"""
@@ -344,18 +352,15 @@ def generate_photo_avatar(avatar_attributes):
             "appearance": avatar_attributes.get("appearance")
         }
         
-        # Debug: Print the request payload
-        print("Request payload:", json.dumps(payload, indent=2))
+        log.debug("Generating photo avatar", payload=payload)
         
-        response = requests.post(
-            "https://api.heygen.com/v2/photo_avatar/photo/generate",
+        response = heygen_client.post(
+            f"{heygen_client.API_BASE_URL}/v2/photo_avatar/photo/generate",
             headers=get_headers(),
             json=payload
         )
         
-        # Debug: Print the response
-        print("Response status:", response.status_code)
-        print("Response body:", response.text)
+        log.response("Photo generation response", response)
         
         if response.status_code == 200:
             data = response.json()
@@ -371,18 +376,21 @@ def generate_photo_avatar(avatar_attributes):
         return False, f"An error occurred while generating the photo avatar: {str(e)}"
 
 def check_photo_generation_status(generation_id):
-    """Check the status of a photo generation"""
+    """Check the status of a photo generation
+    
+    Does not touch session state, so it is safe to call from background threads.
+    Returns "rate_limited" as the status if HeyGen is still throttling after
+    the client's retries.
+    """
     try:
-        url = f"https://api.heygen.com/v2/photo_avatar/generation/{generation_id}"
-        print(f"Checking generation status at URL: {url}")
-        
-        response = requests.get(
+        url = f"{heygen_client.API_BASE_URL}/v2/photo_avatar/generation/{generation_id}"
+        response = heygen_client.get(
             url,
             headers=get_headers()
         )
         
-        print(f"Status check response: {response.status_code}")
-        print(f"Response content: {response.text}")
+        # Polled every few seconds per generation, so routine responses are sampled
+        log.response("Generation status check response", response, sample=True, generation_id=generation_id)
         
         if response.status_code == 200:
             data = response.json()
@@ -393,173 +401,233 @@ def check_photo_generation_status(generation_id):
                 image_keys = status_data.get("image_key_list")
                 avatar_id = status_data.get("avatar_id")
                 
-                print(f"Generation status: {status}")
-                print(f"Image URLs: {image_urls}")
-                print(f"Image keys: {image_keys}")
-                print(f"Avatar ID: {avatar_id}")
-                
-                # Store all image keys and URLs
-                if image_keys and len(image_keys) > 0:
-                    st.session_state.image_keys = image_keys
-                    st.session_state.image_urls = image_urls
-                
-                # Store avatar_id in session state if available
-                if avatar_id:
-                    st.session_state.avatar_id = avatar_id
-                
                 return status, image_urls, image_keys, avatar_id
             else:
-                print(f"Error in response: {data.get('error')}")
+                log.warning("Generation status check failed", generation_id=generation_id, error=data.get("error"))
                 return "error", None, None, None
+        elif response.status_code == 429:
+            return "rate_limited", None, None, None
         else:
-            print(f"Error response status: {response.status_code}")
             return "error", None, None, None
     except Exception as e:
-        print(f"Exception in check_photo_generation_status: {str(e)}")
+        log.exception("Exception in check_photo_generation_status", generation_id=generation_id)
         return "error", None, None, None
 
+def store_photo_generation_result(image_urls, image_keys, avatar_id):
+    """Store generated image keys, URLs and avatar ID in session state"""
+    # Store all image keys and URLs
+    if image_keys and len(image_keys) > 0:
+        st.session_state.image_keys = image_keys
+        st.session_state.image_urls = image_urls
+    
+    # Store avatar_id in session state if available
+    if avatar_id:
+        st.session_state.avatar_id = avatar_id
+
+def poll_photo_generation(generation_id):
+    """Job tracker poll function for photo generations"""
+    status, image_urls, image_keys, avatar_id = check_photo_generation_status(generation_id)
+    if status == "rate_limited":
+        # Keep the last known status and poll again later instead of failing the job
+        raise RuntimeError("Rate limited while checking generation status")
+    return status, {
+        "image_urls": image_urls,
+        "image_keys": image_keys,
+        "avatar_id": avatar_id
+    }
+
+def poll_training_status(group_id):
+    """Job tracker poll function for avatar group training"""
+    status = check_training_status(group_id)
+    if status == "rate_limited":
+        raise RuntimeError("Rate limited while checking training status")
+    return status, None
+
+@st.cache_resource
+def get_job_tracker():
+    """Get the background job tracker shared by every session on this server"""
+    return JobTracker()
+
+@st.fragment(run_every=JOB_STATUS_REFRESH_SECONDS)
+def show_job_progress(job_id, message, slow_message, expected_duration):
+    """Show a tracked job's progress until it finishes, then rerun the whole page"""
+    job = get_job_tracker().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    
+    st.progress(min(0.95, job.elapsed / expected_duration))
+    if job.elapsed < expected_duration:
+        st.info(f"{message} ({job.status or 'pending'})")
+    else:
+        st.warning(slow_message)
+
 def create_avatar_group(name, image_key, generation_id=None):
     """Create a photo avatar group"""
-    try:
-        # Ensure the image_key is properly formatted
-        # For uploaded photos, image_key should be in the format "image/{asset_id}/original"
-        if not image_key.startswith("image/") and not image_key.endswith("/original"):
-            # Fix the format if needed
-            asset_id = image_key.split("/")[-1] if "/" in image_key else image_key
-            image_key = f"image/{asset_id}/original"
-            print(f"Reformatted image_key to: {image_key}")
-        
-        # Prepare the payload based on whether this is an AI-generated avatar or uploaded photo
-        payload = {
-            "name": name,
-            "image_key": image_key
-        }
-        
-        # Add generation_id for AI-generated avatars only if it's provided
-        if generation_id:
-            payload["generation_id"] = generation_id
-            
-        print(f"Creating avatar group with payload: {json.dumps(payload, indent=2)}")
-        
-        response = requests.post(
-            "https://api.heygen.com/v2/photo_avatar/avatar_group/create",
-            headers=get_headers(),
-            json=payload
-        )
-        
-        print(f"Avatar group creation response: {response.status_code}")
-        print(f"Response content: {response.text}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("error") is None:
-                group_id = data.get("data", {}).get("group_id")
-                st.session_state.group_id = group_id
-                return True, group_id
-            else:
-                return False, f"Error creating avatar group: {data.get('error')}"
-        else:
-            return False, f"Error creating avatar group: Status code {response.status_code}"
-    except Exception as e:
-        print(f"Exception in create_avatar_group: {str(e)}")
-        return False, f"An error occurred while creating the avatar group: {str(e)}"
+    success, result = photo_avatar.create_avatar_group(name, image_key, generation_id, API_KEY)
+    if success:
+        st.session_state.group_id = result
+        # The new group has to show up in the avatar catalog
+        get_avatar_catalog().invalidate()
+    return success, result
 
 def train_avatar_group(group_id):
     """Start training an avatar group"""
-    try:
-        payload = {
-            "group_id": group_id
-        }
-        
-        print(f"Starting training for group_id: {group_id}")
-        
-        response = requests.post(
-            "https://api.heygen.com/v2/photo_avatar/train",
-            headers=get_headers(),
-            json=payload
-        )
-        
-        print(f"Training response status: {response.status_code}")
-        print(f"Training response content: {response.text}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("error") is None:
-                return True, "Training started successfully"
-            else:
-                return False, f"Error starting training: {data.get('error')}"
-        else:
-            return False, f"Error starting training: Status code {response.status_code}"
-    except Exception as e:
-        print(f"Exception in train_avatar_group: {str(e)}")
-        return False, f"An error occurred while starting the training: {str(e)}"
+    return photo_avatar.train_avatar_group(group_id, API_KEY)
 
 def check_training_status(group_id):
     """Check the status of a group training job"""
-    try:
-        url = f"https://api.heygen.com/v2/photo_avatar/train/status/{group_id}"
-        
-        response = requests.get(
-            url,
-            headers=get_headers()
-        )
-        
-        print(f"Training status check response: {response.status_code}")
-        print(f"Response content: {response.text}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("error") is None:
-                status_data = data.get("data", {})
-                status = status_data.get("status")
-                return status
-            else:
-                return "error"
-        else:
-            return "error"
-    except Exception as e:
-        print(f"Exception in check_training_status: {str(e)}")
-        return "error"
+    return photo_avatar.check_training_status(group_id, API_KEY)
 
 def check_api_key_valid():
-    """Check if the API key is valid"""
+    """Check if the API key is valid, reusing a recent successful check"""
+    if heygen_client.is_key_validated(API_KEY):
+        return True
+    
     try:
         # Try to fetch avatar groups as a simple API check
-        print("Validating API key...")
-        response = requests.get(
-            "https://api.heygen.com/v2/avatar_group.list",
+        response = heygen_client.get(
+            f"{heygen_client.API_BASE_URL}/v2/avatar_group.list",
             headers=get_headers()
         )
         
-        print(f"API key validation response: {response.status_code}")
-        print(f"Response content: {response.text[:200]}...") # Print just the beginning to avoid too much output
+        log.response("API key validation response", response)
         
         if response.status_code == 200:
             data = response.json()
             if data.get("error") is None:
-                print("API key validation successful")
+                heygen_client.remember_key_validated(API_KEY)
+                # Hand the group list to the catalog instead of throwing it away
+                get_avatar_catalog().warm(data.get("data", {}).get("avatar_group_list", []))
                 return True
                 
-        print("API key validation failed")
+        log.warning("API key validation failed", status=response.status_code)
         return False
     except Exception as e:
-        print(f"Exception in check_api_key_valid: {str(e)}")
+        log.exception("Exception in check_api_key_valid")
         return False
 
-# Function to generate a download link for an image
-def get_image_download_link(img_url, filename):
-    """Generate a download link for an image"""
-    try:
-        response = requests.get(img_url)
-        if response.status_code == 200:
-            img_data = response.content
-            b64 = base64.b64encode(img_data).decode()
-            href = f'<a href="data:image/png;base64,{b64}" download="{filename}" class="download-button">Download Image</a>'
-            return href
-        else:
-            return f"<p>Error downloading image: {response.status_code}</p>"
-    except Exception as e:
-        return f"<p>Error: {str(e)}</p>"
+@st.cache_resource
+def get_avatar_pipeline():
+    """Get the bulk upload -> group -> train pipeline shared by every session on this server"""
+    catalog = get_avatar_catalog()
+    
+    def on_update(item):
+        # New and trained groups have to show up in the avatar catalog
+        if item["status"] == "grouped":
+            catalog.invalidate()
+        elif item["status"] == "ready":
+            catalog.invalidate(item["group_id"])
+    
+    return AvatarPipeline(get_job_tracker(), api_key=API_KEY, on_update=on_update)
+
+def save_pipeline_upload(file):
+    """Save an uploaded zip of photos under a name derived from its content, returns its path"""
+    os.makedirs(PIPELINE_UPLOAD_DIR, exist_ok=True)
+    data = file.getvalue()
+    path = os.path.join(PIPELINE_UPLOAD_DIR, hashlib.sha256(data).hexdigest()[:16] + ".zip")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
+
+@st.fragment(run_every=JOB_STATUS_REFRESH_SECONDS)
+def show_pipeline_progress():
+    """Show the progress of every photo in the bulk creation pipeline"""
+    pipeline = get_avatar_pipeline()
+    items = pipeline.items()
+    if not items:
+        st.info("No photos have been added yet.")
+        return
+    
+    counts = pipeline.counts()
+    cols = st.columns(4)
+    cols[0].metric("Photos", len(items))
+    cols[1].metric("In progress", len(items) - counts.get("ready", 0) - counts.get("failed", 0))
+    cols[2].metric("Ready", counts.get("ready", 0))
+    cols[3].metric("Failed", counts.get("failed", 0))
+    
+    st.dataframe(
+        [
+            {
+                "Name": item["name"],
+                "Status": item["status"],
+                "Group ID": item["group_id"] or "",
+                "Error": item["error"] or ""
+            }
+            for item in items
+        ],
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    if counts.get("failed") and st.button("Retry Failed Photos", use_container_width=True):
+        pipeline.retry_failed()
+        st.rerun(scope="fragment")
+
+@st.cache_resource
+def get_metrics_server():
+    """Get the Prometheus-style /metrics endpoint, or None if it could not start"""
+    return start_metrics_server()
+
+@st.fragment(run_every=JOB_STATUS_REFRESH_SECONDS)
+def show_api_metrics():
+    """Show request counts, latency and errors of every HeyGen endpoint called by this server"""
+    snapshot = get_metrics().snapshot()
+    if not snapshot:
+        st.info("No HeyGen calls have been made yet.")
+        return
+    
+    cols = st.columns(4)
+    cols[0].metric("Requests", sum(row["requests"] for row in snapshot))
+    cols[1].metric("Errors", sum(row["errors"] for row in snapshot))
+    cols[2].metric("In flight", sum(row["in_flight"] for row in snapshot))
+    cols[3].metric("Retries", sum(row["retries"] for row in snapshot))
+    
+    # Rows are ordered by total time spent, so the top one is where calls wait the longest
+    st.caption(f"Most time is spent on **{snapshot[0]['endpoint']}**.")
+    st.dataframe(display_rows(snapshot), use_container_width=True, hide_index=True)
+
+@st.cache_resource
+def get_image_cache():
+    """Get the on-disk image cache shared by every session on this server"""
+    return MediaCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_thumbnail_cache():
+    """Get the on-disk thumbnail cache shared by every session on this server"""
+    return MediaCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+
+def get_avatar_thumbnails(avatars):
+    """Get local thumbnail paths for the avatars on screen, fetching missing ones concurrently"""
+    cache = get_thumbnail_cache()
+    
+    def fetch_thumbnail(avatar):
+        preview_url = avatar.get('image_url')
+        if not preview_url:
+            return None
+        path, _ = cache.fetch_thumbnail(preview_url, THUMBNAIL_SIZE)
+        # Fall back to the full image if the thumbnail could not be made
+        return path or preview_url
+    
+    return fan_out(fetch_thumbnail, avatars, MAX_GROUP_FETCH_WORKERS)
+
+def show_image_download_button(img_url, filename, key):
+    """Show a download button for an image, fetching it into the local cache only once"""
+    path, mime_type = get_image_cache().fetch(img_url)
+    if path is None:
+        st.markdown("<p>Error downloading image</p>", unsafe_allow_html=True)
+        return
+    
+    # Name the file after its real format rather than assuming PNG
+    with open(path, "rb") as f:
+        st.download_button(
+            "Download Image",
+            data=f,
+            file_name=f"{os.path.splitext(filename)[0]}{extension_for(mime_type)}",
+            mime=mime_type,
+            key=key,
+            use_container_width=True
+        )
 
 def set_page(page):
     """Set the active page and reset page-specific state"""
@@ -605,6 +673,8 @@ def reset_avatar_creation_state():
     st.session_state.search_results = []
 
 # Main app logic
+get_metrics_server()
+
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 
@@ -661,6 +731,14 @@ else:
     if st.sidebar.button("Generate Photo with AI", key="generate_photo_button"):
         set_page("Generate Photo with AI")
         st.rerun()
+        
+    if st.sidebar.button("Bulk Create Avatars", key="bulk_create_button"):
+        set_page("Bulk Create Avatars")
+        st.rerun()
+        
+    if st.sidebar.button("API Metrics", key="api_metrics_button"):
+        set_page("API Metrics")
+        st.rerun()
     
     # Show current page for debugging
     st.sidebar.text(f"Current page: {st.session_state.active_page}")
@@ -684,6 +762,8 @@ else:
             st.markdown("- **Search Avatars**: Find existing avatars by name.")
             st.markdown("- **Train Photo into Talking Avatar**: Upload a photo to create a talking avatar.")
             st.markdown("- **Generate Photo with AI**: Create AI-generated avatar images.")
+            st.markdown("- **Bulk Create Avatars**: Turn a whole folder of photos into talking avatars.")
+            st.markdown("- **API Metrics**: See the latency, errors and retries of each HeyGen endpoint.")
             st.markdown("- Copy avatar IDs for video generation.")
             st.markdown("</div>", unsafe_allow_html=True)
             
@@ -717,15 +797,15 @@ else:
             
             if recent_avatars:
                 cols = st.columns(3)
+                thumbnails = get_avatar_thumbnails(recent_avatars)
                 for i, avatar in enumerate(recent_avatars):
                     with cols[i]:
                         st.markdown("<div class='card'>", unsafe_allow_html=True)
                         st.markdown(f"<h4>{avatar.get('name', 'Unnamed Avatar')}</h4>", unsafe_allow_html=True)
                         
-                        # Display preview image if available
-                        preview_url = avatar.get('image_url')
-                        if preview_url:
-                            st.image(preview_url, use_container_width=True)
+                        # Display preview thumbnail if available
+                        if thumbnails[i]:
+                            st.image(thumbnails[i], use_container_width=True)
                         
                         st.markdown(f"**ID**: `{avatar.get('id', 'N/A')}`")
                         st.markdown(f"**Gender**: {avatar.get('gender', 'Not specified')}")
@@ -749,15 +829,39 @@ else:
             with search_col2:
                 search_button = st.button("Search")
             
-            if search_button and search_term:
+            # Optional filters
+            groups_loaded, catalog_groups = get_avatar_catalog().get_groups()
+            group_names = {group["id"]: group.get("name", "Unknown Group") for group in catalog_groups} if groups_loaded else {}
+            filter_col1, filter_col2 = st.columns(2)
+            with filter_col1:
+                group_filter = st.selectbox(
+                    "Group",
+                    options=[None] + list(group_names),
+                    format_func=lambda group_id: "All groups" if group_id is None else group_names[group_id]
+                )
+            with filter_col2:
+                gender_filter = st.selectbox(
+                    "Gender",
+                    options=[None, "female", "male"],
+                    format_func=lambda gender: "Any" if gender is None else gender.title()
+                )
+            
+            if search_button and (search_term or group_filter or gender_filter):
+                st.session_state.search_params = {
+                    "search_term": search_term,
+                    "group_id": group_filter,
+                    "gender": gender_filter
+                }
                 with st.spinner("Searching avatars..."):
-                    search_avatars(search_term)
+                    search_avatars(**st.session_state.search_params)
             
             # Display search results
             if st.session_state.search_results:
-                st.success(f"Found {len(st.session_state.search_results)} avatars matching your search")
+                st.success(f"Found {st.session_state.search_total} avatars matching your search")
                 
                 cols = st.columns(3)
+                # Only the current page's thumbnails are fetched
+                thumbnails = get_avatar_thumbnails(st.session_state.search_results)
                 
                 for i, avatar in enumerate(st.session_state.search_results):
                     col = cols[i % 3]
@@ -765,10 +869,9 @@ else:
                         st.markdown("<div class='card'>", unsafe_allow_html=True)
                         st.markdown(f"<h4>{avatar.get('name', 'Unnamed Avatar')}</h4>", unsafe_allow_html=True)
                         
-                        # Display preview image if available
-                        preview_url = avatar.get('image_url')
-                        if preview_url:
-                            st.image(preview_url, use_container_width=True)
+                        # Display preview thumbnail if available
+                        if thumbnails[i]:
+                            st.image(thumbnails[i], use_container_width=True)
                         
                         st.markdown(f"**ID**: `{avatar.get('id', 'N/A')}`")
                         st.markdown(f"**Gender**: {avatar.get('gender', 'Not specified')}")
@@ -779,7 +882,22 @@ else:
                             st.markdown(f"Selected Avatar ID: `{st.session_state.avatar_id}`")
                         
                         st.markdown("</div>", unsafe_allow_html=True)
-            elif search_button and search_term:
+                
+                # Pagination controls
+                total_pages = max(1, -(-st.session_state.search_total // SEARCH_PAGE_SIZE))
+                if total_pages > 1:
+                    page_col1, page_col2, page_col3 = st.columns([1, 2, 1])
+                    with page_col1:
+                        if st.button("← Previous", disabled=st.session_state.search_page <= 1):
+                            search_avatars(**st.session_state.search_params, page=st.session_state.search_page - 1)
+                            st.rerun()
+                    with page_col2:
+                        st.markdown(f"Page {st.session_state.search_page} of {total_pages}")
+                    with page_col3:
+                        if st.button("Next →", disabled=st.session_state.search_page >= total_pages):
+                            search_avatars(**st.session_state.search_params, page=st.session_state.search_page + 1)
+                            st.rerun()
+            elif search_button and (search_term or group_filter or gender_filter):
                 st.info(f"No avatars found matching '{search_term}'")
             else:
                 st.info("Enter an avatar name and click 'Search' to find avatars.")
@@ -819,9 +937,13 @@ else:
                 
                 uploaded_file = st.file_uploader("Upload Photo (JPG, PNG)", type=["jpg", "jpeg", "png"])
                 
+                prepared_photo = None
                 if uploaded_file:
-                    image = Image.open(uploaded_file)
-                    st.image(image, caption="Preview", width=300)
+                    # One decode serves the preview and, for large photos, the downscaled upload
+                    prepared_photo = prepare_upload_photo(uploaded_file)
+                    st.image(prepared_photo.preview, caption="Preview", width=300)
+                    if prepared_photo.resized:
+                        st.caption(f"Large photo will be downscaled to {prepared_photo.size[0]}×{prepared_photo.size[1]} before upload.")
                     st.session_state.upload_file = uploaded_file
                 
                 st.markdown("### Appearance Description")
@@ -839,7 +961,7 @@ else:
                     else:
                         st.session_state.appearance = appearance
                         with st.spinner("Uploading photo..."):
-                            success, asset_id, asset_url = upload_asset(uploaded_file, "image")
+                            success, asset_id, asset_url = upload_asset(uploaded_file, "image", prepared_photo)
                             
                             if success:
                                 st.session_state.asset_id = asset_id
@@ -912,14 +1034,20 @@ else:
                                 else:
                                     st.error(message)
                     else:
-                        status_placeholder = st.empty()
-                        with status_placeholder:
-                            st.info("Checking training status...")
-                        
-                        status = check_training_status(st.session_state.group_id)
+                        # The shared tracker polls training status in the background
+                        job = get_job_tracker().track(
+                            st.session_state.group_id,
+                            poll_training_status,
+                            done_statuses=photo_avatar.TRAINING_DONE_STATUSES,
+                            timeout=TRAINING_MAX_WAIT
+                        )
+                        status = job.status
                         
                         if status == "ready":
-                            status_placeholder.success("Training completed successfully!")
+                            st.success("Training completed successfully!")
+                            if st.session_state.training_status != "ready":
+                                # Refetch the trained group's avatars on the next catalog read
+                                get_avatar_catalog().invalidate(st.session_state.group_id)
                             st.session_state.training_status = "ready"
                             
                             avatar_info = {
@@ -941,15 +1069,24 @@ else:
                                 st.session_state.current_step = 1
                                 st.rerun()
                                 
-                        elif status == "error":
-                            status_placeholder.error("Training failed. Please try again.")
+                        elif status in ("failed", "error", "timeout"):
+                            if status == "timeout":
+                                st.error("Training did not finish in time. Check its status again later.")
+                            else:
+                                st.error("Training failed. Please try again.")
                             st.session_state.training_status = "error"
-                        else:
-                            status_placeholder.info("Training is still in progress. This may take several minutes.")
-                            st.session_state.training_status = "in_progress"
                             
-                            if st.button("Refresh Training Status", use_container_width=True):
+                            if st.button("Check Training Status Again", use_container_width=True):
+                                get_job_tracker().forget(st.session_state.group_id)
                                 st.rerun()
+                        else:
+                            st.session_state.training_status = "in_progress"
+                            show_job_progress(
+                                st.session_state.group_id,
+                                "Training is still in progress. This may take several minutes.",
+                                "Training is taking longer than usual. Please wait...",
+                                TRAINING_TIMEOUT
+                            )
                 
                 st.markdown("</div>", unsafe_allow_html=True)
                 
@@ -1078,62 +1215,55 @@ else:
                     st.rerun()
                 
                 if st.session_state.generation_id:
-                    status_placeholder = st.empty()
-                    progress_placeholder = st.empty()
-                    
-                    with status_placeholder:
-                        st.info("Checking generation status...")
-                    
-                    progress_bar = progress_placeholder.progress(0)
-                    
-                    attempt = 0
-                    max_attempts = 60
+                    # The tracker polls in the background; this page only reads the job state
+                    job = get_job_tracker().track(
+                        st.session_state.generation_id,
+                        poll_photo_generation,
+                        done_statuses=PHOTO_GENERATION_DONE_STATUSES,
+                        timeout=PHOTO_GENERATION_TIMEOUT
+                    )
                     
-                    while attempt < max_attempts:
-                        attempt += 1
-                        progress = min(0.95, attempt / max_attempts)
-                        progress_bar.progress(progress)
+                    if job.status == "success":
+                        store_photo_generation_result(**job.result)
+                        image_urls = job.result["image_urls"]
+                        st.progress(1.0)
+                        st.success("Images generated successfully!")
                         
-                        status, image_urls, image_keys, avatar_id = check_photo_generation_status(
-                            st.session_state.generation_id
-                        )
+                        st.subheader("Generated Images:")
                         
-                        if status == "success":
-                            progress_bar.progress(1.0)
-                            status_placeholder.success("Images generated successfully!")
-                            
-                            st.subheader("Generated Images:")
+                        if image_urls and len(image_urls) > 0:
+                            cols = st.columns(min(2, len(image_urls)))
                             
-                            if image_urls and len(image_urls) > 0:
-                                cols = st.columns(min(2, len(image_urls)))
-                                
-                                for i, url in enumerate(image_urls):
-                                    with cols[i % len(cols)]:
-                                        st.image(url, caption=f"Generated Image {i+1}", use_container_width=True)
-                                        download_link = get_image_download_link(url, f"AI_Avatar_image_{i+1}.jpg")
-                                        st.markdown(download_link, unsafe_allow_html=True)
-                            
-                            if st.button("Generate More Images", use_container_width=True):
-                                reset_avatar_creation_state()
-                                st.session_state.current_step = 1
-                                st.rerun()
-                            
-                            if st.button("Start Over", use_container_width=True):
-                                reset_avatar_creation_state()
-                                st.session_state.current_step = 1
-                                st.rerun()
-                            
-                            break
+                            for i, url in enumerate(image_urls):
+                                with cols[i % len(cols)]:
+                                    path, _ = get_image_cache().fetch(url)
+                                    st.image(path or url, caption=f"Generated Image {i+1}", use_container_width=True)
+                                    show_image_download_button(url, f"AI_Avatar_image_{i+1}", key=f"download_image_{i}")
                         
-                        elif status == "error":
-                            progress_bar.progress(1.0)
-                            status_placeholder.error("Generation failed. Please try again.")
-                            break
+                        if st.button("Generate More Images", use_container_width=True):
+                            reset_avatar_creation_state()
+                            st.session_state.current_step = 1
+                            st.rerun()
                         
-                        time.sleep(5)
+                        if st.button("Start Over", use_container_width=True):
+                            reset_avatar_creation_state()
+                            st.session_state.current_step = 1
+                            st.rerun()
+                    
+                    elif job.status in ("failed", "error", "timeout"):
+                        st.progress(1.0)
+                        if job.status == "timeout":
+                            st.error("Generation did not finish in time. Please try again.")
+                        else:
+                            st.error("Generation failed. Please try again.")
                     
-                    if status != "success" and status != "error":
-                        status_placeholder.warning("Generation is still in progress. Please wait...")
+                    else:
+                        show_job_progress(
+                            st.session_state.generation_id,
+                            "Checking generation status...",
+                            "Generation is still in progress. Please wait...",
+                            PHOTO_GENERATION_TIMEOUT
+                        )
                 
                 st.markdown("<div class='info-message'>", unsafe_allow_html=True)
                 st.markdown("""
@@ -1143,4 +1273,54 @@ else:
                 - You can generate multiple sets of images with different settings
                 - To create a talking avatar, use the "Train Photo into Talking Avatar" page
                 """)
-                st.markdown("</div>", unsafe_allow_html=True)
\ No newline at end of file
+                st.markdown("</div>", unsafe_allow_html=True)
+    
+    elif st.session_state.active_page == "Bulk Create Avatars":
+        with main_content.container():
+            st.markdown("<h1 class='title'>Bulk Create Avatars</h1>", unsafe_allow_html=True)
+            st.markdown("<p class='subtitle'>Upload, group and train a whole set of photos at once</p>", unsafe_allow_html=True)
+            
+            st.markdown("<div class='step-container'>", unsafe_allow_html=True)
+            st.info("Add a zip of JPG/PNG photos, or the path of a folder on the server. Avatars are named after the files, or after a names.csv with file and name columns.")
+            
+            uploaded_zip = st.file_uploader("Upload Photos (ZIP)", type=["zip"])
+            folder_path = st.text_input("Or a folder on the server")
+            
+            if st.button("Start Bulk Creation", use_container_width=True):
+                source = save_pipeline_upload(uploaded_zip) if uploaded_zip else folder_path.strip()
+                if not source:
+                    st.error("Please upload a zip or enter a folder path.")
+                elif not os.path.exists(source):
+                    st.error(f"Folder not found: {source}")
+                else:
+                    try:
+                        photos = collect_photos(source)
+                    except Exception as e:
+                        photos = None
+                        st.error(f"Could not read photos: {str(e)}")
+                    if photos is not None:
+                        added = get_avatar_pipeline().add(photos)
+                        st.success(f"Found {len(photos)} photos, {added} added to the pipeline.")
+            st.markdown("</div>", unsafe_allow_html=True)
+            
+            st.markdown("### Progress")
+            show_pipeline_progress()
+            
+            st.markdown("<div class='info-message'>", unsafe_allow_html=True)
+            st.markdown("""
+            **Tips for Bulk Creation**:
+            - Photos are uploaded, grouped and trained in parallel, and training takes 5-10 minutes
+            - You can leave this page; the pipeline keeps running and resumes after a restart
+            - Photos that are already in the pipeline are skipped when added again
+            """)
+            st.markdown("</div>", unsafe_allow_html=True)
+    
+    elif st.session_state.active_page == "API Metrics":
+        with main_content.container():
+            st.markdown("<h1 class='title'>API Metrics</h1>", unsafe_allow_html=True)
+            st.markdown("<p class='subtitle'>HeyGen calls made by this server since it started</p>", unsafe_allow_html=True)
+            
+            metrics_server = get_metrics_server()
+            if metrics_server:
+                st.caption(f"Prometheus can scrape these at {metrics_server.url}")
+            show_api_metrics()
\ No newline at end of file
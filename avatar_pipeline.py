@@ -0,0 +1,373 @@
+"""Turn a folder or zip of photos into trained photo avatars
+
+Every photo goes through upload, group creation and training as a streaming
+pipeline: a photo moves to the next stage as soon as it is through the last
+one, and each stage has its own worker limit. Training is followed by the
+shared job tracker. Progress is kept in a state file so an interrupted run
+picks up where it stopped.
+
+    python avatar_pipeline.py photos/ --state class.json
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Local modules read their settings from the environment, so import them after .env is loaded
+import photo_avatar
+import photo_upload
+import rate_limiter
+from app_logging import get_logger
+from job_tracker import JobTracker
+
+log = get_logger(__name__)
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Optional file next to the photos mapping file names to avatar names
+NAMES_FILE = "names.csv"
+
+# Default worker limit of each stage
+DEFAULT_UPLOAD_WORKERS = int(os.getenv("HEYGEN_PIPELINE_UPLOAD_WORKERS", "4"))
+DEFAULT_GROUP_WORKERS = int(os.getenv("HEYGEN_PIPELINE_GROUP_WORKERS", "2"))
+DEFAULT_TRAIN_WORKERS = int(os.getenv("HEYGEN_PIPELINE_TRAIN_WORKERS", "2"))
+
+# Training still running after this long is given up on (seconds)
+TRAINING_TIMEOUT = float(os.getenv("HEYGEN_PIPELINE_TRAINING_TIMEOUT", "3600"))
+
+# State files of the dashboard page and the CLI. Each process keeps the state
+# in memory and rewrites the whole file, so they must not share one.
+DEFAULT_STATE_PATH = os.getenv("HEYGEN_PIPELINE_STATE_PATH", os.path.join(".cache", "avatar_pipeline.json"))
+DEFAULT_CLI_STATE_PATH = os.getenv("HEYGEN_PIPELINE_CLI_STATE_PATH", os.path.join(".cache", "avatar_pipeline_cli.json"))
+
+FINISHED_STATUSES = ("ready", "failed")
+
+# Separates a zip file from the member inside it in a photo source
+ZIP_SEPARATOR = "::"
+
+def read_names(text):
+    """Parse a names.csv with file and name columns"""
+    return {
+        row["file"].strip(): row["name"].strip()
+        for row in csv.DictReader(io.StringIO(text))
+        if row.get("file") and row.get("name")
+    }
+
+def name_from_file(file_name):
+    """Default avatar name for a photo, from its file name"""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return stem.replace("_", " ").replace("-", " ").strip()
+
+def collect_photos(path):
+    """List (name, source) for every photo in a directory or zip file
+
+    Names come from a names.csv (columns file, name) when there is one and
+    from the file names otherwise.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                member for member in archive.namelist()
+                if member.lower().endswith(PHOTO_EXTENSIONS) and not os.path.basename(member).startswith(".")
+            ]
+            names_member = next((member for member in archive.namelist() if os.path.basename(member) == NAMES_FILE), None)
+            names = read_names(archive.read(names_member).decode("utf-8-sig")) if names_member else {}
+        return [
+            (names.get(os.path.basename(member)) or name_from_file(member), f"{os.path.abspath(path)}{ZIP_SEPARATOR}{member}")
+            for member in sorted(members)
+        ]
+
+    names = {}
+    names_path = os.path.join(path, NAMES_FILE)
+    if os.path.exists(names_path):
+        with open(names_path, encoding="utf-8-sig") as f:
+            names = read_names(f.read())
+    return [
+        (names.get(file_name) or name_from_file(file_name), os.path.abspath(os.path.join(path, file_name)))
+        for file_name in sorted(os.listdir(path))
+        if file_name.lower().endswith(PHOTO_EXTENSIONS) and not file_name.startswith(".")
+    ]
+
+def open_photo(source):
+    """Open a photo source as a seekable binary file"""
+    if ZIP_SEPARATOR in source:
+        archive_path, member = source.split(ZIP_SEPARATOR, 1)
+        with zipfile.ZipFile(archive_path) as archive:
+            return io.BytesIO(archive.read(member))
+    return open(source, "rb")
+
+class AvatarPipeline:
+    """Streaming upload -> group -> train pipeline for many photos
+
+    Each photo is a plain dict in the state file. Stages run on their own
+    worker pools and hand a photo to the next stage when they finish with it,
+    so uploads, group creation and training overlap. on_update(item) is called
+    whenever a photo changes stage.
+    """
+
+    def __init__(self, tracker, state_path=None, upload_workers=None, group_workers=None,
+                 train_workers=None, api_key=None, on_update=None):
+        self.tracker = tracker
+        self.state_path = state_path or DEFAULT_STATE_PATH
+        self.api_key = api_key
+        self.on_update = on_update
+        self._stages = {
+            "upload": ThreadPoolExecutor(max_workers=upload_workers or DEFAULT_UPLOAD_WORKERS, thread_name_prefix="pipeline-upload"),
+            "group": ThreadPoolExecutor(max_workers=group_workers or DEFAULT_GROUP_WORKERS, thread_name_prefix="pipeline-group"),
+            "train": ThreadPoolExecutor(max_workers=train_workers or DEFAULT_TRAIN_WORKERS, thread_name_prefix="pipeline-train"),
+        }
+        self._lock = threading.RLock()
+        self._items = {}
+        self._load()
+
+    def add(self, photos):
+        """Queue (name, source) photos, skipping ones already in the pipeline, returns how many were added"""
+        added = []
+        now = time.time()
+        with self._lock:
+            for name, source in photos:
+                if source in self._items:
+                    continue
+                self._items[source] = {
+                    "source": source,
+                    "name": name,
+                    "status": "waiting",
+                    "asset_id": None,
+                    "group_id": None,
+                    "error": None,
+                    "training_timed_out": False,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                added.append(source)
+            self._save()
+        for source in added:
+            self._advance(source)
+        return len(added)
+
+    def retry_failed(self):
+        """Send failed photos back to the stage after the last one they finished"""
+        with self._lock:
+            failed = [item for item in self._items.values() if item["status"] == "failed"]
+            for item in failed:
+                item.update(status=self._resume_status(item), error=None, training_timed_out=False, updated_at=time.time())
+            self._save()
+        for item in failed:
+            self._advance(item["source"])
+        return len(failed)
+
+    def items(self):
+        """Get copies of every photo in the pipeline, in the order they were added"""
+        with self._lock:
+            return sorted((dict(item) for item in self._items.values()), key=lambda item: (item["created_at"], item["source"]))
+
+    def counts(self):
+        """Count the photos in each status"""
+        counts = {}
+        with self._lock:
+            for item in self._items.values():
+                counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return counts
+
+    def finished(self):
+        """Check whether every photo is ready or failed"""
+        with self._lock:
+            return all(item["status"] in FINISHED_STATUSES for item in self._items.values())
+
+    def _resume_status(self, item):
+        """The status a photo can safely continue from, based on what it already has"""
+        if item.get("training_timed_out"):
+            # HeyGen may still be training the group, so check on it rather than train it twice
+            return "training"
+        if item["group_id"]:
+            return "grouped"
+        if item["asset_id"]:
+            return "uploaded"
+        return "waiting"
+
+    def _update(self, source, **changes):
+        """Apply changes to a photo, persist the state and notify"""
+        with self._lock:
+            item = self._items.get(source)
+            if item is None:
+                return
+            item.update(changes, updated_at=time.time())
+            self._save()
+            snapshot = dict(item)
+        if self.on_update is not None:
+            try:
+                self.on_update(snapshot)
+            except Exception as e:
+                log.exception("Error in pipeline update callback", source=source)
+
+    def _advance(self, source):
+        """Hand a photo to the stage its status calls for"""
+        with self._lock:
+            item = self._items.get(source)
+            status = item["status"] if item else None
+        if status == "waiting":
+            self._stages["upload"].submit(self._run_stage, self._upload, source)
+        elif status == "uploaded":
+            self._stages["group"].submit(self._run_stage, self._create_group, source)
+        elif status == "grouped":
+            self._stages["train"].submit(self._run_stage, self._train, source)
+        elif status == "training":
+            self._track(source)
+
+    def _run_stage(self, stage, source):
+        """Run a stage as background work so it gives way to interactive requests"""
+        with rate_limiter.background():
+            stage(source)
+
+    def _upload(self, source):
+        """Downscale and upload a photo"""
+        self._update(source, status="uploading")
+        try:
+            with open_photo(source) as f:
+                prepared = photo_upload.prepare_photo(f)
+                success, asset_id, result = photo_upload.upload_asset(prepared.open_body(), prepared.content_type, self.api_key)
+        except Exception as e:
+            success, asset_id, result = False, None, f"Could not read photo: {str(e)}"
+        if not success:
+            self._update(source, status="failed", error=result)
+            return
+        self._update(source, status="uploaded", asset_id=asset_id)
+        self._advance(source)
+
+    def _create_group(self, source):
+        """Create the avatar group of an uploaded photo"""
+        item = self._items[source]
+        self._update(source, status="creating_group")
+        success, result = photo_avatar.create_avatar_group(
+            item["name"], photo_avatar.image_key_for(item["asset_id"]), api_key=self.api_key
+        )
+        if not success:
+            self._update(source, status="failed", error=result)
+            return
+        self._update(source, status="grouped", group_id=result)
+        self._advance(source)
+
+    def _train(self, source):
+        """Start training a photo's avatar group"""
+        item = self._items[source]
+        self._update(source, status="starting_training")
+        success, message = photo_avatar.train_avatar_group(item["group_id"], api_key=self.api_key)
+        if not success:
+            self._update(source, status="failed", error=message)
+            return
+        self._update(source, status="training")
+        self._advance(source)
+
+    def _track(self, source):
+        """Follow a photo's training through the shared job tracker"""
+        item = self._items[source]
+
+        def poll(group_id):
+            status = photo_avatar.check_training_status(group_id, api_key=self.api_key)
+            if status in ("error", "rate_limited"):
+                # A failed status request is retried rather than ending the job
+                raise RuntimeError(f"Could not get training status of group {group_id}")
+            return status, None
+
+        def on_update(job):
+            if job.status == "ready":
+                self._update(source, status="ready")
+            elif job.status == "failed":
+                self._update(source, status="failed", error="Training failed")
+            elif job.status == "timeout":
+                self._update(source, status="failed", error="Training is taking longer than expected", training_timed_out=True)
+
+        # The tracker keeps finished jobs around, so a retried photo needs a new job
+        job = self.tracker.get(item["group_id"])
+        if job is not None and job.done:
+            self.tracker.forget(item["group_id"])
+        self.tracker.track(
+            item["group_id"],
+            poll,
+            done_statuses={"ready", "failed"},
+            timeout=TRAINING_TIMEOUT,
+            on_update=on_update,
+            created_at=item["updated_at"]
+        )
+
+    def _load(self):
+        """Load the state file and resume unfinished photos"""
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.warning("Could not read pipeline state", path=self.state_path, error=str(e))
+            return
+
+        with self._lock:
+            for item in items:
+                self._items[item["source"]] = item
+                if item["status"] == "uploading":
+                    item["status"] = "waiting"
+                elif item["status"] in ("creating_group", "starting_training"):
+                    # The request may or may not have reached HeyGen; do not risk doing it twice
+                    item.update(status="failed", error="Interrupted, check HeyGen and retry failed photos")
+            self._save()
+        for item in items:
+            self._advance(item["source"])
+
+    def _save(self):
+        """Write the state file atomically (caller holds the lock)"""
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self._items.values()), f, ensure_ascii=False)
+        os.replace(temp_path, self.state_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload, group and train a folder or zip of photos as talking avatars")
+    parser.add_argument("photos", nargs="?", help="Directory or zip of JPG/PNG photos, optionally with a names.csv (file,name)")
+    parser.add_argument("--state", default=DEFAULT_CLI_STATE_PATH, help=f"State file used to resume (default {DEFAULT_CLI_STATE_PATH})")
+    parser.add_argument("--upload-workers", type=int, help=f"Parallel uploads (default {DEFAULT_UPLOAD_WORKERS})")
+    parser.add_argument("--group-workers", type=int, help=f"Parallel group creations (default {DEFAULT_GROUP_WORKERS})")
+    parser.add_argument("--train-workers", type=int, help=f"Parallel training requests (default {DEFAULT_TRAIN_WORKERS})")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry photos that failed in an earlier run")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("HEYGEN_API_KEY"):
+        print("HEYGEN_API_KEY is not set")
+        return 1
+
+    pipeline = AvatarPipeline(
+        JobTracker(),
+        state_path=args.state,
+        upload_workers=args.upload_workers,
+        group_workers=args.group_workers,
+        train_workers=args.train_workers,
+        on_update=lambda item: print(f"{item['name']}: {item['status']}" + (f" ({item['error']})" if item["error"] else ""))
+    )
+    if args.retry_failed:
+        pipeline.retry_failed()
+    if args.photos:
+        photos = collect_photos(args.photos)
+        print(f"Found {len(photos)} photos, {pipeline.add(photos)} new")
+
+    while not pipeline.finished():
+        time.sleep(5)
+        print(", ".join(f"{status}: {count}" for status, count in sorted(pipeline.counts().items())))
+
+    failed = [item for item in pipeline.items() if item["status"] == "failed"]
+    for item in pipeline.items():
+        print(f"{item['name']}: {item['status']} group {item['group_id']}" + (f" ({item['error']})" if item["error"] else ""))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import Counter
+
+# Longest n-gram stored per name; queries are matched with grams of this size or shorter
+MAX_GRAM = 3
+
+# Minimum share of query n-grams a name must contain to count as a fuzzy match
+FUZZY_THRESHOLD = 0.5
+
+# Ranking scores, best first
+SCORE_EXACT = 100
+SCORE_NAME_PREFIX = 80
+SCORE_TOKEN_PREFIX = 60
+SCORE_SUBSTRING = 40
+SCORE_FUZZY = 30
+
+# CJK ideographs, kana and Hangul are written without spaces between words
+CJK_PATTERN = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7a3\uf900-\ufaff"
+TOKEN_RE = re.compile(rf"[{CJK_PATTERN}]+|[^\W_{CJK_PATTERN}]+")
+CJK_RE = re.compile(rf"[{CJK_PATTERN}]")
+
+def normalize(text):
+    """Normalize text for matching (full-width forms folded, case-insensitive)"""
+    return unicodedata.normalize("NFKC", text or "").casefold().strip()
+
+def tokenize(text, split_cjk=True):
+    """Split normalized text into searchable tokens
+
+    Latin words are split on spaces and punctuation. A run of CJK characters
+    is kept whole and, with split_cjk, each of its characters is also a token
+    so a Chinese name can be found by its given name as well as its family name.
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(normalize(text)):
+        tokens.append(run)
+        if split_cjk and CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run)
+    return tokens
+
+def ngrams(text, n):
+    """All n-grams of text, or the text itself if it is shorter than n"""
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class AvatarSearchIndex:
+    """In-memory search index over avatar names
+
+    Supports prefix, substring and n-gram fuzzy matching with optional group
+    and gender filters. Built once per catalog version, so searches make no
+    HTTP calls.
+    """
+
+    def __init__(self, avatars):
+        self.avatars = list(avatars)
+        self.names = [normalize(avatar.get("name", "")) for avatar in self.avatars]
+        self.grams = {}
+        self.by_group = {}
+        self.by_gender = {}
+        token_docs = {}
+
+        for doc_id, (avatar, name) in enumerate(zip(self.avatars, self.names)):
+            compact = name.replace(" ", "")
+            for n in range(1, MAX_GRAM + 1):
+                for gram in ngrams(compact, n):
+                    self.grams.setdefault(gram, set()).add(doc_id)
+            for token in tokenize(name):
+                token_docs.setdefault(token, set()).add(doc_id)
+            self.by_group.setdefault(avatar.get("group_id"), set()).add(doc_id)
+            self.by_gender.setdefault(normalize(avatar.get("gender")), set()).add(doc_id)
+
+        # Sorted token list so prefix lookups are a binary search
+        self.tokens = sorted(token_docs)
+        self.token_docs = token_docs
+
+    def __len__(self):
+        return len(self.avatars)
+
+    def _prefix_docs(self, prefix):
+        """Documents with a token starting with prefix"""
+        docs = set()
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            docs |= self.token_docs[self.tokens[i]]
+            i += 1
+        return docs
+
+    def _substring_docs(self, query):
+        """Documents whose name contains query (ignoring spaces)"""
+        query_grams = ngrams(query, MAX_GRAM)
+        postings = sorted((self.grams.get(gram, set()) for gram in query_grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set.intersection(*postings)
+        return {doc_id for doc_id in candidates if query in self.names[doc_id].replace(" ", "")}
+
+    def _fuzzy_scores(self, query):
+        """Share of the query's n-grams found in each document, above the threshold"""
+        # Queries this short are already covered by prefix and substring matching
+        if len(query) < 2 or (len(query) < 3 and not CJK_RE.search(query)):
+            return {}
+        n = 2 if CJK_RE.search(query) or len(query) < 4 else MAX_GRAM
+        query_grams = ngrams(query, n)
+        if not query_grams:
+            return {}
+        counts = Counter()
+        for gram in query_grams:
+            counts.update(self.grams.get(gram, ()))
+        return {
+            doc_id: count / len(query_grams)
+            for doc_id, count in counts.items()
+            if count / len(query_grams) >= FUZZY_THRESHOLD
+        }
+
+    def search(self, query, group_id=None, gender=None, offset=0, limit=None):
+        """Search avatars by name, best matches first
+
+        Returns (total, avatars) where avatars is the requested page of the
+        ranked results. An empty query lists every avatar passing the filters.
+        """
+        query = normalize(query)
+        compact_query = query.replace(" ", "")
+
+        allowed = None
+        if group_id:
+            allowed = self.by_group.get(group_id, set())
+        if gender:
+            gender_docs = self.by_gender.get(normalize(gender), set())
+            allowed = gender_docs if allowed is None else allowed & gender_docs
+
+        scores = {}
+        if not compact_query:
+            scores = {doc_id: 0 for doc_id in (range(len(self.avatars)) if allowed is None else allowed)}
+        else:
+            for doc_id, share in self._fuzzy_scores(compact_query).items():
+                scores[doc_id] = SCORE_FUZZY * share
+            for doc_id in self._substring_docs(compact_query):
+                scores[doc_id] = SCORE_SUBSTRING
+            # Every query word has to start some word of the name
+            query_tokens = tokenize(query, split_cjk=False)
+            prefix_docs = set.intersection(*(self._prefix_docs(token) for token in query_tokens)) if query_tokens else set()
+            for doc_id in prefix_docs:
+                scores[doc_id] = max(scores.get(doc_id, 0), SCORE_TOKEN_PREFIX)
+            for doc_id in list(scores):
+                name = self.names[doc_id]
+                if name == query:
+                    scores[doc_id] = SCORE_EXACT
+                elif name.startswith(query):
+                    scores[doc_id] = SCORE_NAME_PREFIX
+            if allowed is not None:
+                scores = {doc_id: score for doc_id, score in scores.items() if doc_id in allowed}
+
+        # Best score first, then shorter names, then catalog order
+        rank_key = lambda doc_id: (-scores[doc_id], len(self.names[doc_id]), doc_id)
+        if limit is None:
+            ranked = sorted(scores, key=rank_key)[offset:]
+        else:
+            ranked = heapq.nsmallest(offset + limit, scores, key=rank_key)[offset:]
+        return len(scores), [self.avatars[doc_id] for doc_id in ranked]
@@ -0,0 +1,265 @@
+"""Render a CSV or JSONL file of scripts to MP4s without the web app
+
+Each row needs talking_photo_id, language, gender, age and text; an optional
+output column names the MP4. Renders go through the same voice catalog and
+render queue as the chat, with a render cache of their own, so repeated rows
+cost nothing. Progress is checkpointed to a manifest, and running the same
+command again picks up where it stopped.
+
+    python batch_render.py rows.csv --out videos
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Local modules read their settings from the environment, so import them after .env is loaded
+import video_join
+from job_tracker import JobTracker
+from render_cache import RenderCache
+from render_queue import FINISHED_STATUSES, RenderQueue
+from text_segmentation import split_text
+from voice_catalog import load_voice_catalog
+
+# Renders submitted but not finished at any one time
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("HEYGEN_BATCH_MAX_IN_FLIGHT", "8"))
+
+# Upper bound on new renders submitted per second
+DEFAULT_SUBMITS_PER_SECOND = float(os.getenv("HEYGEN_BATCH_SUBMITS_PER_SECOND", "1"))
+
+# Finished videos downloaded at the same time
+DEFAULT_DOWNLOAD_WORKERS = int(os.getenv("HEYGEN_BATCH_DOWNLOAD_WORKERS", "4"))
+
+# Render cache of the batch. It is kept apart from the chat app's, as each
+# process holds its cache index in memory and rewrites the whole file.
+DEFAULT_BATCH_CACHE_DIR = os.getenv("HEYGEN_BATCH_CACHE_DIR", os.path.join(".cache", "batch"))
+
+# How often the batch checks on its renders (seconds)
+PROGRESS_INTERVAL = 2
+
+REQUIRED_COLUMNS = ("talking_photo_id", "language", "gender", "age", "text")
+
+def read_rows(path):
+    """Read batch rows from a .csv or .jsonl file"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    for number, row in enumerate(rows, 1):
+        missing = [column for column in REQUIRED_COLUMNS if not str(row.get(column) or "").strip()]
+        if missing:
+            raise ValueError(f"Row {number} is missing {', '.join(missing)}")
+    return rows
+
+def row_key(row):
+    """Identify a row by its content so a manifest survives rows being reordered or added"""
+    values = [str(row.get(column, "")).strip() for column in REQUIRED_COLUMNS + ("output",)]
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def output_name(number, row):
+    """File name of a row's MP4"""
+    name = str(row.get("output") or "").strip()
+    if name:
+        return name if name.lower().endswith(".mp4") else f"{name}.mp4"
+    return f"{number:05d}_{row['talking_photo_id']}_{row['language']}.mp4"
+
+def load_manifest(path):
+    """Load the manifest of a previous run, or start a new one"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(path, manifest):
+    """Write the manifest atomically"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+def download_render(job, path, render_cache):
+    """Save a finished render to path, returns (success, error_message)
+
+    The video is copied from the render cache's local mirror, waiting for the
+    mirror download if it is still running so the video is fetched only once.
+    """
+    source = job.get("video_path")
+    if not (source and os.path.exists(source)) and job.get("video_url"):
+        source = render_cache.mirror(job["cache_key"], job["video_url"])
+    if not source:
+        return False, "Render has no video to download"
+    shutil.copyfile(source, path)
+    return True, None
+
+def run_batch(rows, out_dir, manifest_path, max_in_flight=None, submits_per_second=None,
+              download_workers=None, retry_failed=False, api_key=None, cache_dir=None):
+    """Render every row, returns the manifest
+
+    At most max_in_flight renders are pending at once and new ones are
+    submitted at no more than submits_per_second. Finished videos are
+    downloaded by a pool of download_workers while other rows render.
+    cache_dir holds the batch's render cache.
+    """
+    max_in_flight = max_in_flight or DEFAULT_MAX_IN_FLIGHT
+    min_gap = 1.0 / (submits_per_second or DEFAULT_SUBMITS_PER_SECOND)
+    api_key = api_key or os.getenv("HEYGEN_API_KEY")
+    os.makedirs(out_dir, exist_ok=True)
+
+    catalog = load_voice_catalog(api_key)
+    cache_dir = cache_dir or DEFAULT_BATCH_CACHE_DIR
+    render_cache = RenderCache(
+        path=os.path.join(cache_dir, "render_cache.json"),
+        video_dir=os.path.join(cache_dir, "videos")
+    )
+    # The batch keeps its own queue file next to the manifest so it can resume its renders
+    queue = RenderQueue(
+        JobTracker(),
+        state_path=f"{manifest_path}.queue.json",
+        api_key=api_key,
+        render_cache=render_cache
+    )
+    downloads = ThreadPoolExecutor(max_workers=download_workers or DEFAULT_DOWNLOAD_WORKERS, thread_name_prefix="batch-download")
+
+    manifest = load_manifest(manifest_path)
+    entries = []
+    seen = {}
+    for number, row in enumerate(rows, 1):
+        key = row_key(row)
+        # Identical rows each get their own entry
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key}#{seen[key]}"
+        entry = manifest.setdefault(key, {"row": number, "status": "waiting", "job_id": None, "path": None, "error": None})
+        entry["row"] = number
+        if entry["status"] == "failed" and retry_failed:
+            entry.update(status="waiting", job_id=None, error=None)
+        # A render or download interrupted by the last run is picked up again
+        if entry["status"] in ("rendering", "downloading") and queue.get(entry["job_id"]) is None:
+            entry.update(status="waiting", job_id=None)
+        entries.append((row, entry))
+    save_manifest(manifest_path, manifest)
+
+    def download(number, row, job):
+        """Save one row's video, returns (path, error_message); the main loop updates the manifest"""
+        path = os.path.join(out_dir, output_name(number, row))
+        try:
+            success, error = download_render(job, path, render_cache)
+        except Exception as e:
+            success, error = False, f"Error saving video: {str(e)}"
+        return (path, None) if success else (None, error)
+
+    futures = {}
+    last_submit = 0.0
+    total = len(entries)
+    while True:
+        changed = False
+        in_flight = 0
+        next_submit = None
+        for row, entry in entries:
+            if entry["status"] == "rendering":
+                job = queue.get(entry["job_id"])
+                if job["status"] == "completed":
+                    entry["status"] = "downloading"
+                    changed = True
+                elif job["status"] in FINISHED_STATUSES:
+                    entry.update(status="failed", error=job["error"])
+                    changed = True
+                else:
+                    in_flight += 1
+            if entry["status"] == "downloading" and entry["row"] not in futures:
+                futures[entry["row"]] = (entry, downloads.submit(download, entry["row"], row, queue.get(entry["job_id"])))
+
+        for row, entry in entries:
+            if entry["status"] != "waiting" or in_flight >= max_in_flight:
+                continue
+            wait = last_submit + min_gap - time.monotonic()
+            if wait > 0:
+                next_submit = wait
+                break
+            voice_id = catalog.voice_id(row["language"], row["gender"], row["age"])
+            if not voice_id:
+                entry.update(status="failed", error=f"No voice for {row['language']} {row['gender']} {row['age']}")
+                changed = True
+                continue
+            segments = split_text(row["text"], row["language"]) if video_join.ffmpeg_available() else [row["text"]]
+            if len(segments) > 1:
+                job_id = queue.enqueue_segments(row["talking_photo_id"], row["text"], voice_id, segments)
+            else:
+                job_id = queue.enqueue(row["talking_photo_id"], row["text"], voice_id)
+            entry.update(status="rendering", job_id=job_id)
+            last_submit = time.monotonic()
+            in_flight += 1
+            changed = True
+
+        for number, (entry, future) in list(futures.items()):
+            if future.done():
+                path, error = future.result()
+                if error is None:
+                    entry.update(status="done", path=path)
+                else:
+                    entry.update(status="failed", error=error)
+                del futures[number]
+                changed = True
+
+        counts = {}
+        for _, entry in entries:
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        if changed:
+            save_manifest(manifest_path, manifest)
+            print(f"[{counts.get('done', 0)}/{total}] " + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+        if counts.get("done", 0) + counts.get("failed", 0) == total and not futures:
+            break
+        # Wake up for the next submit slot rather than a whole progress interval
+        time.sleep(min(PROGRESS_INTERVAL, next_submit or PROGRESS_INTERVAL))
+
+    downloads.shutdown()
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a CSV or JSONL file of scripts to talking photo videos")
+    parser.add_argument("rows", help="CSV or JSONL with talking_photo_id, language, gender, age, text and optional output")
+    parser.add_argument("--out", default="videos", help="Directory the MP4s are written to")
+    parser.add_argument("--manifest", help="Progress file used to resume (default: <rows>.manifest.json)")
+    parser.add_argument("--max-in-flight", type=int, help=f"Renders pending at once (default {DEFAULT_MAX_IN_FLIGHT})")
+    parser.add_argument("--submits-per-second", type=float, help=f"New renders per second (default {DEFAULT_SUBMITS_PER_SECOND})")
+    parser.add_argument("--download-workers", type=int, help=f"Parallel downloads (default {DEFAULT_DOWNLOAD_WORKERS})")
+    parser.add_argument("--retry-failed", action="store_true", help="Render rows that failed in an earlier run again")
+    parser.add_argument("--cache-dir", help=f"Render cache of the batch (default {DEFAULT_BATCH_CACHE_DIR})")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("HEYGEN_API_KEY"):
+        print("HEYGEN_API_KEY is not set")
+        return 1
+    try:
+        rows = read_rows(args.rows)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.rows}: {str(e)}")
+        return 1
+
+    manifest = run_batch(
+        rows,
+        args.out,
+        args.manifest or f"{args.rows}.manifest.json",
+        max_in_flight=args.max_in_flight,
+        submits_per_second=args.submits_per_second,
+        download_workers=args.download_workers,
+        retry_failed=args.retry_failed,
+        cache_dir=args.cache_dir
+    )
+    failed = [entry for entry in manifest.values() if entry["status"] == "failed"]
+    for entry in sorted(failed, key=lambda entry: entry["row"]):
+        print(f"Row {entry['row']} failed: {entry['error']}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
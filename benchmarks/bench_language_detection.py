@@ -0,0 +1,70 @@
+"""Micro-benchmark for language_detection.detect_language
+
+Compares per-character throughput with the previous implementation on
+inputs the size of pasted paragraphs. Run from the repository root:
+
+    python benchmarks/bench_language_detection.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language_detection import detect_language
+
+def previous_detect_language(text):
+    """The detector as it was before the single-pass rewrite
+
+    The original wrapped the accent checks in any(), which raised TypeError
+    on a bool; the checks are kept as plain expressions so it can be timed.
+    """
+    if any('\u4e00' <= char <= '\u9fff' for char in text):
+        return "zh"
+    if any('\u3040' <= char <= '\u30ff' for char in text):
+        return "ja"
+    if any('\uac00' <= char <= '\ud7a3' for char in text):
+        return "ko"
+    spanish_words = ["el", "la", "los", "las", "un", "una", "y", "o", "pero", "porque", "como", "qué", "cuándo", "dónde"]
+    words = text.lower().split()
+    if any(word in spanish_words for word in words) and ('á' in text or 'é' in text or 'í' in text or 'ó' in text or 'ú' in text or 'ñ' in text):
+        return "es"
+    french_words = ["le", "la", "les", "un", "une", "des", "et", "ou", "mais", "parce", "que", "comment", "quand", "où"]
+    if any(word in french_words for word in words) and ('é' in text or 'è' in text or 'ê' in text or 'ç' in text or 'à' in text):
+        return "fr"
+    return "en"
+
+# The previous detector stops at the first CJK character and the current one
+# after CJK_WINDOW of them (so Japanese starting with a kanji heading is not
+# taken for "zh"). CJK inputs therefore take constant time whatever their
+# length and their figures only compare that fixed cost. The mixed sample
+# puts the CJK text at the end of an English paragraph.
+SAMPLES = {
+    "en": "The quick brown fox jumps over the lazy dog while the band plays on. ",
+    "es": "El rápido zorro marrón salta sobre el perro perezoso mientras la banda toca. ",
+    "fr": "Le renard brun très rapide saute par-dessus le chien paresseux et la fanfare joue à côté. ",
+    "zh": "敏捷的棕色狐狸跳过了懒狗，乐队继续演奏。",
+    "ja": "素早い茶色の狐がのろまな犬を飛び越え、楽団は演奏を続ける。",
+    "ko": "빠른 갈색 여우가 게으른 개를 뛰어넘고 밴드는 연주를 계속한다. ",
+}
+MIXED_SAMPLE = SAMPLES["en"] * 55 + "谢谢"
+
+def characters_per_second(detect, text, number):
+    """Time detect(text) and return its throughput in characters per second"""
+    seconds = min(timeit.repeat(lambda: detect(text), number=number, repeat=5))
+    return len(text) * number / seconds
+
+def main():
+    inputs = [(language, sentence * (4000 // len(sentence))) for language, sentence in SAMPLES.items()]
+    inputs.append(("en+zh", MIXED_SAMPLE))
+    print(f"{'sample':<8}{'chars':>8}{'previous':>16}{'current':>16}{'speedup':>10}  detected (previous)")
+    for name, text in inputs:
+        previous = characters_per_second(previous_detect_language, text, 50)
+        current = characters_per_second(detect_language, text, 50)
+        print(
+            f"{name:<8}{len(text):>8}{previous / 1e6:>13.1f} M/s{current / 1e6:>13.1f} M/s"
+            f"{current / previous:>9.1f}x  {detect_language(text)} ({previous_detect_language(text)})"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Concurrent-session load benchmark for the two Streamlit apps
+
+Drives N simulated sessions at once through real flows of
+avatar_generation.py and text_to_avatar_speech.py with Streamlit's AppTest,
+against mock_heygen.py running in the same process. For each flow it reports
+rerun latency percentiles, completed flows per second, and the threads and
+resident memory each extra session holds, and compares them with the stored
+baseline so regressions show up. Run from the repository root:
+
+    python benchmarks/bench_sessions.py --sessions 8
+    python benchmarks/bench_sessions.py --sessions 8 --save-baseline
+
+Every session runs in this one process, as they do under `streamlit run`,
+so cache_resource singletons such as the job tracker and render queue are
+shared the same way. AppTest skips the browser and websocket, so the
+latencies are script time only. Baselines depend on the machine; refresh
+them with --save-baseline after a deliberate change.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "sessions.json")
+DASHBOARD_PATH = os.path.join(ROOT, "avatar_generation.py")
+CHAT_PATH = os.path.join(ROOT, "text_to_avatar_speech.py")
+PASSWORD = "chatbot"
+
+# Metrics where a larger value is a regression, with the smallest increase that
+# counts, since small absolute changes are mostly noise; throughput is the other way round
+LOWER_IS_BETTER = {
+    "p50_ms": 50,
+    "p95_ms": 50,
+    "p99_ms": 50,
+    "threads_per_session": 0.5,
+    "rss_mb_per_session": 1
+}
+
+class FlowError(Exception):
+    """A simulated session did not reach the end of its flow"""
+
+class Session:
+    """One simulated browser session driving an app through AppTest"""
+
+    def __init__(self, script_path, refresh_seconds, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(script_path, default_timeout=timeout)
+        self.refresh_seconds = refresh_seconds
+        self.timeout = timeout
+        self.latencies = []
+
+    def run(self):
+        """Rerun the script and record how long it took"""
+        start = time.perf_counter()
+        self.at.run()
+        self.latencies.append(time.perf_counter() - start)
+        if self.at.exception:
+            raise FlowError(self.at.exception[0].value)
+
+    def click(self, label=None, key=None):
+        """Click a button by key or label and rerun"""
+        if key is not None:
+            button = self.at.button(key=key)
+        else:
+            matches = [button for button in self.at.button if button.label == label]
+            if not matches:
+                raise FlowError(f"No button labelled {label!r}")
+            button = matches[0]
+        button.click()
+        self.run()
+
+    def wait_for(self, done, what):
+        """Rerun every refresh_seconds, as the app's auto-refreshing fragments do, until done(at)"""
+        deadline = time.monotonic() + self.timeout
+        while not done(self.at):
+            if time.monotonic() > deadline:
+                raise FlowError(f"Timed out waiting for {what}")
+            time.sleep(self.refresh_seconds)
+            self.run()
+
+def share_app_test_runtime():
+    """Let AppTest sessions run from several threads at once
+
+    AppTest installs a mock Runtime for each run and removes it when the run
+    ends, and compiles the script again every time; both break when another
+    session is mid-run (CPython's ast.parse is not thread-safe). Under
+    `streamlit run` every session shares one Runtime and one script cache,
+    so keep the last mock Runtime available and share one script cache.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+        runtime = cls._instance or last.get("runtime")
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+
+    get_bytecode = ScriptCache.get_bytecode
+    shared_cache = ScriptCache()
+    compile_lock = threading.Lock()
+
+    def shared_get_bytecode(self, script_path):
+        with compile_lock:
+            return get_bytecode(shared_cache, script_path)
+
+    ScriptCache.get_bytecode = shared_get_bytecode
+
+def has_text(elements, text):
+    """Check whether any element of an AppTest element list contains text"""
+    return any(text in str(element.value) for element in elements)
+
+def sample_photo():
+    """A small JPEG for the upload flow"""
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (640, 640), (180, 140, 120)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def log_in_to_dashboard(session):
+    session.run()
+    session.at.text_input(key="login_password").input(PASSWORD)
+    session.click(key="login_submit")
+
+def search_flow(session, number):
+    """Log in, open Search Avatars and search by name"""
+    log_in_to_dashboard(session)
+    session.click(key="search_avatars_button")
+    session.at.text_input[0].input("Demo")
+    session.click("Search")
+    if not has_text(session.at.success, "Found"):
+        raise FlowError("Search returned no avatars")
+
+def train_flow(session, number):
+    """Log in, upload a photo, create an avatar group and wait for training"""
+    log_in_to_dashboard(session)
+    session.click(key="train_photo_button")
+    session.at.text_input[0].input(f"Benchmark Avatar {number}")
+    session.click("Continue to Step 2")
+    session.at.file_uploader[0].set_value((f"photo{number}.jpg", sample_photo(), "image/jpeg"))
+    session.run()
+    session.at.text_area[0].input("Business attire, plain background")
+    session.click("Continue to Step 3")
+    session.click("Create Avatar Group")
+    session.click("Start Training")
+    session.wait_for(
+        lambda at: has_text(at.success, "Training completed") or has_text(at.error, "Training failed"),
+        "training"
+    )
+    if not has_text(session.at.success, "Training completed"):
+        raise FlowError("Training failed")
+
+def generate_flow(session, number):
+    """Log in, generate AI photos and wait for the images"""
+    log_in_to_dashboard(session)
+    session.click(key="generate_photo_button")
+    session.click("Generate Images")
+    session.wait_for(
+        lambda at: has_text(at.success, "Images generated") or has_text(at.error, "Generation failed"),
+        "photo generation"
+    )
+    if not has_text(session.at.success, "Images generated"):
+        raise FlowError("Photo generation failed")
+
+def chat_flow(session, number):
+    """Log in to the chat app, send a message and wait for its video"""
+    session.run()
+    session.at.text_input[0].input(PASSWORD)
+    session.run()
+    # A unique message per session so every render misses the render cache
+    session.at.chat_input[0].set_value(f"Hello from benchmark session {number}, {uuid.uuid4().hex[:8]}")
+    session.run()
+
+    def finished(at):
+        message = at.session_state.messages[-1]
+        return bool(message.get("video_url") or message.get("render_error"))
+
+    session.wait_for(finished, "the video")
+    if not session.at.session_state.messages[-1].get("video_url"):
+        raise FlowError(session.at.session_state.messages[-1]["render_error"])
+
+FLOWS = {
+    "search": (DASHBOARD_PATH, search_flow),
+    "train": (DASHBOARD_PATH, train_flow),
+    "generate": (DASHBOARD_PATH, generate_flow),
+    "chat": (CHAT_PATH, chat_flow),
+}
+
+def rss_bytes():
+    """Resident memory of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # Peak rather than current outside Linux; kilobytes there, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class ResourceSampler:
+    """Background sampler of the peak thread count and resident memory"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self.peak_rss = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="bench-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            # Leave out the sampler itself
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+def run_flow(name, sessions, refresh_seconds, timeout):
+    """Run one flow in sessions concurrent sessions and return its metrics"""
+    script_path, flow = FLOWS[name]
+    results = [None] * sessions
+    latencies = []
+
+    def run_session(number):
+        session = Session(script_path, refresh_seconds, timeout)
+        try:
+            flow(session, number)
+        except Exception as e:
+            results[number] = f"{type(e).__name__}: {e}"
+        latencies.extend(session.latencies)
+
+    # One unmeasured session first, so imports and shared singletons are not billed per session
+    run_session(0)
+    latencies.clear()
+
+    threads_before = threading.active_count()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    with ResourceSampler() as sampler:
+        workers = [threading.Thread(target=run_session, args=(number,)) for number in range(sessions)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    elapsed = time.perf_counter() - start
+
+    errors = [error for error in results if error]
+    for error in sorted(set(errors)):
+        print(f"  {name}: {errors.count(error)} session(s) failed: {error}", file=sys.stderr)
+    completed = sessions - len(errors)
+    return {
+        "sessions": sessions,
+        "completed": completed,
+        "reruns": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "flows_per_second": round(completed / elapsed, 3),
+        # The runner threads are the benchmark's own, not held by the sessions
+        "threads_per_session": round(max(0, sampler.peak_threads - threads_before - sessions) / sessions, 2),
+        "rss_mb_per_session": round((sampler.peak_rss - rss_before) / sessions / 1024 / 1024, 2)
+    }
+
+def run_flow_repeatedly(name, sessions, runs, refresh_seconds, timeout):
+    """Run a flow several times and take the median of each metric, as single runs are noisy"""
+    results = [run_flow(name, sessions, refresh_seconds, timeout) for _ in range(runs)]
+    return {
+        metric: type(results[0][metric])(statistics.median(result[metric] for result in results))
+        for metric in results[0]
+    }
+
+def compare(result, baseline, tolerance):
+    """List the metrics of a result that are worse than the baseline by more than tolerance"""
+    regressions = []
+    if result["completed"] < baseline.get("completed", result["sessions"]):
+        regressions.append(f"completed {baseline['completed']} -> {result['completed']}")
+    for metric, value in result.items():
+        previous = baseline.get(metric)
+        if not isinstance(previous, (int, float)) or metric in ("sessions", "completed", "reruns"):
+            continue
+        if metric in LOWER_IS_BETTER:
+            worse = value > previous * (1 + tolerance) and value - previous > LOWER_IS_BETTER[metric]
+        else:
+            worse = value < previous * (1 - tolerance)
+        if worse:
+            regressions.append(f"{metric} {previous} -> {value}")
+    return regressions
+
+def load_baselines(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_baselines(path, baselines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def free_port():
+    """An unused local TCP port for the mock API"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit apps with concurrent simulated sessions")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions per flow")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per flow; the median of each metric is reported")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="Comma-separated flows to run")
+    parser.add_argument("--refresh", type=float, default=1.0, help="Seconds between reruns while waiting on a job")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds a session may wait for one step")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock API response delay (seconds)")
+    parser.add_argument("--job-seconds", type=float, default=3, help="Mock video render duration")
+    parser.add_argument("--photo-seconds", type=float, default=2, help="Mock photo generation duration")
+    parser.add_argument("--training-seconds", type=float, default=3, help="Mock training duration")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the apps' own output")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        # Streamlit's deprecation and bare-mode warnings, logged on every rerun
+        logging.disable(logging.WARNING)
+
+    # The API hosts are read when the apps' modules are imported, so set them first
+    base_url = f"http://127.0.0.1:{free_port()}"
+    os.environ.update({
+        "HEYGEN_API_BASE_URL": base_url,
+        "HEYGEN_UPLOAD_BASE_URL": base_url,
+        "HEYGEN_API_KEY": os.getenv("HEYGEN_API_KEY", "benchmark"),
+        "HEYGEN_VIDEO_SERVER_PORT": "0",
+        "HEYGEN_METRICS_PORT": "0",
+        "HEYGEN_CHAT_METRICS_PORT": "0"
+    })
+    from mock_heygen import MockHeyGenServer, MockSettings
+
+    settings = MockSettings(
+        latency=args.latency,
+        latency_jitter=args.latency,
+        job_seconds=args.job_seconds,
+        photo_seconds=args.photo_seconds,
+        training_seconds=args.training_seconds,
+        groups=20,
+        seed=1
+    )
+    server = MockHeyGenServer(settings, port=int(base_url.rsplit(":", 1)[1])).start()
+
+    # The apps keep their caches under .cache relative to the working directory
+    working_directory = tempfile.mkdtemp(prefix="bench-sessions-")
+    os.chdir(working_directory)
+
+    share_app_test_runtime()
+    baselines = load_baselines(args.baseline)
+    quiet = open(os.devnull, "w")
+    regressions = {}
+    print(f"{'flow':<10}{'sessions':>9}{'done':>6}{'reruns':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'flows/s':>9}{'threads/s':>11}{'RSS MB/s':>10}")
+    for name in args.flows.split(","):
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+            result = run_flow_repeatedly(name, args.sessions, args.runs, args.refresh, args.timeout)
+        print(f"{name:<10}{result['sessions']:>9}{result['completed']:>6}{result['reruns']:>8}"
+              f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}{result['flows_per_second']:>9}"
+              f"{result['threads_per_session']:>11}{result['rss_mb_per_session']:>10}")
+        key = f"{name}@{args.sessions}"
+        if args.save_baseline:
+            baselines[key] = result
+        elif key in baselines:
+            regressions[key] = compare(result, baselines[key], args.tolerance)
+    server.stop()
+    print(f"Mock API served {server.state.requests} requests")
+
+    if args.save_baseline:
+        save_baselines(args.baseline, baselines)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    failed = {key: found for key, found in regressions.items() if found}
+    for key, found in failed.items():
+        print(f"REGRESSION in {key}: {', '.join(found)}")
+    if regressions and not failed:
+        print("No regressions against the baseline")
+    if not regressions:
+        print("No baseline for these flows and session count; run with --save-baseline to store one")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
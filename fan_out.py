@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# Default number of concurrent requests allowed in flight per fan-out
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("HEYGEN_MAX_IN_FLIGHT", "8"))
+
+def fan_out(func, items, max_in_flight=None):
+    """Call func on every item concurrently and return the results in input order
+
+    At most max_in_flight calls run at the same time. A call that raises puts
+    None in its slot so callers can skip it the same way they skip failed requests.
+    """
+    items = list(items)
+    max_in_flight = max(1, max_in_flight or DEFAULT_MAX_IN_FLIGHT)
+
+    def safe_call(item):
+        try:
+            return func(item)
+        except Exception as e:
+            log.warning("Error in fan-out call", item=repr(item), error=str(e))
+            return None
+
+    # No point paying for a thread pool for zero or one call
+    if len(items) <= 1 or max_in_flight == 1:
+        return [safe_call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(items))) as executor:
+        return list(executor.map(safe_call, items))
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import api_metrics
+import rate_limiter
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# HeyGen API hosts; point these at mock_heygen.py to work offline
+API_BASE_URL = os.getenv("HEYGEN_API_BASE_URL", "https://api.heygen.com").rstrip("/")
+UPLOAD_BASE_URL = os.getenv("HEYGEN_UPLOAD_BASE_URL", "https://upload.heygen.com").rstrip("/")
+
+# Connection pool size per host; should cover the largest fan-out plus a few polling threads
+POOL_SIZE = int(os.getenv("HEYGEN_POOL_SIZE", "16"))
+
+# (connect, read) timeouts in seconds so a hung socket cannot block a worker forever
+DEFAULT_TIMEOUT = (
+    float(os.getenv("HEYGEN_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("HEYGEN_READ_TIMEOUT", "30")),
+)
+
+# Uploads send the whole file before the server answers, so allow a longer read timeout
+UPLOAD_TIMEOUT = (DEFAULT_TIMEOUT[0], float(os.getenv("HEYGEN_UPLOAD_TIMEOUT", "120")))
+
+# Transport-level retries. Connection failures are retried for every method since the
+# request never reached the server; gateway errors only for idempotent requests so a
+# render or upload is never submitted twice.
+MAX_RETRIES = int(os.getenv("HEYGEN_MAX_RETRIES", "3"))
+
+# Requests answered with 429 are retried this many times after the Retry-After delay
+RATE_LIMIT_RETRIES = int(os.getenv("HEYGEN_RATE_LIMIT_RETRIES", "3"))
+
+# How long a successful API key validation is trusted (seconds)
+KEY_VALIDATION_TTL = float(os.getenv("HEYGEN_KEY_VALIDATION_TTL", "600"))
+
+_session = None
+_session_lock = threading.Lock()
+
+_limiter = None
+
+# API key -> monotonic time it was last validated
+_validated_keys = {}
+_validated_keys_lock = threading.Lock()
+
+def create_session(pool_size=None, max_retries=None):
+    """Create a requests session with keep-alive pooling, retries and gzip"""
+    pool_size = pool_size or POOL_SIZE
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+def get_session():
+    """Get the session shared by every HeyGen call in this process"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def get_rate_limiter():
+    """Get the rate limiter shared by every HeyGen call in this process"""
+    global _limiter
+    if _limiter is None:
+        with _session_lock:
+            if _limiter is None:
+                _limiter = rate_limiter.RateLimiter()
+    return _limiter
+
+def endpoint_class(method, url):
+    """Rate limit bucket of a request: list, generate, upload or status
+
+    Returns None for hosts other than the HeyGen API, such as the CDN that
+    serves images and videos.
+    """
+    # Both hosts may be the same address when running against mock_heygen.py
+    if url.startswith(UPLOAD_BASE_URL) and (UPLOAD_BASE_URL != API_BASE_URL or "/v1/asset" in url):
+        return "upload"
+    if not url.startswith(API_BASE_URL):
+        return None
+    path = url[len(API_BASE_URL):].split("?")[0]
+    if not path.startswith(("/v1/", "/v2/")):
+        return None
+    if "status" in path or "/generation/" in path:
+        return "status"
+    if method.upper() == "POST":
+        return "generate"
+    return "list"
+
+def transfer_sizes(response, stream=False):
+    """Get (bytes sent, bytes received, transport retries) of a response for the metrics
+
+    A streamed response without a Content-Length counts as 0 bytes received,
+    as reading it here would consume it.
+    """
+    sent = int(response.request.headers.get("Content-Length") or 0)
+    received = response.headers.get("Content-Length")
+    if received is None and not stream:
+        received = len(response.content)
+    retries = getattr(response.raw, "retries", None)
+    return sent, int(received or 0), len(retries.history) if retries else 0
+
+def body_streams(kwargs):
+    """Get (stream, position) of each file-like part of a request body, for rewinding before a resend
+
+    Returns None if the body cannot be sent again, such as a generator or a
+    file that cannot seek. Bodies held in memory need no rewinding.
+    """
+    parts = [kwargs.get("data")]
+    files = kwargs.get("files")
+    if files:
+        values = files.values() if isinstance(files, dict) else [value for _, value in files]
+        # A file may be given as (filename, fileobj, ...)
+        parts.extend(value[1] if isinstance(value, (tuple, list)) else value for value in values)
+
+    streams = []
+    for part in parts:
+        if part is None or isinstance(part, (bytes, bytearray, str, dict, list, tuple)):
+            continue
+        if not hasattr(part, "seek") or not getattr(part, "seekable", lambda: True)():
+            return None
+        try:
+            streams.append((part, part.tell()))
+        except OSError:
+            return None
+    return streams
+
+def is_key_validated(api_key):
+    """Check whether the key was validated within the last KEY_VALIDATION_TTL seconds"""
+    with _validated_keys_lock:
+        validated_at = _validated_keys.get(api_key)
+    return validated_at is not None and time.monotonic() - validated_at < KEY_VALIDATION_TTL
+
+def remember_key_validated(api_key):
+    """Record a successful validation of the key"""
+    with _validated_keys_lock:
+        _validated_keys[api_key] = time.monotonic()
+
+def invalidate_key(api_key):
+    """Forget a key's validation so the next check goes to the API"""
+    with _validated_keys_lock:
+        _validated_keys.pop(api_key, None)
+
+def request(method, url, **kwargs):
+    """Send a request through the shared session with a default timeout
+
+    HeyGen API calls first wait for a token from their endpoint class's
+    bucket, background threads behind interactive ones. A 429 pauses the
+    bucket for the Retry-After delay and the request is sent again, as it
+    was not processed. File-like bodies are rewound first; a body that
+    cannot be rewound is not sent again.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    endpoint = endpoint_class(method, url)
+    metrics = api_metrics.get_metrics()
+    name = api_metrics.endpoint_name(method, url)
+    # A streamed body has to be rewound before it can be sent again
+    streams = body_streams(kwargs)
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        if endpoint is not None:
+            waiting_since = time.monotonic()
+            get_rate_limiter().acquire(endpoint)
+            metrics.waited(name, time.monotonic() - waiting_since)
+        started = metrics.start(name)
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except Exception as e:
+            metrics.finish(name, started, type(e).__name__)
+            raise
+        metrics.finish(name, started, response.status_code, *transfer_sizes(response, kwargs.get("stream")))
+        if response.status_code != 429 or endpoint is None or attempt == RATE_LIMIT_RETRIES or streams is None:
+            break
+
+        metrics.retry(name, "rate_limited")
+        delay = rate_limiter.parse_retry_after(response.headers.get("Retry-After"))
+        log.warning("Rate limited, retrying", endpoint=name, bucket=endpoint, delay_seconds=round(delay, 1))
+        get_rate_limiter().pause(endpoint, delay)
+        for stream, position in streams:
+            stream.seek(position)
+
+    # Any call rejecting the key means the cached validation is wrong
+    if response.status_code in (401, 403):
+        api_key = (kwargs.get("headers") or {}).get("X-Api-Key")
+        if api_key:
+            invalidate_key(api_key)
+    return response
+
+def get(url, **kwargs):
+    """Send a GET request through the shared session"""
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    """Send a POST request through the shared session"""
+    return request("POST", url, **kwargs)
@@ -0,0 +1,151 @@
+import json
+import os
+
+import heygen_client
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+HEYGEN_API_URL = f"{heygen_client.API_BASE_URL}/v2"
+
+# Statuses HeyGen reports while a video is still being rendered
+IN_PROGRESS_STATUSES = ("pending", "processing", "waiting")
+
+def get_headers(api_key=None):
+    """Get the headers for video API requests"""
+    return {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "X-Api-Key": api_key or os.getenv("HEYGEN_API_KEY")
+    }
+
+def build_video_payload(character_id, text, voice_id):
+    """Build the v2 video/generate payload for a talking photo"""
+    return {
+        "video_inputs": [
+            {
+                "character": {
+                    "type": "talking_photo",
+                    "talking_photo_id": character_id
+                },
+                "voice": {
+                    "type": "text",
+                    "input_text": text,
+                    "voice_id": voice_id
+                },
+                "background": {
+                    "type": "color",
+                    "value": "#ffffff"  # White background
+                }
+            }
+        ],
+        "dimension": {
+            "width": 720,  # Lower resolution for free tier
+            "height": 406   # 16:9 aspect ratio
+        },
+        "test": True,  # Enable test mode for the free tier
+        "title": "Text to Avatar Speech"
+    }
+
+def build_v1_payload(character_id, text, voice_id):
+    """Build the v1 video.task payload used when the v2 endpoint fails"""
+    return {
+        "talking_photo_id": character_id,
+        "voice_type": "text",
+        "voice_input": text,
+        "voice_id": voice_id,
+        "background": "#ffffff",
+        "test": True,
+        "title": "Text to Avatar Speech"
+    }
+
+def get_error_message(response):
+    """Turn an error response into a readable message"""
+    error_message = "Unknown error"
+    try:
+        # Try to parse the error JSON
+        error_json = response.json()
+        if "error" in error_json and error_json["error"]:
+            if isinstance(error_json["error"], dict) and "message" in error_json["error"]:
+                error_message = f"Error: {error_json['error']['message']}"
+                if "detail" in error_json["error"]:
+                    error_message += f" - {error_json['error']['detail']}"
+            else:
+                error_message = f"Error: {error_json['error']}"
+        elif "message" in error_json:
+            error_message = f"Error: {error_json['message']}"
+    except Exception:
+        # If we can't parse JSON, use the raw text
+        error_message = f"Error creating video (HTTP {response.status_code}): {response.text}"
+    return error_message
+
+def submit_video(character_id, text, voice_id, api_key=None):
+    """Submit a talking photo render, trying v2 first and falling back to v1
+
+    Returns (success, video_id_or_error_message).
+    """
+    headers = get_headers(api_key)
+    try:
+        response = heygen_client.post(
+            f"{HEYGEN_API_URL}/video/generate",
+            headers=headers,
+            data=json.dumps(build_video_payload(character_id, text, voice_id))
+        )
+
+        # If v2 fails, try v1 endpoint
+        if response.status_code != 200:
+            log.response("V2 video/generate failed, trying v1", response)
+            response = heygen_client.post(
+                f"{heygen_client.API_BASE_URL}/v1/video.task",
+                headers=headers,
+                json=build_v1_payload(character_id, text, voice_id)
+            )
+
+        if response.status_code != 200:
+            return False, get_error_message(response)
+
+        # v1 API returns data with task_id, v2 returns data with video_id
+        response_data = response.json().get("data", {}) or {}
+        video_id = response_data.get("task_id") or response_data.get("video_id")
+        if not video_id:
+            return False, "Failed to get video ID"
+        return True, video_id
+    except Exception as e:
+        return False, f"Error with API: {e}"
+
+def format_failure(error_details):
+    """Format the error of a failed render"""
+    if isinstance(error_details, dict):
+        error_text = f"Video generation failed: {error_details.get('message', 'Unknown error')}"
+        if error_details.get("detail"):
+            error_text += f". {error_details['detail']}"
+        if error_details.get("code"):
+            error_text += f" (Code: {error_details['code']})"
+        return error_text
+    return f"Video generation failed: {error_details}"
+
+def check_video_status(video_id, api_key=None):
+    """Check the status of a render, trying the v1 endpoint first and then v2
+
+    Returns (status, result) where result holds video_url or error once the
+    render has finished. Raises if neither endpoint answers, so pollers keep
+    the last known status.
+    """
+    headers = get_headers(api_key)
+    for version in ("v1", "v2"):
+        status_response = heygen_client.get(
+            f"{heygen_client.API_BASE_URL}/{version}/video_status.get?video_id={video_id}",
+            headers=headers
+        )
+        if status_response.status_code != 200:
+            continue
+
+        status_data = status_response.json().get("data", {}) or {}
+        status = status_data.get("status")
+        if status == "completed":
+            return status, {"video_url": status_data.get("video_url")}
+        if status == "failed":
+            return status, {"error": format_failure(status_data.get("error", {}))}
+        return status, {}
+
+    raise RuntimeError(f"Could not get status of video {video_id} (HTTP {status_response.status_code})")
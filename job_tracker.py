@@ -0,0 +1,210 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rate_limiter
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# Number of status requests in flight at once for the whole process
+DEFAULT_POLL_WORKERS = int(os.getenv("HEYGEN_POLL_WORKERS", "4"))
+
+# Upper bound on status requests per second for the whole process, however many jobs are pending
+DEFAULT_MAX_POLLS_PER_SECOND = float(os.getenv("HEYGEN_MAX_POLLS_PER_SECOND", "5"))
+
+# Poll interval bounds (seconds). New jobs are polled at the minimum interval and
+# the interval grows with the job's age up to the maximum.
+DEFAULT_MIN_POLL_INTERVAL = float(os.getenv("HEYGEN_MIN_POLL_INTERVAL", "2"))
+DEFAULT_MAX_POLL_INTERVAL = float(os.getenv("HEYGEN_MAX_POLL_INTERVAL", "15"))
+
+# Seconds of poll interval added per second of job age
+POLL_AGE_FACTOR = 0.1
+
+# How long finished jobs are kept around for pages to read (seconds)
+JOB_RETENTION = float(os.getenv("HEYGEN_JOB_RETENTION", "3600"))
+
+class Job:
+    """State of one tracked job, updated by the tracker's worker threads"""
+
+    def __init__(self, job_id, poll, done_statuses, min_interval, max_interval, timeout=None, created_at=None):
+        self.job_id = job_id
+        self.poll = poll
+        self.done_statuses = done_statuses
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.subscribers = []
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.created_at = created_at or time.time()
+        self.updated_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.created_at
+
+    def next_interval(self):
+        """Poll new jobs often and long-running ones rarely"""
+        return max(self.min_interval, min(self.max_interval, self.elapsed * POLL_AGE_FACTOR))
+
+class JobTracker:
+    """Process-wide status multiplexer for long-running HeyGen jobs
+
+    Every pending render, training and photo generation job is polled from one
+    schedule. At most max_workers status requests are in flight and at most
+    max_polls_per_second are started, however many jobs or users are waiting;
+    jobs tracked by several sessions are only polled once. Pages register a job
+    and then only read its state on rerun, so no script thread is held while it
+    runs. poll(job_id) returns (status, result); the job finishes when status is
+    in done_statuses, and every poll result is passed to the job's subscribers.
+    """
+
+    def __init__(self, max_workers=None, max_polls_per_second=None):
+        max_workers = max_workers or DEFAULT_POLL_WORKERS
+        self.max_polls_per_second = max_polls_per_second or DEFAULT_MAX_POLLS_PER_SECOND
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-poller")
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._jobs = {}
+        # (due, sequence, job) entries; an entry whose job was forgotten or replaced is skipped
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._scheduler = threading.Thread(target=self._run, name="job-scheduler", daemon=True)
+        self._scheduler.start()
+
+    def track(self, job_id, poll, done_statuses, min_interval=None, max_interval=None, timeout=None, on_update=None, created_at=None):
+        """Start polling a job in the background, returns its Job
+
+        A job still running after timeout seconds finishes with status
+        "timeout". on_update(job) is subscribed to the job's updates. created_at
+        lets a resumed job keep its original age. Tracking a job that is already
+        tracked adds the subscriber and returns the existing Job.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = Job(
+                    job_id,
+                    poll,
+                    frozenset(done_statuses),
+                    min_interval or DEFAULT_MIN_POLL_INTERVAL,
+                    max_interval or DEFAULT_MAX_POLL_INTERVAL,
+                    timeout,
+                    created_at
+                )
+                self._jobs[job_id] = job
+                self._schedule_poll(job, time.monotonic())
+                self._condition.notify()
+            if on_update is not None:
+                job.subscribers.append(on_update)
+            return job
+
+    def subscribe(self, job_id, callback):
+        """Call callback(job) after every poll of a tracked job"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.subscribers.append(callback)
+
+    def unsubscribe(self, job_id, callback):
+        """Stop calling callback for a job"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and callback in job.subscribers:
+                job.subscribers.remove(callback)
+
+    def get(self, job_id):
+        """Get a tracked job, or None if it is unknown"""
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        """Stop tracking a job"""
+        with self._condition:
+            self._jobs.pop(job_id, None)
+
+    def pending(self):
+        """Get the IDs of all jobs that have not finished"""
+        with self._condition:
+            return [job_id for job_id, job in self._jobs.items() if not job.done]
+
+    def _run(self):
+        """Hand due jobs to the worker pool at a bounded rate and prune old finished ones"""
+        min_gap = 1.0 / self.max_polls_per_second
+        last_dispatch = 0.0
+        while True:
+            with self._condition:
+                while not self._schedule or self._schedule[0][0] > time.monotonic():
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule else None
+                    self._condition.wait(timeout)
+                _, _, job = heapq.heappop(self._schedule)
+                current = self._jobs.get(job.job_id) is job
+                self._prune()
+            if not current or job.done:
+                continue
+
+            # Bound the overall request rate and the number of requests in flight
+            wait = last_dispatch + min_gap - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._slots.acquire()
+            last_dispatch = time.monotonic()
+            self._executor.submit(self._poll, job)
+
+    def _poll(self, job):
+        """Poll one job, schedule its next check and notify subscribers"""
+        try:
+            try:
+                # Status polls give way to requests a user is waiting on
+                with rate_limiter.background():
+                    status, result = job.poll(job.job_id)
+                error = None
+            except Exception as e:
+                status, result, error = job.status, job.result, str(e)
+                log.warning("Error polling job", job_id=job.job_id, error=error)
+        finally:
+            self._slots.release()
+
+        with self._condition:
+            job.attempts += 1
+            job.error = error
+            job.status = status
+            job.result = result
+            job.updated_at = time.time()
+
+            if status not in job.done_statuses and job.timeout and job.elapsed > job.timeout:
+                job.status = "timeout"
+            if job.status in job.done_statuses or job.status == "timeout":
+                job.finished_at = job.updated_at
+            elif self._jobs.get(job.job_id) is job:
+                self._schedule_poll(job, time.monotonic() + job.next_interval())
+                self._condition.notify()
+            subscribers = list(job.subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(job)
+            except Exception as e:
+                log.exception("Error in update callback", job_id=job.job_id)
+
+    def _schedule_poll(self, job, due):
+        """Add a job's next poll to the schedule (caller holds the lock)"""
+        heapq.heappush(self._schedule, (due, next(self._sequence), job))
+
+    def _prune(self):
+        """Drop finished jobs older than JOB_RETENTION (caller holds the lock)"""
+        cutoff = time.time() - JOB_RETENTION
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished_at < cutoff:
+                del self._jobs[job_id]
@@ -0,0 +1,96 @@
+import re
+
+# Runs of Chinese, Japanese or Korean characters
+SCRIPT_PATTERN = re.compile("[\u3040-\u30ff\u4e00-\u9fff\uac00-\ud7a3]+")
+KANA_PATTERN = re.compile("[\u3040-\u30ff]")
+HANGUL_PATTERN = re.compile("[\uac00-\ud7a3]")
+
+# Only this many CJK characters from the start of the text are counted, which
+# is enough to get past a kanji-only heading in Japanese text
+CJK_WINDOW = 256
+
+# Latin words, with apostrophes and hyphens splitting them ("qu'il", "par-dessus")
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+# Common function words; a word listed for both languages counts for both
+SPANISH_WORDS = frozenset([
+    "el", "la", "los", "las", "un", "una", "y", "o", "pero", "porque", "como",
+    "qué", "cuándo", "dónde", "de", "del", "en", "es", "por", "para", "con", "muy"
+])
+FRENCH_WORDS = frozenset([
+    "le", "la", "les", "un", "une", "des", "et", "ou", "mais", "parce", "que",
+    "comment", "quand", "où", "est", "du", "au", "aux", "avec", "pour", "très", "qu"
+])
+
+# Before a text counts as Spanish or French it needs this many different
+# function words of the language, or function words making up this share of
+# its words; a stray "la la land" in English has neither
+MIN_DISTINCT_FUNCTION_WORDS = 2
+MIN_FUNCTION_WORD_RATIO = 0.3
+
+# Accented letters that point at each language
+SPANISH_MARKS = frozenset("áéíóúñü")
+FRENCH_MARKS = frozenset("éèêçàâîôûùëïœ")
+
+def cjk_language(text):
+    """Get "zh", "ja" or "ko" from the first CJK_WINDOW CJK characters of the text, or None
+
+    Any kana means Japanese, as Chinese and Korean never use it. Otherwise
+    Hangul against Han decides, so Korean quoting hanja stays Korean.
+    """
+    window = ""
+    for match in SCRIPT_PATTERN.finditer(text):
+        window += match.group()
+        if len(window) >= CJK_WINDOW:
+            window = window[:CJK_WINDOW]
+            break
+    if not window:
+        return None
+    if KANA_PATTERN.search(window):
+        return "ja"
+    hangul = len(HANGUL_PATTERN.findall(window))
+    return "ko" if hangul * 2 >= len(window) else "zh"
+
+def function_word_score(words, vocabulary):
+    """Count the words found in a language's function word list, or 0 if too few to tell it from English"""
+    # Set lookups keep the per-word work in C
+    count = sum(map(vocabulary.__contains__, words))
+    if len(vocabulary.intersection(words)) >= MIN_DISTINCT_FUNCTION_WORDS or count >= MIN_FUNCTION_WORD_RATIO * len(words):
+        return count
+    return 0
+
+def latin_scores(text):
+    """Score text without CJK characters against Spanish and French
+
+    Each language scores one point per function word and per accented
+    letter, and only counts when the text has both, as a stray "la" or "é"
+    is common in English.
+    """
+    scores = {"es": 0, "fr": 0}
+    lowered = text.lower()
+    if lowered.isascii():
+        return scores
+    words = WORD_PATTERN.findall(lowered)
+    spanish_words = function_word_score(words, SPANISH_WORDS)
+    french_words = function_word_score(words, FRENCH_WORDS)
+    # str.count keeps the per-letter work in C
+    spanish_marks = sum(map(lowered.count, SPANISH_MARKS))
+    french_marks = sum(map(lowered.count, FRENCH_MARKS))
+    if spanish_words and spanish_marks:
+        scores["es"] = spanish_words + spanish_marks
+    if french_words and french_marks:
+        scores["fr"] = french_words + french_marks
+    return scores
+
+def detect_language(text):
+    """Detect the language of a chat message, defaulting to English
+
+    Any Chinese, Japanese or Korean characters take precedence over Latin
+    words, as CJK messages often contain English names.
+    """
+    language = cjk_language(text)
+    if language:
+        return language
+    scores = latin_scores(text)
+    language = max(scores, key=scores.get)
+    return language if scores[language] else "en"
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+
+from io import BytesIO
+
+from PIL import Image
+
+import heygen_client
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# Size of the chunks downloads are written to disk in
+CHUNK_SIZE = 64 * 1024
+
+# How long a thumbnail is served before its source is revalidated with its ETag (seconds)
+THUMBNAIL_REVALIDATE_SECONDS = float(os.getenv("HEYGEN_THUMBNAIL_REVALIDATE_SECONDS", "86400"))
+
+# Leading bytes of the formats we serve, for when the server sends no useful Content-Type
+MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+)
+
+def sniff_mime_type(head, url, content_type=None):
+    """Work out the MIME type of downloaded content"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type and content_type not in ("application/octet-stream", "binary/octet-stream"):
+        return content_type
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    # WAV and AVI are RIFF containers too, so check the form type as well
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    return mimetypes.guess_type(url.split("?")[0])[0] or "application/octet-stream"
+
+def extension_for(mime_type):
+    """File extension for a MIME type, including the dot"""
+    if mime_type == "image/jpeg":
+        return ".jpg"
+    return mimetypes.guess_extension(mime_type) or ""
+
+class MediaCache:
+    """Content-addressed on-disk cache of downloaded media with an LRU size cap
+
+    Each URL is downloaded once and stored under the SHA-256 of its content,
+    so identical files fetched from different (for example re-signed) URLs
+    share one copy. The least recently used files are evicted once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._load_index()
+
+    def fetch(self, url, headers=None, key=None):
+        """Get (path, mime_type) for a URL, downloading it only if it is not cached
+
+        key defaults to the URL; pass a stable key for URLs that are re-signed.
+        Returns (None, None) if the download fails.
+        """
+        key = key or url
+        entry = self.lookup(key)
+        if entry is not None:
+            return entry["path"], entry["mime_type"]
+
+        entry = self._once(key, lambda: self.lookup(key) or self._download(url, headers, key))
+        if entry is None:
+            return None, None
+        return entry["path"], entry["mime_type"]
+
+    def fetch_thumbnail(self, url, max_size=(320, 320)):
+        """Get (path, mime_type) of a downsized copy of an image
+
+        The thumbnail is keyed by URL and size and remembers the source's ETag.
+        Once THUMBNAIL_REVALIDATE_SECONDS have passed it is revalidated with a
+        conditional request and only rebuilt if the source changed. The full
+        size image is never stored. Returns (None, None) on failure.
+        """
+        key = f"thumbnail:{max_size[0]}x{max_size[1]}:{url}"
+        entry = self.lookup(key)
+        if entry is not None and time.time() - entry.get("checked_at", 0) < THUMBNAIL_REVALIDATE_SECONDS:
+            return entry["path"], entry["mime_type"]
+
+        entry = self._once(key, lambda: self._build_thumbnail(key, url, max_size))
+        if entry is None:
+            return None, None
+        return entry["path"], entry["mime_type"]
+
+    def _once(self, key, load):
+        """Run load() for a key in one thread at a time so others wait and reuse the result"""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = load()
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return entry
+
+    def lookup(self, url):
+        """Get the index entry of a cached URL and mark it as recently used"""
+        with self._lock:
+            entry = self._index["urls"].get(url)
+            if entry is None:
+                return None
+            blob = self._index["blobs"].get(entry["digest"])
+            path = os.path.join(self.directory, entry["digest"] + extension_for(entry["mime_type"]))
+            if blob is None or not os.path.exists(path):
+                del self._index["urls"][url]
+                return None
+            blob["last_used"] = time.time()
+            return dict(entry, path=path)
+
+    def _build_thumbnail(self, key, url, max_size):
+        """Fetch an image, downsize it and store the result under key"""
+        entry = self.lookup(key)
+        if entry is not None and time.time() - entry.get("checked_at", 0) < THUMBNAIL_REVALIDATE_SECONDS:
+            return entry
+
+        headers = {"If-None-Match": entry["etag"]} if entry is not None and entry.get("etag") else None
+        try:
+            response = heygen_client.get(url, headers=headers)
+            if response.status_code == 304 and entry is not None:
+                with self._lock:
+                    if key in self._index["urls"]:
+                        self._index["urls"][key]["checked_at"] = time.time()
+                        self._save_index()
+                return entry
+            if response.status_code != 200:
+                log.warning("Error downloading image", url=url, status=response.status_code)
+                return entry
+
+            image = Image.open(BytesIO(response.content))
+            image.draft("RGB", max_size)
+            image.thumbnail(max_size, Image.LANCZOS)
+            thumbnail = BytesIO()
+            image.convert("RGB").save(thumbnail, format="JPEG", quality=85, optimize=True)
+            return self.store(key, thumbnail.getvalue(), "image/jpeg", {
+                "etag": response.headers.get("ETag"),
+                "checked_at": time.time()
+            })
+        except Exception as e:
+            log.warning("Error creating thumbnail", url=url, error=str(e))
+            return entry
+
+    def store(self, key, data, mime_type, extra=None):
+        """Add content produced locally under a key, returns its index entry"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, digest + extension_for(mime_type))
+        if not os.path.exists(path):
+            # Each thread writes its own temp file, as another may be storing the same content
+            temp_path = os.path.join(self.directory, f"store-{threading.get_ident()}.tmp")
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return self._add(key, digest, mime_type, len(data), extra)
+
+    def fetch_or_store(self, key, produce, mime_type):
+        """Get the path stored under key, storing the bytes produce() returns if it is missing
+
+        Returns None if produce() returns nothing.
+        """
+        def load():
+            entry = self.lookup(key)
+            if entry is None:
+                data = produce()
+                entry = self.store(key, data, mime_type) if data else None
+            return entry
+
+        entry = self.lookup(key) or self._once(key, load)
+        return entry["path"] if entry else None
+
+    def store_file(self, key, source_path, mime_type):
+        """Move a local file into the cache under a key, returns its index entry"""
+        sha = hashlib.sha256()
+        with open(source_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        size = os.path.getsize(source_path)
+        os.replace(source_path, os.path.join(self.directory, digest + extension_for(mime_type)))
+        return self._add(key, digest, mime_type, size)
+
+    def _download(self, url, headers, key=None):
+        """Download a URL into the cache under key, returns its index entry or None"""
+        temp_path = os.path.join(self.directory, f"download-{threading.get_ident()}.tmp")
+        try:
+            response = heygen_client.get(url, headers=headers, stream=True)
+            if response.status_code != 200:
+                log.warning("Error downloading media", url=url, status=response.status_code)
+                return None
+
+            sha = hashlib.sha256()
+            size = 0
+            head = b""
+            with open(temp_path, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if not head:
+                        head = chunk[:16]
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+
+            mime_type = sniff_mime_type(head, url, response.headers.get("Content-Type"))
+            digest = sha.hexdigest()
+            path = os.path.join(self.directory, digest + extension_for(mime_type))
+            os.replace(temp_path, path)
+            return self._add(key or url, digest, mime_type, size, {"etag": response.headers.get("ETag")})
+        except Exception as e:
+            log.warning("Error downloading media", url=url, error=str(e))
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _add(self, url, digest, mime_type, size, extra=None):
+        """Record a stored file in the index and evict old files if over the cap"""
+        with self._lock:
+            self._index["blobs"][digest] = {"size": size, "mime_type": mime_type, "last_used": time.time()}
+            entry = dict(extra or {}, digest=digest, mime_type=mime_type)
+            self._index["urls"][url] = entry
+            self._evict(keep=digest)
+            self._save_index()
+            return dict(entry, path=os.path.join(self.directory, digest + extension_for(mime_type)))
+
+    def _evict(self, keep=None):
+        """Remove least recently used files until the cache fits (caller holds the lock)"""
+        blobs = self._index["blobs"]
+        total = sum(blob["size"] for blob in blobs.values())
+        for digest in sorted(blobs, key=lambda digest: blobs[digest]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            blob = blobs.pop(digest)
+            total -= blob["size"]
+            path = os.path.join(self.directory, digest + extension_for(blob["mime_type"]))
+            if os.path.exists(path):
+                os.remove(path)
+        self._index["urls"] = {
+            url: entry for url, entry in self._index["urls"].items() if entry["digest"] in blobs
+        }
+
+    def _load_index(self):
+        """Load the cache index, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Could not read media cache index", path=self.index_path, error=str(e))
+        return {"urls": {}, "blobs": {}}
+
+    def _save_index(self):
+        """Write the cache index atomically (caller holds the lock)"""
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self.index_path)
@@ -0,0 +1,380 @@
+"""Local stand-in for the HeyGen API, for offline development and load tests
+
+Implements the endpoints the apps use with in-memory state. Jobs finish
+after a tunable duration, every response can be delayed, and a share of
+requests can fail or be rate limited. Rendered videos are data/sample.mp4.
+
+    python mock_heygen.py --port 8700 --latency 0.05 --job-seconds 10
+    HEYGEN_API_BASE_URL=http://127.0.0.1:8700 HEYGEN_UPLOAD_BASE_URL=http://127.0.0.1:8700 \\
+        streamlit run text_to_avatar_speech.py
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+from voice_catalog import DEFAULT_VOICES, LANGUAGE_NAMES
+
+SAMPLE_VIDEO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sample.mp4")
+
+class MockSettings:
+    """Tunable behaviour of the mock server"""
+
+    def __init__(self, latency=0.05, latency_jitter=0.05, job_seconds=10.0, photo_seconds=5.0,
+                 training_seconds=15.0, error_rate=0.0, rate_limit_rate=0.0, job_failure_rate=0.0,
+                 groups=10, avatars_per_group=4, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.job_seconds = job_seconds
+        self.photo_seconds = photo_seconds
+        self.training_seconds = training_seconds
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.job_failure_rate = job_failure_rate
+        self.groups = groups
+        self.avatars_per_group = avatars_per_group
+        self.random = random.Random(seed)
+
+class MockState:
+    """In-memory groups, avatars and jobs"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.groups = []
+        self.avatars = {}
+        self.videos = {}
+        self.generations = {}
+        self.trainings = {}
+        self.assets = {}
+        self.requests = 0
+        now = int(time.time())
+        for number in range(settings.groups):
+            group_id = f"group{number:04d}"
+            self.groups.append({
+                "id": group_id,
+                "name": f"Demo Group {number}",
+                "created_at": now - number * 3600,
+                "num_looks": settings.avatars_per_group,
+                "train_status": "ready",
+                "group_type": "PHOTO"
+            })
+            self.avatars[group_id] = [
+                {
+                    "id": f"{group_id}look{look}",
+                    "name": f"Demo Avatar {number}-{look}",
+                    "gender": "female" if (number + look) % 2 else "male",
+                    "image_url": None
+                }
+                for look in range(settings.avatars_per_group)
+            ]
+
+    def finish_time(self, seconds):
+        """When a job started now finishes, with some jitter"""
+        return time.time() + seconds * self.settings.random.uniform(0.8, 1.2)
+
+    def fails(self):
+        """Whether a finished job should fail"""
+        return self.settings.random.random() < self.settings.job_failure_rate
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """Request handler routing HeyGen API paths to the mock state"""
+
+    state = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base_url(self):
+        return f"http://{self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]}"
+
+    def _handle(self, method):
+        settings = self.state.settings
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with self.state.lock:
+            self.state.requests += 1
+        time.sleep(max(0.0, settings.latency + settings.random.uniform(0, settings.latency_jitter)))
+
+        url = urlparse(self.path)
+        if url.path.startswith("/files/"):
+            return self._serve_file(url.path[len("/files/"):])
+        if not self.headers.get("X-Api-Key"):
+            return self._json(401, {"error": {"code": "unauthorized", "message": "Missing API key"}})
+        if settings.random.random() < settings.rate_limit_rate:
+            return self._json(429, {"error": {"code": "rate_limited", "message": "Too many requests"}}, {"Retry-After": "1"})
+        if settings.random.random() < settings.error_rate:
+            return self._json(500, {"error": {"code": "internal_error", "message": "Injected failure"}})
+
+        for route_method, pattern, handler in ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if match and route_method == method:
+                try:
+                    payload = json.loads(body) if body and self.headers.get("Content-Type", "").startswith("application/json") else body
+                except ValueError:
+                    return self._json(400, {"error": {"code": "bad_request", "message": "Invalid JSON"}})
+                status, data = handler(self, payload, parse_qs(url.query), *match.groups())
+                return self._json(status, data)
+        return self._json(404, {"error": {"code": "not_found", "message": f"No mock for {method} {url.path}"}})
+
+    def _json(self, status, data, headers=None):
+        content = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _serve_file(self, name):
+        if name == "sample.mp4":
+            with open(SAMPLE_VIDEO_PATH, "rb") as f:
+                content = f.read()
+            content_type = "video/mp4"
+        elif name.endswith(".jpg"):
+            # A flat colour per name stands in for avatar previews and generated photos
+            seed = sum(name.encode("utf-8"))
+            image = Image.new("RGB", (512, 512), (seed * 37 % 256, seed * 59 % 256, seed * 83 % 256))
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=80)
+            content = buffer.getvalue()
+            content_type = "image/jpeg"
+        else:
+            return self._json(404, {"error": {"code": "not_found", "message": name}})
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", f'"{name}"')
+        self.end_headers()
+        self.wfile.write(content)
+
+    # Avatar groups
+
+    def list_groups(self, payload, query):
+        with self.state.lock:
+            groups = [dict(group) for group in self.state.groups]
+        return 200, {"error": None, "data": {"avatar_group_list": groups}}
+
+    def list_group_avatars(self, payload, query, group_id):
+        with self.state.lock:
+            avatars = self.state.avatars.get(group_id)
+            training = self.state.trainings.get(group_id)
+        if avatars is None:
+            return 404, {"error": {"code": "not_found", "message": "Group not found"}}
+        if training and time.time() < training["finishes_at"]:
+            avatars = []
+        return 200, {"error": None, "data": {"avatar_list": [
+            dict(avatar, image_url=f"{self.base_url}/files/{avatar['id']}.jpg") for avatar in avatars
+        ]}}
+
+    def create_group(self, payload, query):
+        group_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.groups.insert(0, {
+                "id": group_id,
+                "name": payload.get("name", "Unnamed"),
+                "created_at": int(time.time()),
+                "num_looks": 1,
+                "train_status": "empty",
+                "group_type": "PHOTO"
+            })
+            self.state.avatars[group_id] = [{"id": f"{group_id}look0", "name": payload.get("name", "Unnamed"), "gender": "female"}]
+        return 200, {"error": None, "data": {"group_id": group_id, "id": group_id}}
+
+    def train_group(self, payload, query):
+        group_id = payload.get("group_id")
+        with self.state.lock:
+            if group_id not in self.state.avatars:
+                return 404, {"error": {"code": "not_found", "message": "Group not found"}}
+            self.state.trainings[group_id] = {
+                "finishes_at": self.state.finish_time(self.state.settings.training_seconds),
+                "fails": self.state.fails()
+            }
+        return 200, {"error": None, "data": {"flow_id": uuid.uuid4().hex}}
+
+    def training_status(self, payload, query, group_id):
+        with self.state.lock:
+            training = self.state.trainings.get(group_id)
+        if training is None:
+            return 200, {"error": None, "data": {"status": "empty"}}
+        if time.time() < training["finishes_at"]:
+            return 200, {"error": None, "data": {"status": "pending"}}
+        status = "failed" if training["fails"] else "ready"
+        with self.state.lock:
+            for group in self.state.groups:
+                if group["id"] == group_id:
+                    group["train_status"] = status
+        return 200, {"error": None, "data": {"status": status}}
+
+    # Uploads and photo generation
+
+    def upload_asset(self, payload, query):
+        asset_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.assets[asset_id] = len(payload or b"")
+        return 200, {"code": 100, "data": {"id": asset_id, "url": f"{self.base_url}/files/{asset_id}.jpg"}, "msg": None, "message": None}
+
+    def generate_photo(self, payload, query):
+        generation_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.generations[generation_id] = {
+                "finishes_at": self.state.finish_time(self.state.settings.photo_seconds),
+                "fails": self.state.fails()
+            }
+        return 200, {"error": None, "data": {"generation_id": generation_id}}
+
+    def generation_status(self, payload, query, generation_id):
+        with self.state.lock:
+            generation = self.state.generations.get(generation_id)
+        if generation is None:
+            return 404, {"error": {"code": "not_found", "message": "Generation not found"}}
+        if time.time() < generation["finishes_at"]:
+            return 200, {"error": None, "data": {"id": generation_id, "status": "in_progress", "image_url_list": None, "image_key_list": None}}
+        if generation["fails"]:
+            return 200, {"error": None, "data": {"id": generation_id, "status": "failed", "msg": "Injected failure"}}
+        keys = [f"image/{generation_id}{number}/original" for number in range(4)]
+        return 200, {"error": None, "data": {
+            "id": generation_id,
+            "status": "success",
+            "image_url_list": [f"{self.base_url}/files/{generation_id}{number}.jpg" for number in range(4)],
+            "image_key_list": keys
+        }}
+
+    # Videos
+
+    def _new_video(self):
+        video_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.videos[video_id] = {
+                "finishes_at": self.state.finish_time(self.state.settings.job_seconds),
+                "fails": self.state.fails()
+            }
+        return video_id
+
+    def generate_video(self, payload, query):
+        if not isinstance(payload, dict) or not payload.get("video_inputs"):
+            return 400, {"error": {"code": "invalid_parameter", "message": "video_inputs is required"}}
+        return 200, {"error": None, "data": {"video_id": self._new_video()}}
+
+    def create_video_task(self, payload, query):
+        return 200, {"error": None, "data": {"task_id": self._new_video()}}
+
+    def video_status(self, payload, query, version):
+        video_id = (query.get("video_id") or [None])[0]
+        with self.state.lock:
+            video = self.state.videos.get(video_id)
+        if video is None:
+            return 404, {"error": {"code": "not_found", "message": "Video not found"}}
+        if time.time() < video["finishes_at"]:
+            return 200, {"code": 100, "data": {"id": video_id, "status": "processing", "video_url": None}}
+        if video["fails"]:
+            return 200, {"code": 100, "data": {"id": video_id, "status": "failed", "error": {
+                "code": "injected", "message": "Injected failure", "detail": "Set --job-failure-rate 0 to disable"
+            }}}
+        return 200, {"code": 100, "data": {
+            "id": video_id,
+            "status": "completed",
+            # A query string makes every URL unique, like HeyGen's signed URLs
+            "video_url": f"{self.base_url}/files/sample.mp4?video_id={video_id}"
+        }}
+
+    def list_voices(self, payload, query):
+        voices = [
+            {"voice_id": voice_id, "language": LANGUAGE_NAMES[language], "gender": category.split("_")[0], "name": f"{language} {category}"}
+            for language, categories in DEFAULT_VOICES.items()
+            for category, voice_id in categories.items()
+        ]
+        return 200, {"error": None, "data": {"voices": voices}}
+
+ROUTES = [
+    ("GET", r"/v2/avatar_group\.list", MockRequestHandler.list_groups),
+    ("GET", r"/v2/avatar_group/([^/]+)/avatars", MockRequestHandler.list_group_avatars),
+    ("POST", r"/v2/photo_avatar/avatar_group/create", MockRequestHandler.create_group),
+    ("POST", r"/v2/photo_avatar/train", MockRequestHandler.train_group),
+    ("GET", r"/v2/photo_avatar/train/status/([^/]+)", MockRequestHandler.training_status),
+    ("POST", r"/v1/asset", MockRequestHandler.upload_asset),
+    ("POST", r"/v2/photo_avatar/photo/generate", MockRequestHandler.generate_photo),
+    ("GET", r"/v2/photo_avatar/generation/([^/]+)", MockRequestHandler.generation_status),
+    ("POST", r"/v2/video/generate", MockRequestHandler.generate_video),
+    ("POST", r"/v1/video\.task", MockRequestHandler.create_video_task),
+    ("GET", r"/(v1|v2)/video_status\.get", MockRequestHandler.video_status),
+    ("GET", r"/v2/voices", MockRequestHandler.list_voices),
+]
+
+class MockHeyGenServer:
+    """Mock HeyGen API running on a background thread"""
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.state = MockState(settings or MockSettings())
+        handler = type("Handler", (MockRequestHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        host, port = self.httpd.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-heygen", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the HeyGen API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency", type=float, default=0.05, help="Delay added to every response (seconds)")
+    parser.add_argument("--latency-jitter", type=float, default=0.05, help="Random extra delay of up to this much (seconds)")
+    parser.add_argument("--job-seconds", type=float, default=10, help="How long a video render takes")
+    parser.add_argument("--photo-seconds", type=float, default=5, help="How long a photo generation takes")
+    parser.add_argument("--training-seconds", type=float, default=15, help="How long avatar group training takes")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="Share of requests answered with a 429")
+    parser.add_argument("--job-failure-rate", type=float, default=0, help="Share of jobs that finish as failed")
+    parser.add_argument("--groups", type=int, default=10, help="Avatar groups to start with")
+    parser.add_argument("--avatars-per-group", type=int, default=4)
+    parser.add_argument("--seed", type=int, help="Seed for repeatable latency and failures")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        job_seconds=args.job_seconds,
+        photo_seconds=args.photo_seconds,
+        training_seconds=args.training_seconds,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        job_failure_rate=args.job_failure_rate,
+        groups=args.groups,
+        avatars_per_group=args.avatars_per_group,
+        seed=args.seed
+    )
+    server = MockHeyGenServer(settings, args.host, args.port)
+    print(f"Mock HeyGen API on {server.base_url}")
+    print(f"Use HEYGEN_API_BASE_URL={server.base_url} HEYGEN_UPLOAD_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
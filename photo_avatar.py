@@ -0,0 +1,137 @@
+import os
+
+import heygen_client
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+PHOTO_AVATAR_URL = f"{heygen_client.API_BASE_URL}/v2/photo_avatar"
+
+# Training statuses that end a training job
+TRAINING_DONE_STATUSES = ("ready", "failed", "error")
+
+def get_headers(api_key=None):
+    """Get the headers for photo avatar API requests"""
+    return {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "X-Api-Key": api_key or os.getenv("HEYGEN_API_KEY")
+    }
+
+def image_key_for(asset_id):
+    """Image key of an uploaded photo asset"""
+    return f"image/{asset_id}/original"
+
+def create_avatar_group(name, image_key, generation_id=None, api_key=None):
+    """Create a photo avatar group
+
+    Returns (success, group_id_or_error_message).
+    """
+    try:
+        # Ensure the image_key is properly formatted
+        # For uploaded photos, image_key should be in the format "image/{asset_id}/original"
+        if not image_key.startswith("image/") and not image_key.endswith("/original"):
+            # Fix the format if needed
+            asset_id = image_key.split("/")[-1] if "/" in image_key else image_key
+            image_key = image_key_for(asset_id)
+            log.info("Reformatted image_key", image_key=image_key)
+        
+        # Prepare the payload based on whether this is an AI-generated avatar or uploaded photo
+        payload = {
+            "name": name,
+            "image_key": image_key
+        }
+        
+        # Add generation_id for AI-generated avatars only if it's provided
+        if generation_id:
+            payload["generation_id"] = generation_id
+            
+        log.debug("Creating avatar group", payload=payload)
+        
+        response = heygen_client.post(
+            f"{PHOTO_AVATAR_URL}/avatar_group/create",
+            headers=get_headers(api_key),
+            json=payload
+        )
+        
+        log.response("Avatar group creation response", response, name=name)
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("error") is None:
+                return True, data.get("data", {}).get("group_id")
+            else:
+                log.warning("Avatar group creation failed", name=name, error=data.get("error"))
+                return False, f"Error creating avatar group: {data.get('error')}"
+        else:
+            return False, f"Error creating avatar group: Status code {response.status_code}"
+    except Exception as e:
+        log.exception("Exception in create_avatar_group", name=name)
+        return False, f"An error occurred while creating the avatar group: {str(e)}"
+
+def train_avatar_group(group_id, api_key=None):
+    """Start training an avatar group
+
+    Returns (success, message).
+    """
+    try:
+        payload = {
+            "group_id": group_id
+        }
+        
+        log.info("Starting training", group_id=group_id)
+        
+        response = heygen_client.post(
+            f"{PHOTO_AVATAR_URL}/train",
+            headers=get_headers(api_key),
+            json=payload
+        )
+        
+        log.response("Training response", response, group_id=group_id)
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("error") is None:
+                return True, "Training started successfully"
+            else:
+                log.warning("Training could not start", group_id=group_id, error=data.get("error"))
+                return False, f"Error starting training: {data.get('error')}"
+        else:
+            return False, f"Error starting training: Status code {response.status_code}"
+    except Exception as e:
+        log.exception("Exception in train_avatar_group", group_id=group_id)
+        return False, f"An error occurred while starting the training: {str(e)}"
+
+def check_training_status(group_id, api_key=None):
+    """Check the status of a group training job
+
+    Returns "rate_limited" if HeyGen is still throttling after the client's
+    retries and "error" if the status could not be read.
+    """
+    try:
+        url = f"{PHOTO_AVATAR_URL}/train/status/{group_id}"
+        
+        response = heygen_client.get(
+            url,
+            headers=get_headers(api_key)
+        )
+        
+        # Polled every few seconds per training job, so routine responses are sampled
+        log.response("Training status check response", response, sample=True, group_id=group_id)
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("error") is None:
+                status_data = data.get("data", {})
+                status = status_data.get("status")
+                return status
+            else:
+                log.warning("Training status check failed", group_id=group_id, error=data.get("error"))
+                return "error"
+        elif response.status_code == 429:
+            return "rate_limited"
+        else:
+            return "error"
+    except Exception as e:
+        log.exception("Exception in check_training_status", group_id=group_id)
+        return "error"
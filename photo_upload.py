@@ -0,0 +1,97 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+import heygen_client
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+UPLOAD_URL = f"{heygen_client.UPLOAD_BASE_URL}/v1/asset"
+
+# Photos with a longer side than this are downscaled before upload; HeyGen does
+# not need more for a talking photo (pixels)
+MAX_PHOTO_DIMENSION = int(os.getenv("HEYGEN_MAX_PHOTO_DIMENSION", "2048"))
+
+# JPEG quality used when a downscaled photo is recompressed
+JPEG_QUALITY = int(os.getenv("HEYGEN_JPEG_QUALITY", "90"))
+
+class PreparedPhoto:
+    """A photo decoded once for both the preview and the upload body"""
+
+    def __init__(self, preview, body, content_type, size, resized):
+        self.preview = preview
+        self.body = body
+        self.content_type = content_type
+        self.size = size
+        self.resized = resized
+
+    def open_body(self):
+        """Get the upload body as a file-like object positioned at the start"""
+        self.body.seek(0)
+        return self.body
+
+def prepare_photo(file, content_type=None, max_dimension=None):
+    """Decode a photo once, downscaling it if it is larger than HeyGen needs
+
+    file is any seekable binary file-like object (a Streamlit upload or an
+    open file). Small photos are uploaded unchanged straight from file; large
+    ones are decoded at reduced scale where the format allows it, resized and
+    recompressed into a much smaller in-memory body.
+    """
+    max_dimension = max_dimension or MAX_PHOTO_DIMENSION
+    file.seek(0)
+    image = Image.open(file)
+    original_format = image.format
+    content_type = content_type or Image.MIME.get(original_format, "image/jpeg")
+
+    if max(image.size) <= max_dimension:
+        return PreparedPhoto(image, file, content_type, image.size, False)
+
+    # Let the JPEG decoder skip the detail we are about to throw away
+    image.draft("RGB", (max_dimension, max_dimension))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    body = BytesIO()
+    if image.mode in ("RGBA", "LA", "P") and original_format == "PNG":
+        image.save(body, format="PNG", optimize=True)
+        content_type = "image/png"
+    else:
+        image.convert("RGB").save(body, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        content_type = "image/jpeg"
+    log.info("Downscaled photo", size=list(image.size), bytes=body.tell())
+    body.seek(0)
+    return PreparedPhoto(image, body, content_type, image.size, True)
+
+def upload_asset(body, content_type, api_key=None):
+    """Stream a file-like body to the HeyGen asset upload endpoint
+
+    Returns (success, asset_id, asset_url_or_error_message).
+    """
+    try:
+        headers = {
+            "Content-Type": content_type,
+            "X-Api-Key": api_key or os.getenv("HEYGEN_API_KEY")
+        }
+        # A file-like body is sent in chunks instead of being copied into memory
+        response = heygen_client.post(UPLOAD_URL, headers=headers, data=body, timeout=heygen_client.UPLOAD_TIMEOUT)
+
+        log.response("Upload response", response)
+
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("code") == 100:
+                asset_info = data.get("data", {})
+                asset_id = asset_info.get("id")
+                asset_url = asset_info.get("url")
+                return True, asset_id, asset_url
+            else:
+                log.warning("Upload rejected", code=data.get("code"), error=data.get("message"))
+                return False, None, f"Error uploading asset: {data.get('message')}"
+        else:
+            return False, None, f"Error uploading asset: Status code {response.status_code}"
+    except Exception as e:
+        log.exception("Exception in upload_asset")
+        return False, None, f"An error occurred while uploading the asset: {str(e)}"
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Request priorities; lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+def read_rate(name, rate, burst):
+    """Read a bucket's (rate per second, burst) from HEYGEN_RATE_<NAME>="rate/burst" """
+    value = os.getenv(f"HEYGEN_RATE_{name.upper()}")
+    if not value:
+        return rate, burst
+    rate_text, _, burst_text = value.partition("/")
+    return float(rate_text), float(burst_text or rate_text)
+
+# Sustained requests per second and burst size of each endpoint class
+DEFAULT_RATES = {
+    "list": read_rate("list", 10, 20),
+    "generate": read_rate("generate", 1, 3),
+    "upload": read_rate("upload", 2, 4),
+    "status": read_rate("status", 5, 10),
+}
+
+# Longest Retry-After that is honored; anything longer is capped (seconds)
+MAX_RETRY_AFTER = float(os.getenv("HEYGEN_MAX_RETRY_AFTER", "60"))
+
+_context = threading.local()
+
+def current_priority():
+    """Priority of requests made by the current thread"""
+    return getattr(_context, "priority", INTERACTIVE)
+
+@contextmanager
+def background():
+    """Mark the requests made inside the block as background work that yields to interactive ones"""
+    previous = current_priority()
+    _context.priority = BACKGROUND
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+class TokenBucket:
+    """Token bucket that hands out tokens by priority, then first come first served
+
+    While the bucket is paused after a 429 no tokens are handed out at all.
+    """
+
+    def __init__(self, rate, burst):
+        # A rate of 0 would never refill and a burst below 1 never holds a whole token
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        if burst < 1:
+            raise ValueError(f"Token bucket burst must be at least 1, got {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority=INTERACTIVE):
+        """Wait for a token, returns the seconds spent waiting"""
+        started = time.monotonic()
+        with self._condition:
+            ticket = (priority, next(self._order))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == ticket and now >= self.paused_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - started
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif self._waiters[0] == ticket:
+                        wait = (1 - self.tokens) / self.rate
+                    else:
+                        wait = None
+                    self._condition.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while and start again from an empty bucket"""
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self._condition.notify_all()
+
+    def _refill(self, now):
+        """Add the tokens earned since the last refill (caller holds the lock)"""
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+class RateLimiter:
+    """Per endpoint class token buckets shared by every HeyGen call in the process"""
+
+    def __init__(self, rates=None):
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in (rates or DEFAULT_RATES).items()}
+
+    def acquire(self, endpoint, priority=None):
+        """Wait for a token of an endpoint class, returns the seconds spent waiting"""
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            return 0.0
+        return bucket.acquire(current_priority() if priority is None else priority)
+
+    def pause(self, endpoint, seconds):
+        """Hold back an endpoint class, as asked by a Retry-After header"""
+        bucket = self.buckets.get(endpoint)
+        if bucket is not None:
+            bucket.pause(min(seconds, MAX_RETRY_AFTER))
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait from a Retry-After header, either delay seconds or an HTTP date"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return default
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import heygen_video
+import video_join
+from app_logging import get_logger
+from media_cache import MediaCache
+
+log = get_logger(__name__)
+
+# File mapping render requests to their finished videos
+DEFAULT_RENDER_CACHE_PATH = os.getenv("HEYGEN_RENDER_CACHE_PATH", os.path.join(".cache", "render_cache.json"))
+
+# Local copies of rendered videos, so a hit keeps working after the signed URL expires
+DEFAULT_VIDEO_CACHE_DIR = os.getenv("HEYGEN_VIDEO_CACHE_DIR", os.path.join(".cache", "videos"))
+DEFAULT_VIDEO_CACHE_MAX_BYTES = int(os.getenv("HEYGEN_VIDEO_CACHE_MB", "1024")) * 1024 * 1024
+
+# How long a HeyGen video URL is trusted after the render finished. The signed
+# URLs expire after about a week, so stay a little under that (seconds).
+DEFAULT_URL_TTL = float(os.getenv("HEYGEN_RENDER_URL_TTL", str(6 * 24 * 3600)))
+
+def normalize_text(text):
+    """Normalize a script so that differences that do not change the speech share a cache entry"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def render_key(character_id, text, voice_id):
+    """Hash of the normalized render payload (character, voice, text, background, dimension)"""
+    payload = heygen_video.build_video_payload(character_id, normalize_text(text), voice_id)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class RenderCache:
+    """Persistent cache of finished renders
+
+    Maps render_key() to the video URL HeyGen returned and keeps a local copy
+    of the MP4 in a size-capped MediaCache. get() prefers the local copy and
+    only returns the URL while it is younger than url_ttl, so a repeated
+    prompt is served without a new render. The local copies also back the
+    chat history replay, which outlives the signed URLs.
+    """
+
+    def __init__(self, path=None, video_dir=None, max_bytes=None, url_ttl=None):
+        self.path = path or DEFAULT_RENDER_CACHE_PATH
+        self.url_ttl = DEFAULT_URL_TTL if url_ttl is None else url_ttl
+        self.videos = MediaCache(video_dir or DEFAULT_VIDEO_CACHE_DIR, max_bytes or DEFAULT_VIDEO_CACHE_MAX_BYTES)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-cache")
+        self._lock = threading.Lock()
+        self._no_poster = set()
+        self._entries = self._load()
+
+    def get(self, key):
+        """Get {"video_url", "video_path"} for a cached render, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        local = self.videos.lookup(f"render:{key}")
+        url_fresh = entry["video_url"] is not None and time.time() - entry["stored_at"] < self.url_ttl
+        if local is None and not url_fresh:
+            with self._lock:
+                self._entries.pop(key, None)
+                self._save()
+            return None
+        return {
+            "video_url": entry["video_url"] if url_fresh else None,
+            "video_path": local["path"] if local else None
+        }
+
+    def put(self, key, video_url):
+        """Remember a finished render and copy its video locally in the background"""
+        with self._lock:
+            self._entries[key] = {"video_url": video_url, "stored_at": time.time()}
+            self._save()
+        self._executor.submit(self.mirror, key, video_url)
+
+    def mirror(self, key, video_url):
+        """Get the path of the local copy of a render, downloading it if needed
+
+        Waits for a copy already being downloaded instead of starting another.
+        Returns None if the download fails.
+        """
+        path, _ = self.videos.fetch(video_url, None, f"render:{key}")
+        return path
+
+    def put_file(self, key, path):
+        """Remember a render that only exists as a local file, such as a joined video, moving it into the store"""
+        entry = self.videos.store_file(f"render:{key}", path, "video/mp4")
+        with self._lock:
+            self._entries[key] = {"video_url": None, "stored_at": time.time()}
+            self._save()
+        return entry["path"]
+
+    def local_path(self, key):
+        """Get the path of the local copy of a render, or None if it has not been mirrored"""
+        entry = self.videos.lookup(f"render:{key}")
+        return entry["path"] if entry else None
+
+    def poster_path(self, key):
+        """Get the path of a poster frame for a mirrored render, extracting it on first use"""
+        video_path = self.local_path(key)
+        if video_path is None or key in self._no_poster:
+            return None
+        path = self.videos.fetch_or_store(f"poster:{key}", lambda: video_join.extract_poster(video_path), "image/jpeg")
+        if path is None:
+            # Do not run ffmpeg again on every rerun for a video it cannot read
+            self._no_poster.add(key)
+        return path
+
+    def _load(self):
+        """Load the cache file, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Could not read render cache", path=self.path, error=str(e))
+        return {}
+
+    def _save(self):
+        """Write the cache file atomically (caller holds the lock)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.path)
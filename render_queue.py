@@ -0,0 +1,345 @@
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import heygen_video
+import rate_limiter
+import video_join
+from app_logging import get_logger
+from fan_out import fan_out
+from render_cache import render_key
+
+log = get_logger(__name__)
+
+# File the queue is persisted to so renders survive a server restart
+DEFAULT_STATE_PATH = os.getenv("HEYGEN_RENDER_QUEUE_PATH", os.path.join(".cache", "render_queue.json"))
+
+# Where videos joined from segments are written
+DEFAULT_VIDEO_DIR = os.getenv("HEYGEN_RENDER_VIDEO_DIR", os.path.join(".cache", "renders"))
+
+# Number of renders being submitted at the same time
+DEFAULT_SUBMIT_WORKERS = int(os.getenv("HEYGEN_RENDER_SUBMIT_WORKERS", "2"))
+
+# Renders still running after this long are given up on (seconds)
+RENDER_TIMEOUT = float(os.getenv("HEYGEN_RENDER_TIMEOUT", "1800"))
+
+# Finished renders are dropped from the queue file after this long (seconds)
+RENDER_RETENTION = float(os.getenv("HEYGEN_RENDER_RETENTION", "86400"))
+
+# Changes to the queue are batched and written at most this often (seconds)
+SAVE_INTERVAL = float(os.getenv("HEYGEN_RENDER_QUEUE_SAVE_INTERVAL", "1"))
+
+FINISHED_STATUSES = ("completed", "failed", "timeout")
+
+class RenderQueue:
+    """Persistent queue of talking photo renders
+
+    enqueue() returns a job ID straight away; a worker pool submits the render
+    and the job tracker polls it until it finishes. enqueue_segments() renders
+    the parts of a long script in parallel and joins them into one local MP4.
+    Each job is a plain dict so it can be written to the queue file as JSON.
+    With a render_cache, a render that was done before completes straight
+    away from the cache and finished renders are added to it. The queue file
+    is written by a background thread, outside the lock, and only after a
+    job actually changed.
+    """
+
+    def __init__(self, tracker, state_path=None, submit_workers=None, api_key=None, video_dir=None, render_cache=None):
+        self.tracker = tracker
+        self.render_cache = render_cache
+        self.state_path = state_path or DEFAULT_STATE_PATH
+        self.video_dir = video_dir or DEFAULT_VIDEO_DIR
+        self.api_key = api_key
+        self._executor = ThreadPoolExecutor(
+            max_workers=submit_workers or DEFAULT_SUBMIT_WORKERS,
+            thread_name_prefix="render-submit"
+        )
+        # Joins download and run ffmpeg, so they get their own worker to keep submits moving
+        self._join_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-join")
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._save_requested = threading.Event()
+        self._write_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run_writer, name="render-queue-writer", daemon=True)
+        self._writer.start()
+        # Write out the last changes when the process exits
+        atexit.register(self.flush)
+        self._load()
+
+    def enqueue(self, character_id, text, voice_id):
+        """Queue a render and return its job ID"""
+        job = self._new_job(character_id, text, voice_id)
+        cached = self._cached(job)
+        if cached:
+            job.update(cached, status="completed")
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._save()
+        if not cached:
+            self._executor.submit(self._submit, job["job_id"])
+        return job["job_id"]
+
+    def enqueue_segments(self, character_id, text, voice_id, segments):
+        """Queue a long script as segments rendered in parallel, returns the job ID of the joined video
+
+        Every segment is submitted straight away, so the wait is set by the
+        slowest segment rather than the length of the script. Once all of them
+        have completed they are downloaded and joined; if any fails the job
+        fails.
+        """
+        job = self._new_job(character_id, text, voice_id, status="rendering", segments_done=0, video_path=None)
+        cached = self._cached(job)
+        if cached:
+            job.update(cached, status="completed", segment_ids=[])
+            with self._lock:
+                self._jobs[job["job_id"]] = job
+                self._save()
+            return job["job_id"]
+
+        children = [
+            self._new_job(character_id, segment, voice_id, parent_id=job["job_id"])
+            for segment in segments
+        ]
+        job["segment_ids"] = [child["job_id"] for child in children]
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            for child in children:
+                self._jobs[child["job_id"]] = child
+            self._save()
+        for child in children:
+            self._executor.submit(self._submit, child["job_id"])
+        return job["job_id"]
+
+    def _new_job(self, character_id, text, voice_id, **extra):
+        """Build the dict of a new job"""
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "character_id": character_id,
+            "text": text,
+            "voice_id": voice_id,
+            "status": "queued",
+            "video_id": None,
+            "video_url": None,
+            "error": None,
+            "cache_key": render_key(character_id, text, voice_id),
+            "created_at": now,
+            "updated_at": now
+        }
+        job.update(extra)
+        return job
+
+    def _cached(self, job):
+        """Get the cached video_url and video_path for a job's render, or None"""
+        if self.render_cache is None:
+            return None
+        cached = self.render_cache.get(job["cache_key"])
+        if cached:
+            log.info("Render cache hit", job_id=job["job_id"])
+        return cached
+
+    def get(self, job_id):
+        """Get a copy of a job, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def in_flight(self):
+        """Get copies of all jobs that have not finished, oldest first"""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job["status"] not in FINISHED_STATUSES]
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    def _update(self, job_id, **changes):
+        """Apply changes to a job and persist the queue if anything changed
+
+        Tracker polls that leave a job as it was do not touch the queue file.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or all(job.get(key) == value for key, value in changes.items()):
+                return
+            job.update(changes, updated_at=time.time())
+            if job.get("parent_id") and job["status"] in FINISHED_STATUSES:
+                self._check_segments(job["parent_id"])
+            self._save()
+
+    def _check_segments(self, job_id):
+        """Fail a segmented job or start its join once its segments have finished (caller holds the lock)"""
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != "rendering":
+            return
+        done = 0
+        for number, segment_id in enumerate(job["segment_ids"], 1):
+            segment = self._jobs.get(segment_id)
+            if segment is None or segment["status"] in ("failed", "timeout"):
+                error = segment["error"] if segment else "Segment was lost"
+                job.update(status="failed", error=f"Segment {number} of {len(job['segment_ids'])}: {error}", updated_at=time.time())
+                return
+            if segment["status"] == "completed":
+                done += 1
+        job.update(segments_done=done, updated_at=time.time())
+        if done == len(job["segment_ids"]):
+            job["status"] = "joining"
+            self._join_executor.submit(self._join, job_id)
+
+    def _join(self, job_id):
+        """Download the segments of a job and join them into one video"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        directory = os.path.join(self.video_dir, job_id)
+        try:
+            segments = [self.get(segment_id) for segment_id in job["segment_ids"]]
+            os.makedirs(directory, exist_ok=True)
+            # Segments served from the render cache may only have a local copy
+            paths = [
+                segment.get("video_path") or os.path.join(directory, f"{number:03d}.mp4")
+                for number, segment in enumerate(segments)
+            ]
+            downloads = fan_out(
+                lambda item: video_join.download_video(*item),
+                [(segment["video_url"], path) for segment, path in zip(segments, paths) if not segment.get("video_path")]
+            )
+            for download in downloads:
+                if not download or not download[0]:
+                    self._update(job_id, status="failed", error=download[1] if download else "Error downloading segment")
+                    return
+
+            output_path = os.path.join(self.video_dir, f"{job_id}.mp4")
+            success, error = video_join.concat_videos(paths, output_path)
+            if not success:
+                self._update(job_id, status="failed", error=error)
+                return
+            if self.render_cache is not None:
+                # The joined video is cached under the whole script so it is served like any render
+                output_path = self.render_cache.put_file(job["cache_key"], output_path)
+            self._update(job_id, status="completed", video_path=output_path)
+        except Exception as e:
+            log.exception("Error joining segments", job_id=job_id)
+            self._update(job_id, status="failed", error=f"Error joining the video parts: {str(e)}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _submit(self, job_id):
+        """Submit a queued render and start tracking it"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        cached = self._cached(job)
+        if cached:
+            self._update(job_id, status="completed", **cached)
+            return
+        self._update(job_id, status="submitting")
+        with rate_limiter.background():
+            success, result = heygen_video.submit_video(
+                job["character_id"], job["text"], job["voice_id"], api_key=self.api_key
+            )
+        if not success:
+            self._update(job_id, status="failed", error=result)
+            return
+        self._update(job_id, status="pending", video_id=result)
+        self._track(job_id, result, job["created_at"], job["cache_key"])
+
+    def _track(self, job_id, video_id, created_at, cache_key=None):
+        """Hand a submitted render to the job tracker"""
+        def on_update(tracker_job):
+            result = tracker_job.result or {}
+            if tracker_job.status == "completed" and result.get("video_url") and self.render_cache and cache_key:
+                self.render_cache.put(cache_key, result["video_url"])
+            if tracker_job.status == "timeout":
+                self._update(job_id, status="timeout", error="Video taking longer than expected.")
+            else:
+                self._update(
+                    job_id,
+                    status=tracker_job.status or "pending",
+                    video_url=result.get("video_url"),
+                    error=result.get("error")
+                )
+
+        self.tracker.track(
+            video_id,
+            lambda video_id: heygen_video.check_video_status(video_id, api_key=self.api_key),
+            done_statuses={"completed", "failed"},
+            timeout=RENDER_TIMEOUT,
+            on_update=on_update,
+            created_at=created_at
+        )
+
+    def _load(self):
+        """Load the queue file and resume unfinished renders"""
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                jobs = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.warning("Could not read render queue", path=self.state_path, error=str(e))
+            return
+
+        cutoff = time.time() - RENDER_RETENTION
+        with self._lock:
+            for job in jobs:
+                if job["status"] in FINISHED_STATUSES and job["updated_at"] < cutoff:
+                    continue
+                self._jobs[job["job_id"]] = job
+                if job["status"] == "queued":
+                    self._executor.submit(self._submit, job["job_id"])
+                elif job["status"] == "submitting":
+                    # The submit may or may not have reached HeyGen; do not risk a second render
+                    job.update(status="failed", error="Interrupted while submitting, please try again.")
+                elif job["status"] not in FINISHED_STATUSES and job["video_id"]:
+                    self._track(job["job_id"], job["video_id"], job["created_at"], job.get("cache_key"))
+            # Segments may have finished while the server was down
+            for job in list(self._jobs.values()):
+                if job["status"] == "rendering":
+                    self._check_segments(job["job_id"])
+                elif job["status"] == "joining":
+                    self._join_executor.submit(self._join, job["job_id"])
+            self._save()
+
+    def _save(self):
+        """Have the writer thread persist the queue soon (caller holds the lock)"""
+        self._save_requested.set()
+
+    def _run_writer(self):
+        """Write the queue file in the background, batching the changes of SAVE_INTERVAL"""
+        while True:
+            self._save_requested.wait()
+            time.sleep(SAVE_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                log.exception("Could not write render queue", path=self.state_path)
+                # Try again on the next pass rather than never saving again
+                self._save_requested.set()
+
+    def flush(self):
+        """Write the queue file atomically now if it has unsaved changes
+
+        Only copying the jobs happens under the lock; the file is written
+        outside it. Finished jobs past RENDER_RETENTION are dropped first.
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self._save_requested.is_set():
+                    return
+                self._save_requested.clear()
+                cutoff = time.time() - RENDER_RETENTION
+                for job_id, job in list(self._jobs.items()):
+                    if job["status"] in FINISHED_STATUSES and job["updated_at"] < cutoff:
+                        del self._jobs[job_id]
+                jobs = [dict(job) for job in self._jobs.values()]
+
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(jobs, f, ensure_ascii=False)
+            os.replace(temp_path, self.state_path)
@@ -0,0 +1,104 @@
+"""Regression tests for avatar_pipeline against the local mock API
+
+Run from the repository root:
+
+    python -m unittest discover tests
+"""
+import os
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def free_port():
+    """Get a port nothing is listening on"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Local modules read their settings on import, so point them at the mock first
+MOCK_PORT = free_port()
+os.environ.update(
+    HEYGEN_API_BASE_URL=f"http://127.0.0.1:{MOCK_PORT}",
+    HEYGEN_UPLOAD_BASE_URL=f"http://127.0.0.1:{MOCK_PORT}",
+    HEYGEN_API_KEY="test-key",
+    HEYGEN_MIN_POLL_INTERVAL="0.1",
+    HEYGEN_MAX_POLL_INTERVAL="0.2",
+    HEYGEN_LOG_LEVEL="ERROR"
+)
+
+from PIL import Image
+
+import avatar_pipeline
+from avatar_pipeline import AvatarPipeline
+from job_tracker import JobTracker
+from mock_heygen import MockHeyGenServer, MockSettings
+
+def wait_until(condition, timeout=20):
+    """Wait for condition() to hold, returns whether it did"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+class RetryFailedTrainingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # One server for every test, as the shared HTTP session keeps its connections open
+        cls.settings = MockSettings(latency=0, latency_jitter=0)
+        cls.server = MockHeyGenServer(cls.settings, port=MOCK_PORT).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.settings.training_seconds = 0.2
+        self.settings.job_failure_rate = 1.0
+        self.directory = tempfile.TemporaryDirectory()
+        self.photo = os.path.join(self.directory.name, "photo.jpg")
+        Image.new("RGB", (64, 64), "red").save(self.photo, "JPEG")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_retried_training_finishes(self):
+        pipeline = AvatarPipeline(JobTracker(), state_path=os.path.join(self.directory.name, "state.json"))
+        pipeline.add([("Test", self.photo)])
+        self.assertTrue(wait_until(pipeline.finished))
+        item = pipeline.items()[0]
+        self.assertEqual((item["status"], item["error"]), ("failed", "Training failed"))
+
+        self.settings.job_failure_rate = 0.0
+        self.assertEqual(pipeline.retry_failed(), 1)
+        self.assertTrue(wait_until(pipeline.finished))
+        self.assertEqual(pipeline.items()[0]["status"], "ready")
+
+    def test_retried_timeout_polls_without_training_again(self):
+        self.settings.job_failure_rate = 0.0
+        self.settings.training_seconds = 1.0
+        pipeline = AvatarPipeline(JobTracker(), state_path=os.path.join(self.directory.name, "state.json"))
+        timeout = avatar_pipeline.TRAINING_TIMEOUT
+        avatar_pipeline.TRAINING_TIMEOUT = 0.2
+        try:
+            pipeline.add([("Test", self.photo)])
+            self.assertTrue(wait_until(pipeline.finished))
+        finally:
+            avatar_pipeline.TRAINING_TIMEOUT = timeout
+        item = pipeline.items()[0]
+        self.assertEqual(item["status"], "failed")
+        training = self.server.state.trainings[item["group_id"]]
+
+        pipeline.retry_failed()
+        self.assertTrue(wait_until(pipeline.finished))
+        self.assertEqual(pipeline.items()[0]["status"], "ready")
+        # The group was polled until done, not sent for training a second time
+        self.assertIs(self.server.state.trainings[item["group_id"]], training)
+
+if __name__ == "__main__":
+    unittest.main()
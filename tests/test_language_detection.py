@@ -0,0 +1,30 @@
+"""Tests for language_detection
+
+Run from the repository root:
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language_detection import CJK_WINDOW, detect_language
+
+class CjkLanguageTest(unittest.TestCase):
+    def test_japanese_after_long_kanji_heading(self):
+        heading = "東京都港区六本木一丁目" * 10
+        self.assertEqual(detect_language(heading + "の会議室で開催します。"), "ja")
+
+    def test_chinese(self):
+        self.assertEqual(detect_language("敏捷的棕色狐狸跳过了懒狗，乐队继续演奏。"), "zh")
+
+    def test_korean_with_hanja(self):
+        self.assertEqual(detect_language("대한민국(大韓民國)은 동아시아에 있는 나라이다."), "ko")
+
+    def test_kana_past_window_is_not_counted(self):
+        self.assertEqual(detect_language("中" * CJK_WINDOW + "です"), "zh")
+
+if __name__ == "__main__":
+    unittest.main()
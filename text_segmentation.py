@@ -0,0 +1,81 @@
+import os
+import re
+
+# Scripts longer than this are split into segments rendered in parallel (characters)
+LONG_TEXT_MIN_CHARS = int(os.getenv("HEYGEN_LONG_TEXT_MIN_CHARS", "400"))
+
+# Target segment length. CJK characters carry about a syllable each, so CJK
+# segments hold fewer characters for the same speaking time.
+SEGMENT_MAX_CHARS = int(os.getenv("HEYGEN_SEGMENT_MAX_CHARS", "300"))
+CJK_SEGMENT_MAX_CHARS = int(os.getenv("HEYGEN_CJK_SEGMENT_MAX_CHARS", "120"))
+
+CJK_LANGUAGES = ("zh", "ja", "ko")
+
+# A sentence ends at CJK terminal punctuation (no space needed after it), or at
+# Latin terminal punctuation followed by whitespace. Closing quotes and
+# brackets stay with the sentence they close.
+SENTENCE_END = re.compile(
+    "[。！？．…]+[」』”’）】]*\\s*"
+    "|[.!?…]+[\"'”’)\\]]*\\s+"
+)
+
+# Places to break a sentence that is too long on its own
+CLAUSE_END = re.compile("[,;:，、；：]\\s*|\\s+")
+
+# Abbreviations whose full stop does not end a sentence
+ABBREVIATIONS = {
+    "en": frozenset(["mr", "mrs", "ms", "dr", "prof", "st", "vs", "etc", "e.g", "i.e", "jr", "sr", "no"]),
+    "es": frozenset(["sr", "sra", "srta", "dr", "dra", "ud", "uds", "etc", "pág", "no"]),
+    "fr": frozenset(["m", "mme", "mlle", "dr", "pr", "etc", "p.ex", "cf", "no"]),
+}
+
+def split_sentences(text, language="en"):
+    """Split text into sentences, keeping each sentence's punctuation"""
+    abbreviations = ABBREVIATIONS.get(language, frozenset())
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.group().startswith("."):
+            words = text[start:match.start()].split()
+            if words and words[-1].lower() in abbreviations:
+                continue
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    sentences.append(text[start:])
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+def split_long_sentence(sentence, max_chars):
+    """Break a sentence longer than max_chars at clause or word boundaries"""
+    pieces = []
+    while len(sentence) > max_chars:
+        breaks = [match.end() for match in CLAUSE_END.finditer(sentence, 0, max_chars)]
+        cut = breaks[-1] if breaks else max_chars
+        pieces.append(sentence[:cut].strip())
+        sentence = sentence[cut:]
+    pieces.append(sentence.strip())
+    return [piece for piece in pieces if piece]
+
+def split_text(text, language="en", max_chars=None):
+    """Split a script into segments of whole sentences of up to max_chars each
+
+    Short scripts come back as a single segment.
+    """
+    if max_chars is None:
+        max_chars = CJK_SEGMENT_MAX_CHARS if language in CJK_LANGUAGES else SEGMENT_MAX_CHARS
+    if len(text) < LONG_TEXT_MIN_CHARS:
+        return [text]
+
+    # CJK text is joined without spaces
+    separator = "" if language in CJK_LANGUAGES else " "
+    segments = []
+    current = ""
+    for sentence in split_sentences(text, language):
+        for piece in split_long_sentence(sentence, max_chars):
+            if current and len(current) + len(separator) + len(piece) > max_chars:
+                segments.append(current)
+                current = piece
+            else:
+                current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments or [text]
@@ -1,25 +1,26 @@
 import streamlit as st
-import requests
 import json
 import time
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+# Local modules read their settings from the environment, so import them after .env is loaded
+import heygen_video
+import video_join
+from api_metrics import display_rows, get_metrics, start_metrics_server
+from job_tracker import JobTracker
+from language_detection import detect_language
+from render_cache import RenderCache
+from render_queue import FINISHED_STATUSES, RenderQueue
+from text_segmentation import split_text
+from video_server import start_video_server
+from voice_catalog import AGES, GENDERS, LANGUAGE_NAMES, load_voice_catalog
+
 # Streamlit app setup
 st.set_page_config(page_title="Text to Avatar Speech", page_icon="🗣️")
 st.title("Text to Avatar Speech")
 
-# Language code to full name mapping
-LANGUAGE_NAMES = {
-    "en": "English",
-    "zh": "Chinese",
-    "es": "Spanish",
-    "fr": "French", 
-    "ja": "Japanese",
-    "ko": "Korean"
-}
-
 # Hardcoded password (not secure for production use)
 PASSWORD = "chatbot"
 
@@ -43,10 +44,43 @@ st.write("The avatar will repeat exactly what you type using the selected voice.
 # Debug mode toggle in sidebar
 st.sidebar.subheader("Advanced Settings")
 debug_mode = st.sidebar.checkbox("Enable Debug Mode")
+long_text_mode = st.sidebar.checkbox(
+    "Long-text mode",
+    value=True,
+    help="Split long scripts at sentence boundaries and render the parts in parallel"
+)
+if long_text_mode and not video_join.ffmpeg_available():
+    st.sidebar.caption("ffmpeg is not installed, so long scripts are rendered as one video.")
 
 # API Keys
 HEYGEN_API_KEY = os.getenv("HEYGEN_API_KEY")
-HEYGEN_API_URL = "https://api.heygen.com/v2"
+
+# How often the chat re-reads the status of in-flight videos (seconds)
+RENDER_REFRESH_SECONDS = 3
+
+# Port of this app's /metrics endpoint, separate from the avatar dashboard's; 0 turns it off
+CHAT_METRICS_PORT = int(os.getenv("HEYGEN_CHAT_METRICS_PORT", "8604"))
+
+@st.cache_resource
+def get_metrics_server():
+    """Get the Prometheus-style /metrics endpoint, or None if it could not start"""
+    return start_metrics_server(port=CHAT_METRICS_PORT)
+
+get_metrics_server()
+
+@st.cache_resource
+def get_voice_catalog():
+    """Get the voice catalog, loaded once per server process"""
+    return load_voice_catalog(HEYGEN_API_KEY)
+
+# Every combination the voice settings can produce needs a voice
+voice_catalog = get_voice_catalog()
+missing_voices = voice_catalog.missing()
+if missing_voices:
+    st.error("No voice is configured for: " + ", ".join(
+        f"{LANGUAGE_NAMES[language]} {gender} {age}" for language, gender, age in missing_voices
+    ))
+    st.stop()
 
 # Initialize session state for chat history
 if "messages" not in st.session_state:
@@ -88,7 +122,7 @@ selected_language = st.sidebar.selectbox(
 # Gender selection
 selected_gender = st.sidebar.radio(
     "Select Gender",
-    options=["female", "male"],
+    options=list(GENDERS),
     index=0,  # Default to female
     horizontal=True
 )
@@ -96,7 +130,7 @@ selected_gender = st.sidebar.radio(
 # Age selection
 selected_age = st.sidebar.radio(
     "Select Age",
-    options=["young", "mature"],
+    options=list(AGES),
     index=0,  # Default to young
     horizontal=True
 )
@@ -109,354 +143,177 @@ selected_character = st.sidebar.selectbox(
     format_func=lambda x: talking_photo_options[x]["display_name"]
 )
 
+if debug_mode:
+    # Calls made by every session of this server, slowest endpoint first
+    st.sidebar.subheader("HeyGen API Metrics")
+    if get_metrics_server():
+        st.sidebar.caption(f"Also at {get_metrics_server().url}")
+    st.sidebar.dataframe(
+        [
+            {key: row[key] for key in ("Endpoint", "Requests", "Errors", "p95 ms", "Throttled s")}
+            for row in display_rows(get_metrics().snapshot())
+        ],
+        hide_index=True
+    )
+
 # Display current voice selection
-voice_category = f"{selected_gender}_{selected_age}"
 st.sidebar.info(f"**Current Voice Selection:**\n- Language: {LANGUAGE_NAMES[selected_language]}\n- Type: {selected_gender.title()} {selected_age.title()}")
 
-# Function to detect language of text with more detailed detection
-def detect_language(text):
-    # Check for Chinese characters
-    if any('\u4e00' <= char <= '\u9fff' for char in text):
-        return "zh"
-    
-    # Check for Japanese characters (Hiragana, Katakana)
-    if any('\u3040' <= char <= '\u30ff' for char in text):
-        return "ja"
-    
-    # Check for Korean characters
-    if any('\uac00' <= char <= '\ud7a3' for char in text):
-        return "ko"
-    
-    # Check for common Spanish words
-    spanish_words = ["el", "la", "los", "las", "un", "una", "y", "o", "pero", "porque", "como", "qué", "cuándo", "dónde"]
-    words = text.lower().split()
-    if any(word in spanish_words for word in words) and any('á' in text or 'é' in text or 'í' in text or 'ó' in text or 'ú' in text or 'ñ' in text):
-        return "es"
-    
-    # Check for common French words
-    french_words = ["le", "la", "les", "un", "une", "des", "et", "ou", "mais", "parce", "que", "comment", "quand", "où"]
-    if any(word in french_words for word in words) and any('é' in text or 'è' in text or 'ê' in text or 'ç' in text or 'à' in text):
-        return "fr"
-    
-    # Default to English
-    return "en"
-
-def generate_heygen_video(character_id, text, selected_voice_id):
-    # Create progress tracking elements
-    progress_placeholder = st.empty()
-    progress_bar = st.progress(0)
-    progress_placeholder.info("Preparing to generate video...")
-    
-    headers = {
-        "Content-Type": "application/json",
-        "X-Api-Key": HEYGEN_API_KEY
-    }
-    
-    # Voice ID mapping by language and gender
-    voice_map = {
-        # English voices
-        "en": {
-            "female_young": "1bd001e7e50f421d891986aad5158bc8",  # Daisy (young female)
-            "female_mature": "2d5b0e6cf36f460aa7fc47e3eee4ba54",  # Alice (mature female)
-            "male_young": "e95166076b8c458abcd636a5f59b0e81",    # Daniel (young male)
-            "male_mature": "11a8b3b5ea33441294501cb8fc45f3da",   # Matthew (mature male)
-        },
-        # Chinese voices
-        "zh": {
-            "female_young": "00c8fd447ad7480ab1785825978a2215",  # Using correct voice ID for female_young
-            "female_mature": "5b3f164f63ee46b5bcb28e21e7f5427e",  # Luli (mature female)
-            "male_young": "7a72eedf88374b65a2a3f873bd471d73",    # Xiaotong (young male)
-            "male_mature": "e1adcef3cf42401b84b0fa5ea8b14b77",   # Zhigang (mature male)
-        },
-        # Spanish voices
-        "es": {
-            "female_young": "41a37ffe4f3742cd94fc9f0263c7d697",  # Sofia (young female)
-            "female_mature": "2fb39c2a1df94fbab396a85f72b5e48b",  # Isabella (mature female)
-            "male_young": "2d2d443a7bbb4663942c19f3ad5b025d",    # Miguel (young male)
-            "male_mature": "e3f58532df7d4df79c1c7176a7fb3cd1",   # Javier (mature male)
-        },
-        # Japanese voices
-        "ja": {
-            "female_young": "3984e56f97204e98b51d26bef43e2c8f",  # Aiko (young female)
-            "female_mature": "21cad0c84c5543bba5fd4fb31abd0078",  # Yumi (mature female)
-            "male_young": "a2ad6ae9c3b64b47ba2423cefba33c9a",    # Takashi (young male)
-            "male_mature": "b08c4f76ceb54e3295337bb78f0dc0c4",   # Kenji (mature male)
-        },
-        # Korean voices
-        "ko": {
-            "female_young": "aea35fae3a4640dbb107e23c71260b99",  # Ji-woo (young female)
-            "female_mature": "5f4d8a8e33a44b8c814cb0b6e2197a2d",  # Seo-yeon (mature female)
-            "male_young": "9dd9a7c8c4e44c6d8f1282a0f93d1acf",    # Min-jun (young male)
-            "male_mature": "faf3431b55cf4a268a5f6f62f4063764",   # Joon-ho (mature male)
-        },
-        # French voices
-        "fr": {
-            "female_young": "ab14736db6e24d07b49c4bd75bee21d2",  # Chloé (young female)
-            "female_mature": "1e6a91f6ea764eba9fc56a209c71f169",  # Sophie (mature female)
-            "male_young": "74dc44e4df9e40ee8c4bb241391b27bb",    # Lucas (young male)
-            "male_mature": "9fae597cc45b4fc39056a583a2ac18d9",   # Pierre (mature male)
-        }
-    }
-    
-    progress_placeholder.info(f"Using voice ID: {selected_voice_id}")
-    
-    # Log the voice selection if debug mode is enabled
-    if debug_mode:
-        progress_placeholder.info(f"Debug Info: Voice ID: {selected_voice_id}")
-    
-    # Talking photo payload structure
-    character_config = {
-        "type": "talking_photo",
-        "talking_photo_id": character_id
-    }
-    
-    # Updated payload structure for v2 API
-    payload = {
-        "video_inputs": [
-            {
-                "character": character_config,
-                "voice": {
-                    "type": "text",
-                    "input_text": text,
-                    "voice_id": selected_voice_id
-                },
-                "background": {
-                    "type": "color",
-                    "value": "#ffffff"  # White background
-                }
-            }
-        ],
-        "dimension": {
-            "width": 720,  # Lower resolution for free tier
-            "height": 406   # 16:9 aspect ratio
-        },
-        "test": True,  # Enable test mode for the free tier
-        "title": "Text to Avatar Speech"
-    }
-    
-    # Debug logging if enabled
+@st.cache_resource
+def get_job_tracker():
+    """Get the background job tracker shared by every session on this server"""
+    return JobTracker()
+
+@st.cache_resource
+def get_render_cache():
+    """Get the render cache and local video mirror shared by every session on this server"""
+    return RenderCache()
+
+@st.cache_resource
+def get_render_queue():
+    """Get the render queue shared by every session on this server"""
+    return RenderQueue(get_job_tracker(), api_key=HEYGEN_API_KEY, render_cache=get_render_cache())
+
+@st.cache_resource
+def get_video_server():
+    """Get the range-serving HTTP server for mirrored videos, or None if it is not configured"""
+    return start_video_server(get_render_cache().videos.directory)
+
+def generate_heygen_video(character_id, text, selected_voice_id, language="en"):
+    """Queue a talking photo render and return its job ID
+
+    In long-text mode a long script is split into sentence-aligned segments
+    that render in parallel and are joined into one video.
+    """
+    segments = [text]
+    if long_text_mode and video_join.ffmpeg_available():
+        segments = split_text(text, language)
+
+    # Log the voice selection and payload if debug mode is enabled
     if debug_mode:
+        st.sidebar.info(f"Debug Info: Voice ID: {selected_voice_id}")
         st.sidebar.subheader("API Request Debug")
+        payload = heygen_video.build_video_payload(character_id, text, selected_voice_id)
         st.sidebar.code(json.dumps(payload, indent=2), language="json")
+        if len(segments) > 1:
+            st.sidebar.info(f"Debug Info: Split into {len(segments)} segments of {[len(segment) for segment in segments]} characters")
     
-    try:
-        # Try v2 API first
-        progress_placeholder.info("Sending request to HeyGen API...")
-        response = requests.post(f"{HEYGEN_API_URL}/video/generate", 
-                                headers=headers, 
-                                data=json.dumps(payload))
-        
-        # If v2 fails, try v1 endpoint
-        if response.status_code != 200:
-            progress_placeholder.info("Trying alternative API endpoint...")
-            # Log the error if debug mode is enabled
-            if debug_mode:
-                try:
-                    error_json = response.json()
-                    st.sidebar.warning("V2 API Error Response:")
-                    st.sidebar.code(json.dumps(error_json, indent=2), language="json")
-                except:
-                    st.sidebar.warning(f"V2 API Error: {response.text}")
-            
-            # Create v1 payload for talking photo
-            v1_payload = {
-                "talking_photo_id": character_id,
-                "voice_type": "text",
-                "voice_input": text,
-                "voice_id": selected_voice_id,
-                "background": "#ffffff",
-                "test": True,
-                "title": "Text to Avatar Speech"
-            }
-            
-            # Log the v1 payload if debug mode is enabled
-            if debug_mode:
-                st.sidebar.info("Trying V1 API with payload:")
-                st.sidebar.code(json.dumps(v1_payload, indent=2), language="json")
-                
-            # Make the v1 API call with proper headers and using json parameter
-            headers = {
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "X-Api-Key": HEYGEN_API_KEY
-            }
-            response = requests.post(
-                "https://api.heygen.com/v1/video.task", 
-                headers=headers, 
-                json=v1_payload  # Use json parameter instead of data
-            )
-            
-        if response.status_code != 200:
-            # Handle error response properly
-            error_message = "Unknown error"
-            try:
-                # Try to parse the error JSON
-                error_json = response.json()
-                if "error" in error_json and error_json["error"]:
-                    if isinstance(error_json["error"], dict) and "message" in error_json["error"]:
-                        error_message = f"Error: {error_json['error']['message']}"
-                        if "detail" in error_json["error"]:
-                            error_message += f" - {error_json['error']['detail']}"
-                    else:
-                        error_message = f"Error: {error_json['error']}"
-                elif "message" in error_json:
-                    error_message = f"Error: {error_json['message']}"
-            except:
-                # If we can't parse JSON, use the raw text
-                error_message = f"Error creating video (HTTP {response.status_code}): {response.text}"
-            
-            st.error(error_message)
-            if debug_mode:
-                st.sidebar.error("API Error Details:")
-                st.sidebar.code(response.text, language="json")
-            return None
-        
-        # Handle different response formats between v1 and v2
-        response_json = response.json()
-        
-        # v1 API returns data with task_id, v2 returns data with video_id
-        if "task_id" in response_json.get("data", {}):
-            video_id = response_json.get("data", {}).get("task_id")
-        else:
-            video_id = response_json.get("data", {}).get("video_id")
-            
-        if not video_id:
-            st.error("Failed to get video ID")
-            return None
-            
-        # Log the video ID for debugging
-        progress_placeholder.info(f"Video ID: {video_id}")
-        
-        # Check video status and wait for completion
-        status = "pending"
-        attempt_count = 0
-        max_attempts = 200  # Increased to 10 minutes (3 sec × 200)
-        
-        with st.spinner(""):
-            while status in ["pending", "processing", "waiting"]:
-                # Update progress info
-                progress_percent = min(90, attempt_count * 0.45)  # Slower progress to reflect longer wait
-                progress_bar.progress(int(progress_percent))
-                progress_placeholder.info(f"Generating video: {progress_percent:.0f}% complete (this may take 5-10 minutes)")
-                
-                time.sleep(3)  # Check every 3 seconds
-                attempt_count += 1
-                
-                # Modified status check for consistent endpoint handling
-                try:
-                    # First try v1 endpoint - most reliable for status checks
-                    status_url = f"https://api.heygen.com/v1/video_status.get?video_id={video_id}"
-                    status_response = requests.get(status_url, headers=headers)
-                    
-                    if status_response.status_code == 200:
-                        status_data = status_response.json().get("data", {})
-                        status = status_data.get("status")
-                        
-                        # Show more detailed status info if debug mode is enabled
-                        if debug_mode:
-                            st.sidebar.info(f"Status check response:")
-                            st.sidebar.code(json.dumps(status_response.json(), indent=2), language="json")
-                        
-                        progress_placeholder.info(f"Generating video: {progress_percent:.0f}% complete - Status: {status} (attempt {attempt_count}/{max_attempts})")
-                        
-                        if status == "completed":
-                            video_url = status_data.get("video_url")
-                            progress_bar.progress(100)
-                            progress_placeholder.success("Video generation complete!")
-                            return video_url
-                        elif status == "failed":
-                            error_details = status_data.get("error", {})
-                            if isinstance(error_details, dict):
-                                error_message = error_details.get("message", "Unknown error")
-                                error_detail = error_details.get("detail", "")
-                                error_code = error_details.get("code", "")
-                                error_text = f"Video generation failed: {error_message}"
-                                if error_detail:
-                                    error_text += f". {error_detail}"
-                                if error_code:
-                                    error_text += f" (Code: {error_code})"
-                            else:
-                                error_text = f"Video generation failed: {error_details}"
-                            
-                            progress_placeholder.error(error_text)
-                            if debug_mode:
-                                st.sidebar.error("Error details:")
-                                st.sidebar.code(json.dumps(error_details, indent=2), language="json")
-                            return None
-                    else:
-                        # Try v2 endpoint as fallback
-                        status_url = f"https://api.heygen.com/v2/video_status.get?video_id={video_id}"
-                        status_response = requests.get(status_url, headers=headers)
-                        
-                        if status_response.status_code == 200:
-                            try:
-                                status_data = status_response.json().get("data", {})
-                                status = status_data.get("status")
-                                
-                                if status == "completed":
-                                    video_url = status_data.get("video_url")
-                                    progress_bar.progress(100)
-                                    progress_placeholder.success("Video generation complete!")
-                                    return video_url
-                                elif status == "failed":
-                                    error_details = status_data.get("error", {})
-                                    progress_placeholder.error(f"Video generation failed: {error_details}")
-                                    return None
-                            except Exception as parse_error:
-                                progress_placeholder.warning(f"Could not parse V2 status response: {parse_error}")
-                except Exception as e:
-                    # If we can't connect, don't fail - just continue checking
-                    progress_placeholder.info(f"Waiting for video processing... (attempt {attempt_count}/{max_attempts})")
-            
-            # Continue checking even if we reach max attempts
-            if attempt_count >= max_attempts:
-                progress_placeholder.info("Still waiting for video generation... (It can take up to 15 minutes)")
-                
-                # Check status again
-                try:
-                    status_url = f"https://api.heygen.com/v1/video_status.get?video_id={video_id}"
-                    status_response = requests.get(status_url, headers=headers)
-                    
-                    if status_response.status_code == 200:
-                        status_data = status_response.json().get("data", {})
-                        status = status_data.get("status")
-                        
-                        # If video is still processing, reset counter to keep checking
-                        if status in ["pending", "processing", "waiting"]:
-                            attempt_count = 0  # Reset counter to keep checking
-                            max_attempts = 200  # Another 10 minutes
-                        
-                        # If completed, return the URL
-                        if status == "completed":
-                            video_url = status_data.get("video_url")
-                            progress_bar.progress(100)
-                            progress_placeholder.success("Video generation complete!")
-                            return video_url
-                except:
-                    # If error, just log it
-                    pass
-                
-                # If we still can't get the video
-                progress_placeholder.warning("Video taking longer than expected.")
-                return None
-                    
-        return None
-    except Exception as e:
-        st.error(f"Error with API: {e}")
-        return None
+    if len(segments) > 1:
+        return get_render_queue().enqueue_segments(character_id, text, selected_voice_id, segments)
+    return get_render_queue().enqueue(character_id, text, selected_voice_id)
+
+def awaiting_video(message):
+    """Check whether an assistant message has a render whose outcome it has not picked up yet"""
+    return bool(message.get("job_id")) and not message.get("video_url") and not message.get("render_error")
+
+def is_rendering(message):
+    """Check whether an assistant message is still waiting for its video"""
+    if not awaiting_video(message):
+        return False
+    job = get_render_queue().get(message["job_id"])
+    return job is not None and job["status"] not in FINISHED_STATUSES
+
+def show_render_status(message):
+    """Show the live render status of an assistant message, picking up its video once done"""
+    job = get_render_queue().get(message["job_id"])
+    if job is None:
+        message["render_error"] = "Video generation was lost, please try again."
+    elif job["status"] == "completed":
+        # Videos joined from segments only exist as a local file
+        message["video_url"] = job["video_url"] or job.get("video_path")
+        message["video_key"] = job["cache_key"]
+        play_message_video(message)
+        return
+    elif job["status"] in FINISHED_STATUSES:
+        message["render_error"] = job["error"] or "Unknown error"
+    elif job["status"] == "rendering":
+        elapsed = time.time() - job["created_at"]
+        st.info(f"Generating avatar video in parts... {job['segments_done']} of {len(job['segment_ids'])} done ({elapsed / 60:.0f} min elapsed)")
+    elif job["status"] == "joining":
+        st.info("Joining the video parts...")
+    else:
+        elapsed = time.time() - job["created_at"]
+        st.info(f"Generating avatar video... Status: {job['status']} ({elapsed / 60:.0f} min elapsed, this may take 5-10 minutes)")
+        if debug_mode and job["video_id"]:
+            st.caption(f"Video ID: {job['video_id']}")
+
+def get_replay_source(message):
+    """Get what a message's video is played from, preferring the local mirror over the remote URL
+
+    The mirror is played through the video server when it has a public URL,
+    otherwise through Streamlit from the file itself.
+    """
+    local_path = get_render_cache().local_path(message["video_key"]) if message.get("video_key") else None
+    if local_path is None:
+        return message["video_url"]
+    server = get_video_server()
+    return server.url_for(local_path) if server else local_path
+
+def play_message_video(message):
+    """Switch a message from its poster to the player, returning the others to their posters
+
+    The source is fixed here so a later rerun does not reload a playing video
+    once its local copy appears.
+    """
+    for other in st.session_state.messages:
+        other.pop("playing", None)
+    message["playing"] = True
+    message["play_source"] = get_replay_source(message)
+
+def show_message_video(message, index):
+    """Show the player of a played video, or its poster frame and a play button
+
+    Past videos only get a player once played, so a long history does not
+    make every browser fetch every video on each rerun.
+    """
+    if message.get("playing"):
+        st.video(message["play_source"])
+        return
+    
+    poster_path = get_render_cache().poster_path(message["video_key"]) if message.get("video_key") else None
+    if poster_path:
+        server = get_video_server()
+        st.image(server.url_for(poster_path) if server else poster_path, use_container_width=True)
+    if st.button("▶ Play video", key=f"play_video_{index}"):
+        play_message_video(message)
+        st.rerun(scope="fragment")
 
 # Chat interface
 user_input = st.chat_input("Type your message here...")
 
-# Display chat history
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        if message["role"] == "user":
-            st.write(message["content"])
-        else:
-            if "video_url" in message and message["video_url"]:
-                st.video(message["video_url"])
-            st.write(message["content"])
+# Display chat history, refreshing it while any video is still rendering
+rendering_at_start = any(is_rendering(message) for message in st.session_state.messages)
+
+@st.fragment(run_every=RENDER_REFRESH_SECONDS if rendering_at_start else None)
+def show_chat_history():
+    """Show the chat history with the live status of in-flight videos"""
+    rendering = [message for message in st.session_state.messages if is_rendering(message)]
+    if rendering:
+        st.caption(f"🎬 {len(rendering)} video(s) rendering")
+    
+    for index, message in enumerate(st.session_state.messages):
+        with st.chat_message(message["role"]):
+            if message["role"] == "user":
+                st.write(message["content"])
+            else:
+                if awaiting_video(message):
+                    show_render_status(message)
+                if "video_url" in message and message["video_url"]:
+                    show_message_video(message, index)
+                elif message.get("render_error"):
+                    st.error(
+                        f"{message['render_error']} Possible reasons: "
+                        f"1) The voice may not support the text. "
+                        f"2) API rate limit exceeded. "
+                        f"3) Service unavailable."
+                    )
+                st.write(message["content"])
+    
+    # Once the last render finishes, rerun the whole page to stop refreshing
+    if rendering_at_start and not rendering:
+        st.rerun()
+
+show_chat_history()
 
 # Process new user input
 if user_input:
@@ -488,81 +345,22 @@ if user_input:
         # The response is just the user input (repeat what they said)
         response_text = user_input
         
-        # Create assistant message container first
-        assistant_container = st.chat_message("assistant")
-        assistant_container.write(response_text)
-        
-        # Show video generation status
-        video_status = assistant_container.empty()
-        language_name = LANGUAGE_NAMES[selected_language]
-        video_status.info(f"Generating avatar video in {language_name}... (please wait 5-10 minutes)")
-        
         # Get the voice ID for the selected language, gender, and age
-        voice_map = {
-            "en": {
-                "female_young": "1bd001e7e50f421d891986aad5158bc8",
-                "female_mature": "2d5b0e6cf36f460aa7fc47e3eee4ba54",
-                "male_young": "e95166076b8c458abcd636a5f59b0e81",
-                "male_mature": "11a8b3b5ea33441294501cb8fc45f3da",
-            },
-            "zh": {
-                "female_young": "00c8fd447ad7480ab1785825978a2215",
-                "female_mature": "7c2e216ee89a488b9796f16067baa189",
-                "male_young": "961546a1be64458caa1386ff63dd5d5f",
-                "male_mature": "422dbf6b037648b69f663cd33b47007b",
-            },
-            "es": {
-                "female_young": "41a37ffe4f3742cd94fc9f0263c7d697",
-                "female_mature": "2fb39c2a1df94fbab396a85f72b5e48b",
-                "male_young": "2d2d443a7bbb4663942c19f3ad5b025d",
-                "male_mature": "e3f58532df7d4df79c1c7176a7fb3cd1",
-            },
-            "ja": {
-                "female_young": "3984e56f97204e98b51d26bef43e2c8f",
-                "female_mature": "21cad0c84c5543bba5fd4fb31abd0078",
-                "male_young": "a2ad6ae9c3b64b47ba2423cefba33c9a",
-                "male_mature": "b08c4f76ceb54e3295337bb78f0dc0c4",
-            },
-            "ko": {
-                "female_young": "aea35fae3a4640dbb107e23c71260b99",
-                "female_mature": "5f4d8a8e33a44b8c814cb0b6e2197a2d",
-                "male_young": "9dd9a7c8c4e44c6d8f1282a0f93d1acf",
-                "male_mature": "faf3431b55cf4a268a5f6f62f4063764",
-            },
-            "fr": {
-                "female_young": "ab14736db6e24d07b49c4bd75bee21d2",
-                "female_mature": "1e6a91f6ea764eba9fc56a209c71f169",
-                "male_young": "74dc44e4df9e40ee8c4bb241391b27bb",
-                "male_mature": "9fae597cc45b4fc39056a583a2ac18d9",
-            }
-        }
-        
-        # Get the voice ID based on user selection
-        voice_id = voice_map[selected_language][voice_category]
+        voice_id = voice_catalog.voice_id(selected_language, selected_gender, selected_age)
         
-        # Generate video with the user input using selected voice
-        video_url = generate_heygen_video(
+        # Queue the video with the user input using selected voice
+        job_id = generate_heygen_video(
             selected_character,
             response_text,
-            voice_id
+            voice_id,
+            selected_language
         )
         
-        # Update the response with the video
-        if video_url:
-            video_status.empty()
-            assistant_container.video(video_url)
-        else:
-            # Show error message
-            video_status.error(
-                f"Video generation failed. Possible reasons: "
-                f"1) The voice may not support the text. "
-                f"2) API rate limit exceeded. "
-                f"3) Service unavailable."
-            )
-        
-        # Store in session state
+        # Store in session state; the chat history shows the render's live status
         st.session_state.messages.append({
             "role": "assistant", 
             "content": response_text,
-            "video_url": video_url if video_url else None
-        })
\ No newline at end of file
+            "video_url": None,
+            "job_id": job_id
+        })
+        st.rerun()
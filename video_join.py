@@ -0,0 +1,89 @@
+import os
+import shutil
+import subprocess
+
+import heygen_client
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# Size of the chunks segment downloads are written to disk in
+CHUNK_SIZE = 256 * 1024
+
+# Longest a local ffmpeg join may take (seconds)
+JOIN_TIMEOUT = float(os.getenv("HEYGEN_JOIN_TIMEOUT", "300"))
+
+# Where in a video its poster frame is taken from (seconds)
+POSTER_OFFSET = 0.5
+
+def ffmpeg_available():
+    """Check whether ffmpeg is installed for joining segments and extracting posters"""
+    return shutil.which("ffmpeg") is not None
+
+def download_video(url, path):
+    """Stream a video to a local file, returns (success, error_message)"""
+    temp_path = f"{path}.tmp"
+    try:
+        response = heygen_client.get(url, stream=True)
+        if response.status_code != 200:
+            return False, f"Error downloading segment: Status code {response.status_code}"
+        with open(temp_path, "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(temp_path, path)
+        return True, None
+    except Exception as e:
+        return False, f"Error downloading segment: {str(e)}"
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def concat_videos(paths, output_path):
+    """Join MP4 files end to end with ffmpeg's concat demuxer
+
+    The segments are rendered with identical settings, so the streams are
+    copied without re-encoding. Returns (success, error_message).
+    """
+    list_path = f"{output_path}.txt"
+    temp_path = f"{output_path}.tmp.mp4"
+    try:
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        result = subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", "-movflags", "+faststart", temp_path],
+            capture_output=True,
+            text=True,
+            timeout=JOIN_TIMEOUT
+        )
+        if result.returncode != 0:
+            return False, f"Error joining segments: {result.stderr.strip()}"
+        os.replace(temp_path, output_path)
+        return True, None
+    except Exception as e:
+        return False, f"Error joining segments: {str(e)}"
+    finally:
+        for path in (list_path, temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def extract_poster(video_path, width=480):
+    """Grab a frame near the start of a video as JPEG bytes, or None if ffmpeg cannot"""
+    if not ffmpeg_available():
+        return None
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-ss", str(POSTER_OFFSET), "-i", video_path,
+             "-frames:v", "1", "-vf", f"scale={width}:-2", "-f", "image2", "-c:v", "mjpeg", "pipe:1"],
+            capture_output=True,
+            timeout=30
+        )
+        if result.returncode != 0 or not result.stdout:
+            log.warning("Error extracting poster", path=video_path, error=result.stderr.decode(errors="replace").strip())
+            return None
+        return result.stdout
+    except Exception as e:
+        log.warning("Error extracting poster", path=video_path, error=str(e))
+        return None
@@ -0,0 +1,135 @@
+import mimetypes
+import mmap
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# Address the local video server listens on; port 0 turns it off
+VIDEO_SERVER_HOST = os.getenv("HEYGEN_VIDEO_SERVER_HOST", "127.0.0.1")
+VIDEO_SERVER_PORT = int(os.getenv("HEYGEN_VIDEO_SERVER_PORT", "8602"))
+
+# Base URL browsers reach the video server at, such as a path the app's HTTPS
+# proxy forwards to it. The server only starts when this is set: a loopback URL
+# does not work for browsers on other machines, and an http:// URL is blocked
+# on pages served over HTTPS.
+VIDEO_SERVER_PUBLIC_URL = os.getenv("HEYGEN_VIDEO_SERVER_PUBLIC_URL", "")
+
+# Size of the slices a response is written in
+WRITE_CHUNK_SIZE = 256 * 1024
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+# Names of the media files MediaCache stores: the SHA-256 of the content and a
+# media extension. The index and partly written .tmp files never match.
+SERVED_NAME_PATTERN = re.compile(r"[0-9a-f]{64}\.(?:mp4|webm|mov|jpg|png|gif|webp)")
+
+def parse_range(header, size):
+    """Turn a Range header into an inclusive (start, end), None for the whole file, or False if unsatisfiable"""
+    match = RANGE_PATTERN.match(header or "")
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # A suffix range asks for the last N bytes
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return False
+    return start, end
+
+class VideoRequestHandler(BaseHTTPRequestHandler):
+    """Serve files from one directory with HTTP range support
+
+    Files are memory-mapped, so concurrent and seeking players share the page
+    cache instead of each reading the file into memory. Only media files
+    directly inside the directory are served, never the cache index.
+    """
+
+    directory = None
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        name = os.path.basename(self.path.split("?")[0])
+        path = os.path.join(self.directory, name)
+        if not SERVED_NAME_PATTERN.fullmatch(name) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        byte_range = parse_range(self.headers.get("Range"), size)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return
+        start, end = byte_range or (0, size - 1)
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", mimetypes.guess_type(name)[0] or "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        # Files are named by their content hash, so they never change
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+        if not send_body or size == 0:
+            return
+
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(start, end + 1, WRITE_CHUNK_SIZE):
+                        self.wfile.write(view[offset:min(offset + WRITE_CHUNK_SIZE, end + 1)])
+                finally:
+                    view.release()
+        except (BrokenPipeError, ConnectionResetError):
+            # Players routinely drop a connection when the user seeks
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class VideoServer:
+    """Background HTTP server replaying locally mirrored videos"""
+
+    def __init__(self, directory, host=None, port=None, public_url=None):
+        handler = type("Handler", (VideoRequestHandler,), {"directory": os.path.abspath(directory)})
+        self.httpd = ThreadingHTTPServer((host or VIDEO_SERVER_HOST, VIDEO_SERVER_PORT if port is None else port), handler)
+        self.httpd.daemon_threads = True
+        host, port = self.httpd.server_address[:2]
+        self.public_url = (public_url or VIDEO_SERVER_PUBLIC_URL or f"http://{host}:{port}").rstrip("/")
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="video-server", daemon=True)
+        self._thread.start()
+
+    def url_for(self, path):
+        """Get the URL a browser can play a file in the served directory from"""
+        return f"{self.public_url}/{os.path.basename(path)}"
+
+def start_video_server(directory, host=None, port=None, public_url=None):
+    """Start a VideoServer, returns None if it is turned off, has no public URL or the port is taken"""
+    port = VIDEO_SERVER_PORT if port is None else port
+    public_url = public_url or VIDEO_SERVER_PUBLIC_URL
+    if not port or not public_url:
+        return None
+    try:
+        return VideoServer(directory, host, port, public_url)
+    except OSError as e:
+        log.warning("Could not start the video server", port=port, error=str(e))
+        return None
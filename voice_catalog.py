@@ -0,0 +1,166 @@
+import json
+import os
+import time
+
+import heygen_client
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+VOICES_URL = f"{heygen_client.API_BASE_URL}/v2/voices"
+
+# Language code to full name mapping; HeyGen's voice list uses the same names
+LANGUAGE_NAMES = {
+    "en": "English",
+    "zh": "Chinese",
+    "es": "Spanish",
+    "fr": "French",
+    "ja": "Japanese",
+    "ko": "Korean"
+}
+
+GENDERS = ("female", "male")
+AGES = ("young", "mature")
+
+# Voice ID for each language and "<gender>_<age>" category
+DEFAULT_VOICES = {
+    "en": {
+        "female_young": "1bd001e7e50f421d891986aad5158bc8",
+        "female_mature": "2d5b0e6cf36f460aa7fc47e3eee4ba54",
+        "male_young": "e95166076b8c458abcd636a5f59b0e81",
+        "male_mature": "11a8b3b5ea33441294501cb8fc45f3da",
+    },
+    "zh": {
+        "female_young": "00c8fd447ad7480ab1785825978a2215",
+        "female_mature": "7c2e216ee89a488b9796f16067baa189",
+        "male_young": "961546a1be64458caa1386ff63dd5d5f",
+        "male_mature": "422dbf6b037648b69f663cd33b47007b",
+    },
+    "es": {
+        "female_young": "41a37ffe4f3742cd94fc9f0263c7d697",
+        "female_mature": "2fb39c2a1df94fbab396a85f72b5e48b",
+        "male_young": "2d2d443a7bbb4663942c19f3ad5b025d",
+        "male_mature": "e3f58532df7d4df79c1c7176a7fb3cd1",
+    },
+    "ja": {
+        "female_young": "3984e56f97204e98b51d26bef43e2c8f",
+        "female_mature": "21cad0c84c5543bba5fd4fb31abd0078",
+        "male_young": "a2ad6ae9c3b64b47ba2423cefba33c9a",
+        "male_mature": "b08c4f76ceb54e3295337bb78f0dc0c4",
+    },
+    "ko": {
+        "female_young": "aea35fae3a4640dbb107e23c71260b99",
+        "female_mature": "5f4d8a8e33a44b8c814cb0b6e2197a2d",
+        "male_young": "9dd9a7c8c4e44c6d8f1282a0f93d1acf",
+        "male_mature": "faf3431b55cf4a268a5f6f62f4063764",
+    },
+    "fr": {
+        "female_young": "ab14736db6e24d07b49c4bd75bee21d2",
+        "female_mature": "1e6a91f6ea764eba9fc56a209c71f169",
+        "male_young": "74dc44e4df9e40ee8c4bb241391b27bb",
+        "male_mature": "9fae597cc45b4fc39056a583a2ac18d9",
+    }
+}
+
+# Check the voice IDs against HeyGen's voice list at startup
+SYNC_VOICES = os.getenv("HEYGEN_SYNC_VOICES", "false").lower() in ("1", "true", "yes")
+
+# Where the synced voice list is kept, and how long it is trusted (seconds)
+VOICE_CACHE_PATH = os.getenv("HEYGEN_VOICE_CACHE_PATH", os.path.join(".cache", "voices.json"))
+VOICE_CACHE_TTL = float(os.getenv("HEYGEN_VOICE_CACHE_TTL", "86400"))
+
+class VoiceCatalog:
+    """Voice IDs indexed by (language, gender, age)"""
+
+    def __init__(self, voices=None):
+        voices = voices or DEFAULT_VOICES
+        self.index = {}
+        for language, categories in voices.items():
+            for category, voice_id in categories.items():
+                gender, age = category.split("_", 1)
+                self.index[(language, gender, age)] = voice_id
+
+    def voice_id(self, language, gender, age):
+        """Get the voice ID for a sidebar selection, or None if there is none"""
+        return self.index.get((language, gender, age))
+
+    def missing(self, languages=None, genders=GENDERS, ages=AGES):
+        """Get every (language, gender, age) combination the sidebar can produce that has no voice"""
+        return [
+            (language, gender, age)
+            for language in languages or LANGUAGE_NAMES
+            for gender in genders
+            for age in ages
+            if not self.index.get((language, gender, age))
+        ]
+
+    def sync(self, available):
+        """Replace voices that are not in HeyGen's voice list
+
+        available is the list from list_voices(). A voice that is gone is
+        replaced by an unused voice with the same language and gender, or
+        dropped if there is none so missing() reports it.
+        """
+        available_ids = {voice.get("voice_id") for voice in available}
+        used = set(self.index.values())
+        for (language, gender, age), voice_id in list(self.index.items()):
+            if voice_id in available_ids:
+                continue
+            replacement = next((
+                voice["voice_id"] for voice in available
+                if voice.get("language") == LANGUAGE_NAMES.get(language)
+                and (voice.get("gender") or "").lower() == gender
+                and voice["voice_id"] not in used
+            ), None)
+            log.warning("Voice is no longer available", voice_id=voice_id, language=language, gender=gender, age=age, replacement=replacement)
+            if replacement:
+                self.index[(language, gender, age)] = replacement
+                used.add(replacement)
+            else:
+                del self.index[(language, gender, age)]
+
+def list_voices(api_key=None):
+    """Get HeyGen's voice list, from the on-disk cache while it is fresh
+
+    Returns (success, voices_or_error_message).
+    """
+    try:
+        if time.time() - os.path.getmtime(VOICE_CACHE_PATH) < VOICE_CACHE_TTL:
+            with open(VOICE_CACHE_PATH, encoding="utf-8") as f:
+                return True, json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning("Could not read voice cache", path=VOICE_CACHE_PATH, error=str(e))
+
+    try:
+        headers = {
+            "Accept": "application/json",
+            "X-Api-Key": api_key or os.getenv("HEYGEN_API_KEY")
+        }
+        response = heygen_client.get(VOICES_URL, headers=headers)
+        if response.status_code != 200:
+            return False, f"Error listing voices: Status code {response.status_code}"
+        voices = (response.json().get("data") or {}).get("voices") or []
+
+        directory = os.path.dirname(VOICE_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{VOICE_CACHE_PATH}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(voices, f, ensure_ascii=False)
+        os.replace(temp_path, VOICE_CACHE_PATH)
+        return True, voices
+    except Exception as e:
+        return False, f"An error occurred while listing voices: {str(e)}"
+
+def load_voice_catalog(api_key=None, sync=None):
+    """Build the voice catalog, checking it against HeyGen's voice list if sync is on"""
+    catalog = VoiceCatalog()
+    if SYNC_VOICES if sync is None else sync:
+        success, voices = list_voices(api_key)
+        if success and voices:
+            catalog.sync(voices)
+        elif not success:
+            log.warning("Using the built-in voices", error=voices)
+    return catalog